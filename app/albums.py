@@ -0,0 +1,159 @@
+# app/albums.py
+# Сборка альбомов (сообщений с общим media_group_id) из отдельных апдейтов.
+# Альбом считается собранным, когда пришло ALBUM_MAX_ITEMS частей (больше Telegram
+# не допускает) или ALBUM_IDLE_SECONDS не было новых частей.
+#
+# RedisAlbumCollector — части складываются в Redis, поэтому собираются, даже если
+# попали на разные реплики (webhook за балансировщиком); финализирует альбом ровно
+# одна реплика (SET NX). MemoryAlbumCollector — для одного процесса, с блокировкой
+# на пользователя вместо одной глобальной.
+import os
+import time
+import asyncio
+import logging
+import weakref
+from typing import Awaitable, Callable
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+ALBUM_IDLE_SECONDS = float(os.getenv("ALBUM_IDLE_SECONDS", "1.0"))
+ALBUM_MAX_ITEMS = 10
+ALBUM_KEY_TTL = 120  # секунды; страховка от мусора, если финализация не случилась
+
+# (chat_id, user_id, отсортированные message_id) — вызывается один раз на альбом
+OnAlbum = Callable[[int, int, list[int]], Awaitable[None]]
+
+def _observe(parts: int, latency: float):
+    # задержка сборки: от первой части до финализации
+    metrics.ALBUM_AGGREGATION.observe(latency)
+    logger.info(f"album: {parts} part(s) collected in {latency:.2f}s")
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+# KEYS: ids, meta, done; ARGV: message_id, chat_id, user_id, now_ms, ttl. Возвращает число частей.
+_ADD_LUA = """
+redis.call('RPUSH', KEYS[1], ARGV[1])
+redis.call('HSETNX', KEYS[2], 'chat_id', ARGV[2])
+redis.call('HSETNX', KEYS[2], 'user_id', ARGV[3])
+redis.call('HSETNX', KEYS[2], 'first_ms', ARGV[4])
+redis.call('HSET', KEYS[2], 'last_ms', ARGV[4])
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+redis.call('EXPIRE', KEYS[2], ARGV[5])
+return redis.call('LLEN', KEYS[1])
+"""
+
+# KEYS: ids, meta, done; ARGV: now_ms, idle_ms, force, ttl.
+# {-1} — уже финализирован; {0, ждать_мс} — ещё рано; {1, chat, user, first_ms, ids...} — забрали.
+_TAKE_LUA = """
+if redis.call('EXISTS', KEYS[3]) == 1 then return {-1} end
+local last = tonumber(redis.call('HGET', KEYS[2], 'last_ms') or '0')
+local wait = last + tonumber(ARGV[2]) - tonumber(ARGV[1])
+if ARGV[3] ~= '1' and wait > 0 then return {0, wait} end
+redis.call('SET', KEYS[3], '1', 'EX', ARGV[4])
+local meta = redis.call('HMGET', KEYS[2], 'chat_id', 'user_id', 'first_ms')
+local res = {1, meta[1], meta[2], meta[3]}
+for _, v in ipairs(redis.call('LRANGE', KEYS[1], 0, -1)) do table.insert(res, v) end
+redis.call('DEL', KEYS[1], KEYS[2])
+return res
+"""
+
+class RedisAlbumCollector:
+    def __init__(self, redis, on_album: OnAlbum, idle: float = ALBUM_IDLE_SECONDS):
+        self.redis = redis
+        self.on_album = on_album
+        self.idle = idle
+        self._add = redis.register_script(_ADD_LUA)
+        self._take = redis.register_script(_TAKE_LUA)
+        self._tasks: dict[str, asyncio.Task] = {}  # один ожидающий таймер на альбом в процессе
+
+    def _keys(self, mgid: str):
+        return [f"album:{mgid}:ids", f"album:{mgid}:meta", f"album:{mgid}:done"]
+
+    async def add(self, mgid: str, chat_id: int, user_id: int, message_id: int):
+        count = await self._add(keys=self._keys(mgid), args=[message_id, chat_id, user_id, _now_ms(), ALBUM_KEY_TTL])
+        if count >= ALBUM_MAX_ITEMS:
+            await self._finalize(mgid, force=True)
+        elif mgid not in self._tasks:
+            self._tasks[mgid] = asyncio.create_task(self._wait_idle(mgid))
+
+    async def _wait_idle(self, mgid: str):
+        try:
+            delay = self.idle
+            while delay is not None:
+                await asyncio.sleep(delay)
+                delay = await self._finalize(mgid, force=False)
+        except Exception:
+            logger.exception(f"album: finalize failed for {mgid}")
+        finally:
+            self._tasks.pop(mgid, None)
+
+    async def _finalize(self, mgid: str, force: bool) -> float | None:
+        """Забрать альбом и вызвать on_album. Возвращает, сколько ещё ждать, или None."""
+        res = await self._take(keys=self._keys(mgid), args=[_now_ms(), int(self.idle * 1000), "1" if force else "0", ALBUM_KEY_TTL])
+        if res[0] == 0:
+            return max(int(res[1]), 10) / 1000.0
+        if res[0] == -1:
+            return None
+        chat_id, user_id, first_ms = int(res[1]), int(res[2]), int(res[3])
+        ids = sorted(int(v) for v in res[4:])
+        _observe(len(ids), (_now_ms() - first_ms) / 1000.0)
+        await self.on_album(chat_id, user_id, ids)
+        return None
+
+class MemoryAlbumCollector:
+    def __init__(self, on_album: OnAlbum, idle: float = ALBUM_IDLE_SECONDS):
+        self.on_album = on_album
+        self.idle = idle
+        self._albums: dict[str, dict] = {}
+        # блокировка живёт, пока её кто-то держит или ждёт
+        self._user_locks: "weakref.WeakValueDictionary[int, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    def _lock(self, user_id: int) -> asyncio.Lock:
+        lock = self._user_locks.get(user_id)
+        if lock is None:
+            lock = self._user_locks[user_id] = asyncio.Lock()
+        return lock
+
+    async def add(self, mgid: str, chat_id: int, user_id: int, message_id: int):
+        async with self._lock(user_id):
+            entry = self._albums.get(mgid)
+            if entry is None:
+                entry = self._albums[mgid] = {
+                    "chat_id": chat_id, "user_id": user_id, "ids": [],
+                    "first": time.monotonic(), "last": 0.0, "task": None,
+                }
+            entry["ids"].append(message_id)
+            entry["last"] = time.monotonic()
+            full = len(entry["ids"]) >= ALBUM_MAX_ITEMS
+            if not full and entry["task"] is None:
+                entry["task"] = asyncio.create_task(self._wait_idle(mgid, user_id))
+        if full:
+            await self._finalize(mgid, user_id, force=True)
+
+    async def _wait_idle(self, mgid: str, user_id: int):
+        try:
+            delay = self.idle
+            while delay is not None:
+                await asyncio.sleep(delay)
+                delay = await self._finalize(mgid, user_id, force=False)
+        except Exception:
+            logger.exception(f"album: finalize failed for {mgid}")
+
+    async def _finalize(self, mgid: str, user_id: int, force: bool) -> float | None:
+        lock = self._lock(user_id)
+        async with lock:
+            entry = self._albums.get(mgid)
+            if entry is None:
+                return None
+            wait = entry["last"] + self.idle - time.monotonic()
+            if not force and wait > 0:
+                return max(wait, 0.01)
+            self._albums.pop(mgid)
+            if entry["task"] is not None and entry["task"] is not asyncio.current_task():
+                entry["task"].cancel()
+        ids = sorted(entry["ids"])
+        _observe(len(ids), time.monotonic() - entry["first"])
+        await self.on_album(entry["chat_id"], entry["user_id"], ids)
+        return None
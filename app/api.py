@@ -1,14 +1,41 @@
-from fastapi import FastAPI
+import os
+import time
+from fastapi import FastAPI, Request, Response
 from contextlib import asynccontextmanager
-from app.db import init_db
+from app.db import check_schema
+from app import bulk, export, metrics
+
+BOT_MODE = os.getenv("BOT_MODE", "polling")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await init_db()
+    await check_schema()
     yield
+    if BOT_MODE == "webhook":
+        await webhook.shutdown()
 
 app = FastAPI(lifespan=lifespan)
+app.include_router(bulk.router)
+app.include_router(export.router)
+
+if BOT_MODE == "webhook":
+    from app import webhook
+    app.include_router(webhook.router)
+
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    t0 = time.perf_counter()
+    response = await call_next(request)
+    # шаблон маршрута, а не сырой путь: иначе id в URL размножат серии
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    metrics.HTTP.labels(request.method, route, str(response.status_code)).observe(time.perf_counter() - t0)
+    return response
+
+@app.get("/metrics")
+def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
 
 @app.get("/health")
 def health():
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok"}
@@ -0,0 +1,16 @@
+# app/botapi.py
+# HTTP-сессия aiogram с настраиваемым адресом Bot API: TELEGRAM_API_URL позволяет
+# направить бота и воркеры на локальный сервер Bot API или фейковый сервер для тестов.
+import os
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+
+def make_session() -> AiohttpSession | None:
+    if not TELEGRAM_API_URL:
+        return None  # Bot создаст обычную сессию к api.telegram.org
+    return AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL))
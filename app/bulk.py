@@ -0,0 +1,344 @@
+# app/bulk.py
+# REST API массового создания, изменения и удаления запланированных постов.
+# Тело — JSON-массив или NDJSON (Content-Type: application/x-ndjson, один объект на строку).
+# NDJSON читается потоком: строки валидируются по мере прихода и пишутся в БД пачками
+# по BULK_CHUNK_SIZE — один многострочный INSERT/UPDATE на пачку, next_run для всей
+# пачки считается одним вызовом compute_next_runs_batch.
+#
+# Авторизация: Authorization: Bearer <token>; API_TOKENS="token1:telegram_id,token2:telegram_id".
+# Запросы выполняются от имени этого пользователя: доступны только его каналы
+# (владелец или админ), он же записывается в created_by. Копировать сообщения (src_*)
+# можно только из его личного чата с ботом и из доступных ему каналов.
+import os
+import hmac
+import json
+import logging
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Literal
+from datetime import datetime, time as dtime
+from zoneinfo import ZoneInfo
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+from sqlalchemy import insert, update, delete
+from sqlalchemy.future import select
+import redis.asyncio as aioredis
+from app.db import AsyncSessionLocal
+from app.models import Post, Channel
+from app.channels import accessible_channels, accessible_chat_ids, channel_access
+from app.scheduler import schedule_posts, unschedule_posts
+from app.sendplan import build_send_plan, validate_send_plan
+from app.utils import compute_next_runs_batch, week_in_cycle_for
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "1000"))
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "50000"))
+
+def _parse_tokens(raw: str) -> dict[str, int]:
+    tokens = {}
+    for part in raw.split(","):
+        token, _, uid = part.strip().partition(":")
+        if token and uid.lstrip("-").isdigit():
+            tokens[token] = int(uid)
+    return tokens
+
+API_TOKENS = _parse_tokens(os.getenv("API_TOKENS", ""))
+
+router = APIRouter(prefix="/api/posts", tags=["posts"])
+redis = aioredis.from_url(REDIS_URL)
+
+def api_user(authorization: str | None = Header(None)) -> int:
+    token = (authorization or "").removeprefix("Bearer ").strip().encode()
+    for known, uid in API_TOKENS.items():
+        if token and hmac.compare_digest(token, known.encode()):
+            return uid
+    raise HTTPException(status_code=401, detail="invalid token")
+
+# ---------- схемы ----------
+
+class ButtonIn(BaseModel):
+    text: str = Field(min_length=1, max_length=255)
+    url: str = Field(min_length=1, max_length=1000)
+
+class PostContent(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    text: str | None = None
+    text_entities: list[dict] | None = None
+    buttons: list[ButtonIn] | None = None
+    src_chat_id: int | None = None
+    src_message_id: int | None = None
+    src_message_ids: list[int] | None = Field(None, min_length=1, max_length=10)
+    media_type: Literal["photo", "video", "document", "voice", "video_note"] | None = None
+    media_file_id: str | None = Field(None, max_length=400)
+    media_group: list[dict] | None = Field(None, min_length=1, max_length=10)
+
+_TIME = r"^([01]\d|2[0-3]):[0-5]\d$"
+Recurrence = Literal["weekly", "cycle", "monthly"] | None
+
+class PostIn(PostContent):
+    channel_id: int
+    weekday: int = Field(ge=0, le=6)  # 0=Пн
+    time: str = Field(pattern=_TIME)  # HH:MM, МСК
+    recurrence: Recurrence = None
+
+class PostPatch(PostContent):
+    id: int
+    weekday: int | None = Field(None, ge=0, le=6)
+    time: str | None = Field(None, pattern=_TIME)
+    recurrence: Recurrence = None
+
+class PostRef(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    id: int
+
+_CONTENT_FIELDS = tuple(PostContent.model_fields)
+_PLAN_FIELDS = _CONTENT_FIELDS + ("button_text", "button_url")  # + legacy-кнопка старых постов
+_SCHEDULE_FIELDS = ("weekday", "time", "recurrence")
+_SOURCE_FIELDS = ("src_chat_id", "src_message_id", "src_message_ids")
+
+# ---------- потоковое чтение тела ----------
+
+async def iter_items(request: Request) -> AsyncIterator[tuple[int, Any]]:
+    """(номер элемента с 1, сырой элемент): bytes строки NDJSON или объект из JSON-массива."""
+    ctype = request.headers.get("content-type", "")
+    if "ndjson" in ctype or "jsonlines" in ctype:
+        buf, n = b"", 0
+        async for chunk in request.stream():
+            buf += chunk
+            *lines, buf = buf.split(b"\n")
+            for line in lines:
+                n += 1
+                if line.strip():
+                    yield n, line
+        if buf.strip():
+            yield n + 1, buf
+        return
+    try:
+        data = json.loads(await request.body())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"invalid JSON: {e}")
+    if not isinstance(data, list):
+        raise HTTPException(status_code=400, detail="expected a JSON array or NDJSON")
+    for n, item in enumerate(data, 1):
+        yield n, item
+
+def _error_text(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(map(str, err['loc'])) or 'item'}: {err['msg']}" for err in e.errors())
+
+async def iter_chunks(request: Request, model: type[BaseModel]):
+    """Пачки провалидированных элементов [(номер, модель)] и ошибки, накопленные с прошлой пачки."""
+    chunk, errors, count = [], [], 0
+    async for n, raw in iter_items(request):
+        count += 1
+        if count > BULK_MAX_ITEMS:
+            errors.append({"item": n, "error": f"more than {BULK_MAX_ITEMS} items, the rest is ignored"})
+            break
+        try:
+            obj = model.model_validate_json(raw) if isinstance(raw, bytes) else model.model_validate(raw)
+        except ValidationError as e:
+            errors.append({"item": n, "error": _error_text(e)})
+            continue
+        chunk.append((n, obj))
+        if len(chunk) >= BULK_CHUNK_SIZE:
+            yield chunk, errors
+            chunk, errors = [], []
+    if chunk or errors:
+        yield chunk, errors
+
+# ---------- сборка строк ----------
+
+def _utcnow() -> datetime:
+    return datetime.utcnow().replace(tzinfo=ZoneInfo("UTC"))
+
+def _parse_time(time_text: str) -> dtime:
+    hh, mm = map(int, time_text.split(":"))
+    return dtime(hh, mm)
+
+def _plan(values: dict) -> tuple[dict, str | None]:
+    plan = build_send_plan(SimpleNamespace(**{f: values.get(f) for f in _PLAN_FIELDS}))
+    return plan, validate_send_plan(plan)
+
+def _source_error(values: dict, allowed: set[int]) -> str | None:
+    # иначе воркер скопировал бы в канал вызывающего сообщения из любого чата, который читает бот
+    src = values.get("src_chat_id")
+    if src is not None and src not in allowed:
+        return "src_chat_id must be your private chat with the bot or a channel you own or administer"
+    return None
+
+def _schedule_error(values: dict, ch) -> str | None:
+    # мастер бота показывает «раз в N недель» только при настроенном цикле; API не подменяет повтор молча
+    if values.get("recurrence") == "cycle" and not ((ch.cycle_weeks or 1) > 1 and ch.cycle_start):
+        return "recurrence 'cycle' needs the channel's cycle (every N weeks) to be set in the bot's channel settings"
+    return None
+
+def _schedule(values: dict, ch, next_run: datetime) -> dict:
+    """Поля расписания как в finalize_post; цикл канала проверен _schedule_error."""
+    recurrence = values.get("recurrence")
+    week_in_cycle = None
+    if recurrence == "cycle":
+        week_in_cycle = week_in_cycle_for(next_run, ch.cycle_weeks, ch.cycle_start)
+    return {
+        "weekday": values["weekday"],
+        "time_text": values["time"],
+        "recurrence": recurrence,
+        "week_in_cycle": week_in_cycle,
+        "next_run": next_run,
+        "failed": False,
+        "attempts": 0,
+    }
+
+async def _notify_scheduler(items):
+    try:
+        await schedule_posts(redis, items)
+    except Exception as e:
+        logger.warning(f"bulk: failed to notify scheduler: {e}")
+
+def _finish(errors: list[dict], atomic: bool):
+    # atomic: ни одной записи при любой ошибке — исключение откатывает транзакцию
+    if atomic and errors:
+        raise HTTPException(status_code=422, detail={"errors": errors})
+
+# ---------- эндпоинты ----------
+
+@router.post("/bulk")
+async def bulk_create(request: Request, atomic: bool = False, user_id: int = Depends(api_user)):
+    """Создать посты. atomic=true — всё или ничего, иначе валидные сохраняются, ошибки возвращаются."""
+    created, errors, scheduled = [], [], []
+    async with AsyncSessionLocal() as session:
+        async for chunk, chunk_errors in iter_chunks(request, PostIn):
+            errors += chunk_errors
+            if not chunk:
+                continue
+            channels = await accessible_channels(session, user_id, [p.channel_id for _, p in chunk])
+            sources = await accessible_chat_ids(session, user_id, [p.src_chat_id for _, p in chunk if p.src_chat_id is not None])
+            first_runs = compute_next_runs_batch(_utcnow(), [p.weekday for _, p in chunk], [_parse_time(p.time) for _, p in chunk])
+            rows, nums = [], []
+            for (n, p), next_run in zip(chunk, first_runs):
+                ch = channels.get(p.channel_id)
+                if ch is None:
+                    errors.append({"item": n, "error": "channel not found or not accessible"})
+                    continue
+                values = p.model_dump()
+                error = _source_error(values, sources) or _schedule_error(values, ch)
+                if error:
+                    errors.append({"item": n, "error": error})
+                    continue
+                plan, plan_error = _plan(values)
+                if plan_error:
+                    errors.append({"item": n, "error": plan_error})
+                    continue
+                row = {f: values[f] for f in _CONTENT_FIELDS}
+                row.update(_schedule(values, ch, next_run), channel_id=ch.id, send_plan=plan, created_by=user_id)
+                rows.append(row)
+                nums.append(n)
+            if atomic and errors:
+                break
+            if rows:
+                # один многострочный INSERT ... RETURNING на пачку (insertmanyvalues)
+                res = await session.execute(insert(Post).returning(Post.id, Post.next_run, sort_by_parameter_order=True), rows)
+                for n, (pid, next_run) in zip(nums, res.all()):
+                    created.append({"item": n, "id": pid})
+                    scheduled.append((pid, next_run))
+            if not atomic:
+                await session.commit()
+        _finish(errors, atomic)
+        await session.commit()
+    await _notify_scheduler(scheduled)
+    return {"created": created, "errors": errors}
+
+@router.patch("/bulk")
+async def bulk_update(request: Request, atomic: bool = False, user_id: int = Depends(api_user)):
+    """Изменить посты по id. Переданы день/время/повтор — next_run пересчитывается."""
+    updated, errors, scheduled = [], [], []
+    async with AsyncSessionLocal() as session:
+        async for chunk, chunk_errors in iter_chunks(request, PostPatch):
+            errors += chunk_errors
+            if not chunk:
+                continue
+            res = await session.execute(
+                select(Post).join(Channel, Channel.id == Post.channel_id)
+                .where(Post.id.in_([p.id for _, p in chunk]))
+                .where(channel_access(user_id))
+            )
+            posts = {post.id: post for post in res.scalars().all()}
+            channels = await accessible_channels(session, user_id, [post.channel_id for post in posts.values()])
+            merged = []
+            for n, patch in chunk:
+                post = posts.get(patch.id)
+                if post is None:
+                    errors.append({"item": n, "error": "post not found or not accessible"})
+                    continue
+                values = {f: getattr(post, f) for f in _PLAN_FIELDS}
+                values.update(weekday=post.weekday, time=post.time_text, recurrence=post.recurrence)
+                changes = patch.model_dump(exclude_unset=True, exclude={"id"})
+                values.update(changes)
+                reschedule = any(f in changes for f in _SCHEDULE_FIELDS)
+                if reschedule and (values["weekday"] is None or values["time"] is None):
+                    errors.append({"item": n, "error": "weekday and time are required to reschedule this post"})
+                    continue
+                # источник проверяем при любой правке src_*: и унаследованный src_chat_id чужого автора
+                source_changed = any(f in changes for f in _SOURCE_FIELDS)
+                merged.append((n, post, values, reschedule, source_changed))
+            sources = await accessible_chat_ids(
+                session, user_id, [m[2]["src_chat_id"] for m in merged if m[4] and m[2]["src_chat_id"] is not None]
+            )
+            resched = [m for m in merged if m[3]]
+            next_runs = dict(zip(
+                (m[1].id for m in resched),
+                compute_next_runs_batch(_utcnow(), [m[2]["weekday"] for m in resched], [_parse_time(m[2]["time"]) for m in resched]),
+            ))
+            rows = []
+            for n, post, values, reschedule, source_changed in merged:
+                error = (_source_error(values, sources) if source_changed else None) or (
+                    _schedule_error(values, channels[post.channel_id]) if reschedule else None
+                )
+                if error:
+                    errors.append({"item": n, "error": error})
+                    continue
+                plan, plan_error = _plan(values)
+                if plan_error:
+                    errors.append({"item": n, "error": plan_error})
+                    continue
+                row = {f: values[f] for f in _CONTENT_FIELDS}
+                row.update(id=post.id, send_plan=plan)
+                if reschedule:
+                    row.update(_schedule(values, channels[post.channel_id], next_runs[post.id]))
+                    scheduled.append((post.id, row["next_run"]))
+                rows.append(row)
+                updated.append({"item": n, "id": post.id})
+            if atomic and errors:
+                break
+            # UPDATE по первичному ключу — executemany, сгруппированный по набору колонок
+            if rows:
+                await session.execute(update(Post), rows)
+            if not atomic:
+                await session.commit()
+        _finish(errors, atomic)
+        await session.commit()
+    await _notify_scheduler(scheduled)
+    return {"updated": updated, "errors": errors}
+
+@router.post("/bulk/delete")
+async def bulk_delete(request: Request, user_id: int = Depends(api_user)):
+    """Удалить посты: элементы вида {"id": 123}."""
+    deleted, errors = [], []
+    async with AsyncSessionLocal() as session:
+        async for chunk, chunk_errors in iter_chunks(request, PostRef):
+            errors += chunk_errors
+            if not chunk:
+                continue
+            ids = [ref.id for _, ref in chunk]
+            accessible = select(Channel.id).where(channel_access(user_id))
+            res = await session.execute(
+                delete(Post).where(Post.id.in_(ids)).where(Post.channel_id.in_(accessible)).returning(Post.id)
+            )
+            gone = set(res.scalars().all())
+            await session.commit()
+            deleted += sorted(gone)
+            errors += [{"item": n, "error": "post not found or not accessible"} for n, ref in chunk if ref.id not in gone]
+            try:
+                await unschedule_posts(redis, gone)
+            except Exception as e:
+                logger.warning(f"bulk: failed to unschedule: {e}")
+    return {"deleted": deleted, "errors": errors}
@@ -0,0 +1,117 @@
+# app/cache.py
+# Read-through кэш: LRU с TTL в памяти процесса (L1) и, опционально, общий Redis (L2).
+# Значения в Redis хранятся как JSON. Инвалидация удаляет ключ из Redis и рассылает его
+# по pub/sub, чтобы остальные процессы выбросили его из своего L1.
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+CACHE_TTL = int(os.getenv("CACHE_TTL", "300"))  # секунды, L2 и верхняя граница L1
+CACHE_LOCAL_TTL = int(os.getenv("CACHE_LOCAL_TTL", "60"))
+CACHE_LOCAL_SIZE = int(os.getenv("CACHE_LOCAL_SIZE", "10000"))
+INVALIDATE_CHANNEL = "cache:invalidate"
+
+class LRUCache:
+    def __init__(self, maxsize: int = CACHE_LOCAL_SIZE):
+        self.maxsize = maxsize
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: str, default=None):
+        item = self._data.get(key)
+        if item is None:
+            return default
+        expires, value = item
+        if expires < time.monotonic():
+            self._data.pop(key, None)
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: float):
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        self._data.pop(key, None)
+
+_MISS = object()
+
+class Cache:
+    def __init__(self, redis=None, local_ttl: int = CACHE_LOCAL_TTL, local_size: int = CACHE_LOCAL_SIZE):
+        self.redis = redis
+        self.local = LRUCache(local_size)
+        self.local_ttl = local_ttl
+        self._listener: asyncio.Task | None = None
+
+    def _ensure_listener(self):
+        if self.redis is not None and (self._listener is None or self._listener.done()):
+            self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        pubsub = self.redis.pubsub()
+        try:
+            await pubsub.subscribe(INVALIDATE_CHANNEL)
+            async for msg in pubsub.listen():
+                if msg.get("type") == "message":
+                    key = msg["data"].decode() if isinstance(msg["data"], bytes) else msg["data"]
+                    self.local.delete(key)
+        except Exception as e:
+            logger.warning(f"cache: invalidation listener stopped: {e}")
+        finally:
+            await pubsub.aclose()
+
+    async def get(self, key: str, default=None):
+        value = self.local.get(key, _MISS)
+        if value is not _MISS:
+            return value
+        if self.redis is not None:
+            self._ensure_listener()
+            try:
+                raw = await self.redis.get(key)
+            except Exception as e:
+                logger.warning(f"cache: redis get {key} failed: {e}")
+                raw = None
+            if raw is not None:
+                value = json.loads(raw)
+                self.local.set(key, value, self.local_ttl)
+                return value
+        return default
+
+    async def set(self, key: str, value: Any, ttl: int = CACHE_TTL):
+        self.local.set(key, value, min(ttl, self.local_ttl))
+        if self.redis is not None:
+            try:
+                await self.redis.set(key, json.dumps(value, ensure_ascii=False, separators=(",", ":")), ex=ttl)
+            except Exception as e:
+                logger.warning(f"cache: redis set {key} failed: {e}")
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self.local.delete(key)
+        if self.redis is not None and keys:
+            try:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    pipe.delete(*keys)
+                    for key in keys:
+                        pipe.publish(INVALIDATE_CHANNEL, key)
+                    await pipe.execute()
+            except Exception as e:
+                logger.warning(f"cache: redis delete {keys} failed: {e}")
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: int = CACHE_TTL):
+        """Read-through: значение из кэша или из loader(). None не кэшируется."""
+        value = await self.get(key, _MISS)
+        if value is not _MISS:
+            return value
+        value = await loader()
+        if value is not None:
+            await self.set(key, value, ttl)
+        return value
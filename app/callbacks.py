@@ -0,0 +1,202 @@
+# app/callbacks.py
+# callback_data кнопок бота: типизированные фабрики aiogram CallbackData
+# ("<prefix>:<поле>:<поле>", пустые хвостовые поля не пишутся — формат прежних кнопок)
+# и маршрутизация колбэков словарём по префиксу вместо цепочки фильтров: стоимость
+# не растёт с числом экранов. Чужой префикс, лишние части или не число вместо id
+# отсекаются до обработчика, и в БД такие данные не попадают.
+import logging
+from typing import Annotated, Literal, Optional
+from aiogram import Dispatcher, types
+from aiogram.dispatcher.event.handler import CallableObject
+from aiogram.filters.callback_data import CallbackData
+from aiogram.fsm.state import State
+from pydantic import Field
+
+logger = logging.getLogger(__name__)
+
+STALE_BUTTON_TEXT = "Кнопка устарела, открой меню заново: /start"
+
+class Callback(CallbackData, prefix="cb"):
+    def pack(self) -> str:
+        return super().pack().rstrip(self.__separator__)
+
+    @classmethod
+    def unpack(cls, value: str):
+        # недостающие хвостовые поля — пустые (None), лишние части unpack отвергнет
+        missing = len(cls.model_fields) + 1 - len(value.split(cls.__separator__))
+        return super().unpack(value + cls.__separator__ * max(missing, 0))
+
+Id = Annotated[int, Field(ge=1)]
+
+class _Paged(Callback, prefix="paged"):
+    """Страница keyset-списка: a:<id> — после id, b:<id> — до id, без полей — первая."""
+    dir: Optional[Literal["a", "b"]] = None
+    id: Optional[Id] = None
+
+    @classmethod
+    def page(cls, after: int | None = None, before: int | None = None):
+        if after is not None:
+            return cls(dir="a", id=after)
+        if before is not None:
+            return cls(dir="b", id=before)
+        return cls()
+
+    @property
+    def after(self) -> int | None:
+        return self.id if self.dir == "a" else None
+
+    @property
+    def before(self) -> int | None:
+        return self.id if self.dir == "b" else None
+
+# ---------- меню и каналы ----------
+
+class BackStart(Callback, prefix="back_start"):
+    pass
+
+class AddChannel(Callback, prefix="add_channel"):
+    pass
+
+class MyChannels(_Paged, prefix="my_channels"):
+    pass
+
+class OpenChannel(Callback, prefix="open_channel"):
+    ch_id: Id
+
+class ConfirmDeleteChannel(Callback, prefix="confirm_del_channel"):
+    ch_id: Id
+
+class DeleteChannel(Callback, prefix="delete_channel"):
+    ch_id: Id
+
+class DelChannel(DeleteChannel, prefix="del_channel"):
+    """Старый префикс кнопки удаления канала."""
+
+class ManageAdmins(Callback, prefix="manage_admins"):
+    ch_id: Id
+
+class AddAdmin(Callback, prefix="add_admin"):
+    ch_id: Id
+
+class RemoveAdmin(Callback, prefix="remove_admin"):
+    ch_id: Id
+    # любое целое, как принимает on_admin_input: в channel_admins могут быть и отрицательные
+    telegram_id: int
+
+class ChannelCycle(Callback, prefix="ch_cycle"):
+    ch_id: Id
+
+class SetChannelCycle(Callback, prefix="ch_cycle_set"):
+    ch_id: Id
+    weeks: Annotated[int, Field(ge=1, le=8)]
+
+# ---------- посты ----------
+
+class PostsList(Callback, prefix="posts_list"):
+    ch_id: Id
+    # курсор app.posts: p<мкс>_<id> или e<id>
+    cursor: Optional[Annotated[str, Field(pattern=r"^(p\d+_\d+|e\d+)$")]] = None
+
+class PostView(Callback, prefix="post_view"):
+    post_id: Id
+
+class PostDelete(Callback, prefix="post_del"):
+    post_id: Id
+
+# ---------- мастер нового поста ----------
+
+class NewPost(_Paged, prefix="new_post"):
+    pass
+
+class NpChannel(Callback, prefix="np_ch"):
+    ch_id: Id
+
+class NpWeekday(Callback, prefix="np_wd"):
+    weekday: Annotated[int, Field(ge=0, le=6)]
+
+class NpBackToWeekday(Callback, prefix="np_back_to_wd"):
+    pass
+
+class NpRepeat(Callback, prefix="np_rep"):
+    rep: Literal["once", "weekly", "cycle", "monthly"]
+
+class NpButtonAdd(Callback, prefix="np_btn_add"):
+    pass
+
+class NpButtonDelete(Callback, prefix="np_btn_del"):
+    idx: Annotated[int, Field(ge=0, le=99)]
+
+class NpButtonsDone(Callback, prefix="np_btn_done"):
+    pass
+
+class NpPreviewSave(Callback, prefix="np_preview_save"):
+    pass
+
+class NpPreviewBack(Callback, prefix="np_preview_back"):
+    pass
+
+# ---------- маршрутизация ----------
+
+class Route:
+    __slots__ = ("factory", "handler", "callable", "states")
+
+    def __init__(self, factory: type[Callback], handler, states: frozenset[str] | None):
+        self.factory, self.handler, self.states = factory, handler, states
+        # CallableObject передаёт обработчику только те аргументы, которые он объявил
+        self.callable = CallableObject(handler)
+
+class CallbackRouter:
+    """Все колбэки — через один обработчик aiogram; префикс -> Route в словаре.
+
+    Outer-middleware разбирает callback_data, проверяет состояние FSM и кладёт
+    в data callback_data (экземпляр фабрики) и handler_name (для метрик и профиля)."""
+
+    def __init__(self):
+        self._routes: dict[str, Route] = {}
+
+    def route(self, *factories: type[Callback], states: tuple[State, ...] = ()):
+        def decorator(handler):
+            allowed = frozenset(s.state for s in states) or None
+            for factory in factories:
+                prefix = factory.__prefix__
+                if prefix in self._routes:
+                    raise ValueError(f"callback prefix {prefix!r} is already routed")
+                self._routes[prefix] = Route(factory, handler, allowed)
+            return handler
+        return decorator
+
+    def resolve(self, data: str | None) -> tuple[Route, Callback] | None:
+        if not data:
+            return None
+        route = self._routes.get(data.split(Callback.__separator__, 1)[0])
+        if route is None:
+            return None
+        try:
+            return route, route.factory.unpack(data)
+        except (TypeError, ValueError):
+            return None
+
+    async def __call__(self, handler, event: types.CallbackQuery, data: dict):
+        resolved = self.resolve(event.data)
+        if resolved is None:
+            logger.info(f"callbacks: rejected {event.data!r} from {event.from_user.id}")
+            await event.answer(STALE_BUTTON_TEXT)
+            return None
+        route, payload = resolved
+        if route.states is not None:
+            state = data.get("state")
+            if state is None or await state.get_state() not in route.states:
+                # кнопка из прошлого шага мастера — молча гасим «часики»
+                await event.answer()
+                return None
+        data["callback_route"] = route
+        data["callback_data"] = payload
+        data["handler_name"] = route.handler.__name__
+        return await handler(event, data)
+
+    async def dispatch(self, cq: types.CallbackQuery, callback_route: Route, **data):
+        return await callback_route.callable.call(cq, **data)
+
+    def setup(self, dp: Dispatcher):
+        dp.callback_query.outer_middleware(self)
+        dp.callback_query.register(self.dispatch)
@@ -14,9 +14,18 @@ celery.conf.timezone = "UTC"
 # ВАЖНО: Явно импортируем задачи, чтобы beat загрузил periodic tasks
 celery.conf.imports = ("app.tasks",)
 
+# Точное время отправки обеспечивает app.scheduler; beat — страховочный опрос
+# на случай, если планировщик не запущен или пропустил пост.
+ENQUEUE_FALLBACK_SECONDS = float(os.getenv("ENQUEUE_FALLBACK_SECONDS", "60"))
+
 celery.conf.beat_schedule = {
     "enqueue-due-posts": {
         "task": "enqueue_due_posts",
-        "schedule": 10.0,  # каждые 10 сек
-    }
-}
\ No newline at end of file
+        "schedule": ENQUEUE_FALLBACK_SECONDS,
+    },
+    # секции журнала deliveries: создать наперёд, удалить старше DELIVERY_RETENTION_DAYS
+    "maintain-delivery-partitions": {
+        "task": "maintain_delivery_partitions",
+        "schedule": 6 * 3600,
+    },
+}
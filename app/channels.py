@@ -0,0 +1,140 @@
+# app/channels.py
+# Каналы и доступ к ним через read-through кэш: почти каждый callback бота начинается
+# с поиска канала и проверки владельца, а список «мои каналы» — с запроса по доступу.
+# Страницы списка кэшируются по курсору в одном значении на пользователя, поэтому
+# инвалидация пользователя сбрасывает их все разом.
+# CACHE_BACKEND=redis — общий L2 для нескольких реплик бота с рассылкой инвалидаций;
+# memory — только LRU процесса (одна реплика).
+import os
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import union, or_
+from sqlalchemy.future import select
+import redis.asyncio as aioredis
+from app.cache import Cache
+from app.db import AsyncSessionLocal
+from app.models import Channel, ChannelAdmin
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CHANNEL_CACHE_TTL = int(os.getenv("CHANNEL_CACHE_TTL", "300"))
+CHANNELS_PAGE_SIZE = int(os.getenv("CHANNELS_PAGE_SIZE", "20"))
+
+cache = Cache(aioredis.from_url(REDIS_URL) if CACHE_BACKEND == "redis" else None)
+
+# Снимок канала: то, что нужно обработчикам, без ORM-сессии
+ChannelInfo = namedtuple("ChannelInfo", "id chat_id username title owner_id cycle_weeks cycle_start")
+
+def _channel_key(ch_id: int) -> str:
+    return f"cache:ch:{ch_id}"
+
+def _user_key(telegram_id: int) -> str:
+    return f"cache:uch:{telegram_id}"
+
+def _dump(ch: Channel) -> dict:
+    return {
+        "id": ch.id,
+        "chat_id": ch.chat_id,
+        "username": ch.username,
+        "title": ch.title,
+        "owner_id": ch.owner_id,
+        "cycle_weeks": ch.cycle_weeks,
+        "cycle_start": ch.cycle_start.isoformat() if ch.cycle_start else None,
+    }
+
+def _load(d: dict) -> ChannelInfo:
+    cs = d.get("cycle_start")
+    return ChannelInfo(
+        d["id"], d["chat_id"], d.get("username"), d.get("title"), d["owner_id"],
+        d.get("cycle_weeks") or 1, datetime.fromisoformat(cs) if cs else None,
+    )
+
+async def get_channel(ch_id: int) -> ChannelInfo | None:
+    async def load():
+        async with AsyncSessionLocal() as session:
+            res = await session.execute(select(Channel).where(Channel.id == ch_id))
+            ch = res.scalar_one_or_none()
+            return _dump(ch) if ch else None
+    d = await cache.get_or_load(_channel_key(ch_id), load, CHANNEL_CACHE_TTL)
+    return _load(d) if d else None
+
+def _page_query(telegram_id: int, after: int | None, before: int | None, limit: int):
+    owner_ids = select(Channel.id.label("id")).where(Channel.owner_id == telegram_id)
+    admin_ids = select(ChannelAdmin.channel_id.label("id")).where(ChannelAdmin.telegram_id == telegram_id)
+    # курсор — в каждое плечо UNION, чтобы оба читались по индексу с нужного места
+    if after is not None:
+        owner_ids = owner_ids.where(Channel.id > after)
+        admin_ids = admin_ids.where(ChannelAdmin.channel_id > after)
+    if before is not None:
+        owner_ids = owner_ids.where(Channel.id < before)
+        admin_ids = admin_ids.where(ChannelAdmin.channel_id < before)
+    desc = before is not None
+    # каждое плечо ограничено страницей: дальше limit+1 id в нужную сторону не читаем
+    owner_ids = owner_ids.order_by(Channel.id.desc() if desc else Channel.id.asc()).limit(limit + 1)
+    admin_ids = admin_ids.order_by(ChannelAdmin.channel_id.desc() if desc else ChannelAdmin.channel_id.asc()).limit(limit + 1)
+    ids = union(owner_ids, admin_ids).subquery("ids")
+    order = Channel.id.desc() if desc else Channel.id.asc()
+    return select(Channel).join(ids, ids.c.id == Channel.id).order_by(order).limit(limit + 1)
+
+async def user_channels_page(telegram_id: int, after: int | None = None, before: int | None = None,
+                             limit: int = CHANNELS_PAGE_SIZE) -> tuple[list[ChannelInfo], int | None, int | None]:
+    """Страница каналов, где пользователь владелец или админ, по возрастанию id.
+
+    Keyset: after — id последнего канала предыдущей страницы, before — id первого
+    канала следующей. Возвращает (каналы, before для «назад», after для «вперёд»).
+    """
+    key = _user_key(telegram_id)
+    cursor = f"b{before}" if before is not None else f"a{after or 0}"
+    pages = dict(await cache.get(key) or {})
+    page = pages.get(cursor)
+    if page is None:
+        async with AsyncSessionLocal() as session:
+            res = await session.execute(_page_query(telegram_id, after, before, limit))
+            rows = res.scalars().all()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        if before is not None:
+            rows.reverse()
+            has_prev, has_next = more, True
+        else:
+            has_prev, has_next = after is not None, more
+        page = {
+            "items": [_dump(ch) for ch in rows],
+            "prev": rows[0].id if rows and has_prev else None,
+            "next": rows[-1].id if rows and has_next else None,
+        }
+        pages[cursor] = page
+        await cache.set(key, pages, CHANNEL_CACHE_TTL)
+    return [_load(d) for d in page["items"]], page["prev"], page["next"]
+
+async def invalidate_users(*telegram_ids: int):
+    """Сбросить списки каналов пользователей: добавлен/удалён канал или админ."""
+    await cache.delete(*(_user_key(t) for t in telegram_ids))
+
+async def invalidate_channel(ch_id: int, telegram_ids=()):
+    """Сбросить канал и списки каналов всех, у кого он был (владелец и админы)."""
+    await cache.delete(_channel_key(ch_id), *(_user_key(t) for t in telegram_ids))
+
+def channel_access(telegram_id: int):
+    """Условие на Channel: пользователь владелец или админ канала."""
+    admin_of = select(ChannelAdmin.channel_id).where(ChannelAdmin.telegram_id == telegram_id)
+    return or_(Channel.owner_id == telegram_id, Channel.id.in_(admin_of))
+
+async def accessible_channels(session, telegram_id: int, ch_ids) -> dict[int, ChannelInfo]:
+    """Каналы из ch_ids, где пользователь владелец или админ — одним запросом, мимо кэша."""
+    ids = list(set(ch_ids))
+    if not ids:
+        return {}
+    res = await session.execute(select(Channel).where(Channel.id.in_(ids)).where(channel_access(telegram_id)))
+    return {ch.id: _load(_dump(ch)) for ch in res.scalars().all()}
+
+async def accessible_chat_ids(session, telegram_id: int, chat_ids) -> set[int]:
+    """chat_id из chat_ids, откуда пользователю можно копировать сообщения: его личный чат
+    с ботом и каналы, где он владелец или админ."""
+    ids = set(chat_ids)
+    allowed = ids & {telegram_id}
+    rest = ids - allowed
+    if rest:
+        res = await session.execute(select(Channel.chat_id).where(Channel.chat_id.in_(rest)).where(channel_access(telegram_id)))
+        allowed |= set(res.scalars().all())
+    return allowed
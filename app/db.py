@@ -3,6 +3,7 @@ from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 import os
 from dotenv import load_dotenv
+from app import metrics, profiling
 
 load_dotenv()
 
@@ -16,17 +17,27 @@ engine = create_async_engine(
     max_overflow=40,
 )
 AsyncSessionLocal = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+metrics.instrument_engine(engine)
+profiling.instrument_engine(engine)
 
-# Создание схемы БД при старте
-from app.models import Base  # импорт после создания engine, чтобы избежать циклов
-from sqlalchemy import text
+# Проверка схемы БД при старте. Никакого DDL: схему меняют только миграции
+# (alembic upgrade head, сервис migrate в docker-compose), поэтому перезапуск
+# бота/веб-приложения не берёт блокировок на таблицы, с которыми работают воркеры.
+from alembic.config import Config
+from alembic.script import ScriptDirectory
+from alembic.runtime.migration import MigrationContext
 
-async def init_db() -> None:
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
-        await conn.execute(text("ALTER TABLE posts ADD COLUMN IF NOT EXISTS src_chat_id BIGINT"))
-        await conn.execute(text("ALTER TABLE posts ADD COLUMN IF NOT EXISTS src_message_id BIGINT"))
-        await conn.execute(text("ALTER TABLE posts ADD COLUMN IF NOT EXISTS src_message_ids JSONB"))
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic.ini")
+
+def schema_head() -> str | None:
+    return ScriptDirectory.from_config(Config(ALEMBIC_INI)).get_current_head()
+
+async def check_schema() -> None:
+    async with engine.connect() as conn:
+        current = await conn.run_sync(lambda c: MigrationContext.configure(c).get_current_revision())
+    head = schema_head()
+    if current != head:
+        raise RuntimeError(f"Схема БД на ревизии {current}, ожидается {head}: выполните `alembic upgrade head`")
 
 # dependency for FastAPI
 async def get_session():
@@ -0,0 +1,132 @@
+# app/deliveries.py
+# Журнал отправок (таблица deliveries): классификация ошибок Bot API, пакетная запись
+# из воркеров и обслуживание месячных секций — создание наперёд и удаление по retention.
+import os
+import re
+import logging
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from sqlalchemy import insert, text
+from aiogram.exceptions import (
+    TelegramBadRequest, TelegramUnauthorizedError, TelegramForbiddenError, TelegramNotFound,
+    TelegramConflictError, TelegramEntityTooLarge, TelegramRetryAfter, TelegramServerError,
+)
+from app.models import Delivery
+
+logger = logging.getLogger(__name__)
+
+DELIVERY_RETENTION_DAYS = int(os.getenv("DELIVERY_RETENTION_DAYS", "90"))
+DELIVERY_PARTITIONS_AHEAD = int(os.getenv("DELIVERY_PARTITIONS_AHEAD", "2"))  # месяцев вперёд
+ERROR_MESSAGE_MAX = 1000
+
+_ERROR_CODES = (
+    (TelegramRetryAfter, 429),
+    (TelegramBadRequest, 400),
+    (TelegramUnauthorizedError, 401),
+    (TelegramForbiddenError, 403),
+    (TelegramNotFound, 404),
+    (TelegramConflictError, 409),
+    (TelegramEntityTooLarge, 413),
+    (TelegramServerError, 500),
+)
+
+def error_code(e: Exception) -> int | None:
+    for cls, code in _ERROR_CODES:
+        if isinstance(e, cls):
+            return code
+    return None
+
+def message_ids(results) -> list[int]:
+    """message_id из ответов Bot API: Message, MessageId или их списки (альбомы)."""
+    ids = []
+    for r in results:
+        for item in (r if isinstance(r, list) else [r]):
+            mid = getattr(item, "message_id", None)
+            if mid is not None:
+                ids.append(mid)
+    return ids
+
+def delivery_row(job, started_at: datetime, finished_at: datetime, latency_ms: int, outcome: str,
+                 results=(), error: Exception | None = None) -> dict:
+    return {
+        "started_at": started_at,
+        "finished_at": finished_at,
+        "post_id": job.id,
+        "channel_id": job.channel_id,
+        "attempt": job.attempts,
+        "due_at": job.due_at,
+        "latency_ms": latency_ms,
+        "outcome": outcome,
+        "message_ids": message_ids(results) or None,
+        "error_code": error_code(error) if error is not None else None,
+        "error_class": type(error).__name__ if error is not None else None,
+        "error_message": str(error)[:ERROR_MESSAGE_MAX] if error is not None else None,
+    }
+
+async def write_deliveries(session, rows: list[dict]):
+    """Один многострочный INSERT на пачку. Нет секции под started_at — создаём и повторяем."""
+    if not rows:
+        return
+    try:
+        await session.execute(insert(Delivery), rows)
+        await session.commit()
+    except Exception as e:
+        await session.rollback()
+        logger.warning(f"deliveries: insert failed ({e}), ensuring partitions and retrying")
+        await ensure_partitions(session)
+        await session.execute(insert(Delivery), rows)
+        await session.commit()
+
+# ---------- секции ----------
+
+_PARTITION_RE = re.compile(r"^deliveries_y(\d{4})m(\d{2})$")
+
+def _month_start(dt: datetime) -> datetime:
+    return datetime(dt.year, dt.month, 1, tzinfo=ZoneInfo("UTC"))
+
+def _add_months(month: datetime, n: int) -> datetime:
+    y, m = divmod(month.month - 1 + n, 12)
+    return month.replace(year=month.year + y, month=m + 1)
+
+def partition_name(month: datetime) -> str:
+    return f"deliveries_y{month.year:04d}m{month.month:02d}"
+
+def partition_ddl(month: datetime) -> str:
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF deliveries "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+    )
+
+def _utcnow() -> datetime:
+    return datetime.utcnow().replace(tzinfo=ZoneInfo("UTC"))
+
+async def ensure_partitions(session, now: datetime | None = None, ahead: int = DELIVERY_PARTITIONS_AHEAD) -> list[str]:
+    """Секции с текущего месяца на ahead месяцев вперёд."""
+    month = _month_start(now or _utcnow())
+    names = []
+    for i in range(ahead + 1):
+        m = _add_months(month, i)
+        await session.execute(text(partition_ddl(m)))
+        names.append(partition_name(m))
+    await session.commit()
+    return names
+
+async def drop_expired_partitions(session, now: datetime | None = None, retention_days: int = DELIVERY_RETENTION_DAYS) -> list[str]:
+    """Удалить секции, целиком старше retention: DROP вместо DELETE — без bloat и vacuum."""
+    cutoff = (now or _utcnow()).timestamp() - retention_days * 86400
+    res = await session.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = 'deliveries'"
+    ))
+    dropped = []
+    for (name,) in res.all():
+        m = _PARTITION_RE.match(name)
+        if not m:
+            continue
+        month = datetime(int(m.group(1)), int(m.group(2)), 1, tzinfo=ZoneInfo("UTC"))
+        if _add_months(month, 1).timestamp() <= cutoff:
+            await session.execute(text(f"DROP TABLE IF EXISTS {name}"))
+            dropped.append(name)
+    await session.commit()
+    return dropped
@@ -0,0 +1,137 @@
+# app/export.py
+# Потоковая выгрузка постов (расписание + last_status) и журнала отправок в NDJSON или CSV.
+# Строки читаются серверным курсором (yield_per) пачками по EXPORT_BATCH_SIZE
+# и сразу отдаются наружу, поэтому память не зависит от размера таблицы.
+#
+#   GET /api/posts/export?format=csv&channel_id=1   (Authorization: Bearer <token>)
+#   GET /api/deliveries/export?since=2026-10-01T00:00:00Z
+#   python -m app.export --format ndjson --out posts.ndjson [--channel-id 1]
+#   python -m app.export deliveries --since 2026-10-01 --format csv
+import os
+import io
+import csv
+import sys
+import json
+import asyncio
+import argparse
+from datetime import datetime
+from typing import AsyncIterator
+from zoneinfo import ZoneInfo
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy.future import select
+from app.db import AsyncSessionLocal
+from app.models import Post, Channel, Delivery
+from app.channels import channel_access
+from app.bulk import api_user
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+_POST_COLUMNS = (
+    Post.id, Post.channel_id, Channel.chat_id, Post.weekday, Post.time_text, Post.recurrence,
+    Post.next_run, Post.last_status, Post.failed, Post.created_by, Post.created_at, Post.text,
+)
+_DELIVERY_COLUMNS = (
+    Delivery.id, Delivery.post_id, Delivery.channel_id, Delivery.attempt, Delivery.due_at,
+    Delivery.started_at, Delivery.finished_at, Delivery.latency_ms, Delivery.outcome,
+    Delivery.message_ids, Delivery.error_code, Delivery.error_class, Delivery.error_message,
+)
+
+def posts_query(channel_id: int | None = None, user_id: int | None = None):
+    q = select(*_POST_COLUMNS).join(Channel, Channel.id == Post.channel_id).order_by(Post.id)
+    if channel_id is not None:
+        q = q.where(Post.channel_id == channel_id)
+    if user_id is not None:
+        q = q.where(channel_access(user_id))
+    return q.execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+def deliveries_query(channel_id: int | None = None, user_id: int | None = None, since: datetime | None = None):
+    # since отсекает старые месячные секции ещё на этапе планирования
+    q = select(*_DELIVERY_COLUMNS).order_by(Delivery.started_at, Delivery.id)
+    if since is not None:
+        q = q.where(Delivery.started_at >= since)
+    if channel_id is not None:
+        q = q.where(Delivery.channel_id == channel_id)
+    if user_id is not None:
+        q = q.where(Delivery.channel_id.in_(select(Channel.id).where(channel_access(user_id))))
+    return q.execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+def _fields(query) -> list[str]:
+    return [c.key for c in query.selected_columns]
+
+def _value(v):
+    return v.isoformat() if isinstance(v, datetime) else v
+
+def _encode_ndjson(fields: list[str], rows) -> str:
+    return "".join(
+        json.dumps(dict(zip(fields, map(_value, r))), ensure_ascii=False, separators=(",", ":")) + "\n"
+        for r in rows
+    )
+
+def _csv_value(v):
+    # JSONB (message_ids) — строкой JSON в ячейке
+    return json.dumps(v) if isinstance(v, (list, dict)) else _value(v)
+
+def _encode_csv(rows, header: list[str] | None = None) -> str:
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    if header:
+        w.writerow(header)
+    w.writerows([_csv_value(v) for v in r] for r in rows)
+    return buf.getvalue()
+
+async def stream_export(query, fmt: str) -> AsyncIterator[str]:
+    """Куски текста: по одному на пачку строк серверного курсора."""
+    fields = _fields(query)
+    if fmt == "csv":
+        yield _encode_csv([], header=fields)
+    async with AsyncSessionLocal() as session:
+        result = await session.stream(query)
+        async for rows in result.partitions():
+            yield _encode_csv(rows) if fmt == "csv" else _encode_ndjson(fields, rows)
+
+def _response(query, fmt: str, name: str) -> StreamingResponse:
+    if fmt not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(FORMATS)}")
+    return StreamingResponse(
+        stream_export(query, fmt),
+        media_type=FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{fmt}"'},
+    )
+
+router = APIRouter(prefix="/api", tags=["export"])
+
+@router.get("/posts/export")
+async def export_posts(format: str = "ndjson", channel_id: int | None = None, user_id: int = Depends(api_user)):
+    return _response(posts_query(channel_id, user_id), format, "posts")
+
+@router.get("/deliveries/export")
+async def export_deliveries(format: str = "ndjson", channel_id: int | None = None, since: datetime | None = None,
+                            user_id: int = Depends(api_user)):
+    return _response(deliveries_query(channel_id, user_id, since), format, "deliveries")
+
+async def main(args):
+    if args.table == "deliveries":
+        since = datetime.fromisoformat(args.since) if args.since else None
+        if since is not None and since.tzinfo is None:
+            since = since.replace(tzinfo=ZoneInfo("UTC"))
+        query = deliveries_query(args.channel_id, since=since)
+    else:
+        query = posts_query(args.channel_id)
+    out = open(args.out, "w", newline="", encoding="utf-8") if args.out else sys.stdout
+    try:
+        async for chunk in stream_export(query, args.format):
+            out.write(chunk)
+    finally:
+        if args.out:
+            out.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="export posts or delivery history as NDJSON or CSV")
+    parser.add_argument("table", nargs="?", choices=["posts", "deliveries"], default="posts")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="ndjson")
+    parser.add_argument("--channel-id", type=int, default=None)
+    parser.add_argument("--since", default=None, help="deliveries: начиная с момента (ISO 8601)")
+    parser.add_argument("--out", default=None, help="файл; по умолчанию stdout")
+    asyncio.run(main(parser.parse_args()))
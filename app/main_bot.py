@@ -1,5 +1,6 @@
 # app/main_bot.py
 import os
+import json
 import asyncio
 from aiogram import Bot, Dispatcher, types
 from aiogram.filters import Command, StateFilter
@@ -8,33 +9,93 @@ from aiogram.types import InputMediaPhoto, InputMediaVideo, InputMediaDocument
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.redis import RedisStorage
+from aiogram.fsm.storage.base import StorageKey
 from aiogram.exceptions import TelegramBadRequest
 from dotenv import load_dotenv
-from app.db import AsyncSessionLocal, init_db
-from app.models import User, Channel, ChannelAdmin, Post
+from app.db import AsyncSessionLocal, check_schema
+from app.models import User, Channel, ChannelAdmin, Post, Delivery
 from sqlalchemy.future import select
-from sqlalchemy import or_
+from sqlalchemy import delete, update
+from sqlalchemy.dialects.postgresql import insert
 from datetime import datetime, time as dtime, timedelta
-from app.utils import compute_next_weekday_time_tz
+from app.utils import compute_next_weekday_time_tz, week_in_cycle_for
+from app.scheduler import schedule_posts, unschedule_posts
+from app.botapi import make_session
+from app.albums import RedisAlbumCollector, MemoryAlbumCollector
+from app.posts import posts_page
+from app.sendplan import build_send_plan, validate_send_plan
+from app.channels import get_channel, user_channels_page, invalidate_channel, invalidate_users
+from app.cache import LRUCache
+from app import metrics, profiling
+from app import callbacks as cb
+from app import updates
 from zoneinfo import ZoneInfo
+import redis.asyncio as aioredis
 
 load_dotenv()
 BOT_TOKEN = os.getenv("BOT_TOKEN")
-bot = Bot(token=BOT_TOKEN, parse_mode="HTML")
-dp = Dispatcher(storage=MemoryStorage())
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+# polling — long-polling в этом процессе; webhook — апдейты принимает app.api
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")  # публичный https-адрес веб-приложения
+# секретный сегмент пути и X-Telegram-Bot-Api-Secret-Token (символы A-Z, a-z, 0-9, _ и -)
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# memory — состояние мастера в памяти процесса (одна реплика, теряется при деплое);
+# redis — общее для всех реплик, недописанные черновики истекают через FSM_TTL
+FSM_STORAGE = os.getenv("FSM_STORAGE", "memory")
+FSM_REDIS_URL = os.getenv("FSM_REDIS_URL", REDIS_URL)
+FSM_TTL = int(os.getenv("FSM_TTL", str(24 * 3600)))  # секунды с последнего шага мастера
+
+def _fsm_dumps(data: dict) -> str:
+    # компактно: без пробелов, кириллица как есть, пустые поля не храним (читаются через data.get)
+    return json.dumps({k: v for k, v in data.items() if v is not None}, ensure_ascii=False, separators=(",", ":"))
+
+def make_fsm_storage():
+    if FSM_STORAGE == "redis":
+        return RedisStorage.from_url(FSM_REDIS_URL, state_ttl=FSM_TTL, data_ttl=FSM_TTL, json_dumps=_fsm_dumps)
+    return MemoryStorage()
+
+bot = Bot(token=BOT_TOKEN, parse_mode="HTML", session=make_session())
+dp = Dispatcher(storage=make_fsm_storage())
+redis = aioredis.from_url(REDIS_URL)
+# время обработчиков — после фильтров, по имени функции
+dp.message.middleware(metrics.HandlerTimingMiddleware())
+dp.callback_query.middleware(metrics.HandlerTimingMiddleware())
+# профилирование по запросу (PROFILING=1 или /profile on): фазы db/api и снимки медленных
+dp.message.middleware(profiling.HandlerProfilingMiddleware(redis))
+dp.callback_query.middleware(profiling.HandlerProfilingMiddleware(redis))
+bot.session.middleware(profiling.RequestPhaseMiddleware())
+# колбэки кнопок: разбор callback_data и выбор обработчика по префиксу (app.callbacks)
+callbacks = cb.CallbackRouter()
+callbacks.setup(dp)
+# апдейты разных пользователей — параллельно, одного пользователя — по порядку (app.updates)
+update_queue = updates.setup(dp)
 
 WEEKDAYS = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
 WEEKDAYS_FULL = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
 
 MAIN_TEXT = "Привет! Я бот автопостинга."
 
+def recurrence_label(recurrence: str | None, cycle_weeks: int | None = None) -> str:
+    if recurrence == "weekly":
+        return "каждую неделю"
+    if recurrence == "cycle":
+        return f"раз в {cycle_weeks} нед." if cycle_weeks else "по циклу канала"
+    if recurrence == "monthly":
+        return "раз в месяц"
+    return "однократно"
+
+def cycle_label(cycle_weeks: int | None) -> str:
+    return f"раз в {cycle_weeks} нед." if (cycle_weeks or 1) > 1 else "не задан"
+
 # ---------- общие хелперы ----------
 
 def main_menu_kb() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="➕ Добавить канал", callback_data="add_channel")],
-        [InlineKeyboardButton(text="📝 Новый пост", callback_data="new_post")],
-        [InlineKeyboardButton(text="📚 Мои каналы", callback_data="my_channels")],
+        [InlineKeyboardButton(text="➕ Добавить канал", callback_data=cb.AddChannel().pack())],
+        [InlineKeyboardButton(text="📝 Новый пост", callback_data=cb.NewPost().pack())],
+        [InlineKeyboardButton(text="📚 Мои каналы", callback_data=cb.MyChannels().pack())],
     ])
 
 def channel_display_name(ch: Channel) -> str:
@@ -54,6 +115,7 @@ class NewPost(StatesGroup):
     choose_channel = State()
     choose_weekday = State()
     choose_time = State()
+    choose_repeat = State()
     input_content = State()
     ask_button = State()
     input_button = State()
@@ -62,15 +124,28 @@ class NewPost(StatesGroup):
 class ManageAdmins(StatesGroup):
     wait_input = State()
 
+# telegram_id, уже записанные в users этим процессом: повторные клики не ходят в БД
+_known_users = LRUCache(maxsize=100_000)
+KNOWN_USER_TTL = 24 * 3600
+
 async def ensure_user(telegram_id: int, name: str = None):
+    if _known_users.get(telegram_id):
+        return
     async with AsyncSessionLocal() as session:
-        q = await session.execute(select(User).where(User.telegram_id == telegram_id))
-        u = q.scalar_one_or_none()
-        if not u:
-            u = User(telegram_id=telegram_id, name=name)
-            session.add(u)
-            await session.commit()
-        return u
+        await session.execute(
+            insert(User).values(telegram_id=telegram_id, name=name)
+            .on_conflict_do_nothing(index_elements=[User.telegram_id])
+        )
+        await session.commit()
+    _known_users.set(telegram_id, True, KNOWN_USER_TTL)
+
+def pager_row(factory: type[cb.Callback], prev: int | None, next_: int | None) -> list[InlineKeyboardButton]:
+    row = []
+    if prev is not None:
+        row.append(InlineKeyboardButton(text="◀️", callback_data=factory.page(before=prev).pack()))
+    if next_ is not None:
+        row.append(InlineKeyboardButton(text="▶️", callback_data=factory.page(after=next_).pack()))
+    return row
 
 # ---------- /start, главное меню ----------
 
@@ -80,7 +155,28 @@ async def cmd_start(message: types.Message, state: FSMContext):
     await ensure_user(message.from_user.id, message.from_user.full_name)
     await message.answer(MAIN_TEXT, reply_markup=main_menu_kb())
 
-@dp.callback_query(lambda c: c.data == "back_start")
+@dp.message(Command(commands=["profile"]))
+async def cmd_profile(message: types.Message):
+    # /profile on|off|status — только для PROFILE_ADMINS; флаг общий для бота и воркеров
+    if message.from_user.id not in profiling.PROFILE_ADMINS:
+        return
+    arg = (message.text or "").partition(" ")[2].strip().lower()
+    if arg in ("on", "off"):
+        await profiling.set_enabled(redis, arg == "on")
+    else:
+        await profiling.refresh(redis)
+    lines = [
+        f"Профилирование: {'включено' if profiling.enabled() else 'выключено'}",
+        f"Каталог: {profiling.PROFILE_DIR}, самых медленных: {profiling.PROFILE_TOP_N} на вид",
+    ]
+    if arg == "on" and not profiling.PROFILING:
+        lines.append(f"Выключится само через {profiling.PROFILE_FLAG_TTL // 60} мин.")
+    top = profiling.slowest()[:5]
+    if top:
+        lines.append("Медленные в этом процессе: " + ", ".join(f"{name} {ms:.0f} мс" for name, ms in top))
+    await message.answer("\n".join(lines))
+
+@callbacks.route(cb.BackStart)
 async def cb_back_start(cq: types.CallbackQuery, state: FSMContext):
     await state.clear()
     await safe_edit_message_text(cq.message, MAIN_TEXT, main_menu_kb())
@@ -88,72 +184,54 @@ async def cb_back_start(cq: types.CallbackQuery, state: FSMContext):
 
 # ---------- добавление канала ----------
 
-@dp.callback_query(lambda c: c.data == "add_channel")
+@callbacks.route(cb.AddChannel)
 async def cb_add_channel(cq: types.CallbackQuery):
     await cq.message.answer("Перешли сообщение из канала (бот должен быть админом) или введи @username канала.")
     await cq.answer()
 
 # ---------- мои каналы ----------
 
-@dp.callback_query(lambda c: c.data == "my_channels")
-async def cb_my_channels(cq: types.CallbackQuery):
+@callbacks.route(cb.MyChannels)
+async def cb_my_channels(cq: types.CallbackQuery, callback_data: cb.MyChannels = cb.MyChannels()):
     await ensure_user(cq.from_user.id, cq.from_user.full_name)
-    async with AsyncSessionLocal() as session:
-        owner_res = await session.execute(select(Channel).where(Channel.owner_id == cq.from_user.id))
-        owner_channels = owner_res.scalars().all()
-        admin_res = await session.execute(
-            select(Channel).join(ChannelAdmin, ChannelAdmin.channel_id == Channel.id)
-            .where(ChannelAdmin.telegram_id == cq.from_user.id)
-        )
-        admin_channels = admin_res.scalars().all()
-        seen_ids, channels = set(), []
-        for ch in owner_channels + admin_channels:
-            if ch.id not in seen_ids:
-                seen_ids.add(ch.id)
-                channels.append(ch)
-        if not channels:
-            await safe_edit_message_text(cq.message, "У тебя пока нет каналов. Нажми ‘Добавить канал’.", main_menu_kb())
-        else:
-            rows = [[InlineKeyboardButton(text=channel_display_name(ch), callback_data=f"open_channel:{ch.id}")] for ch in channels]
-            rows.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back_start")])
-            await safe_edit_message_text(cq.message, "Выбери канал:", InlineKeyboardMarkup(inline_keyboard=rows))
+    channels, prev, next_ = await user_channels_page(cq.from_user.id, after=callback_data.after, before=callback_data.before)
+    if not channels:
+        await safe_edit_message_text(cq.message, "У тебя пока нет каналов. Нажми ‘Добавить канал’.", main_menu_kb())
+    else:
+        rows = [[InlineKeyboardButton(text=channel_display_name(ch), callback_data=cb.OpenChannel(ch_id=ch.id).pack())] for ch in channels]
+        if prev is not None or next_ is not None:
+            rows.append(pager_row(cb.MyChannels, prev, next_))
+        rows.append([InlineKeyboardButton(text="⬅️ Назад", callback_data=cb.BackStart().pack())])
+        await safe_edit_message_text(cq.message, "Выбери канал:", InlineKeyboardMarkup(inline_keyboard=rows))
     await cq.answer()
 
-@dp.callback_query(lambda c: c.data and c.data.startswith("open_channel:"))
-async def cb_open_channel(cq: types.CallbackQuery):
-    ch_id = int(cq.data.split(":", 1)[1])
-    async with AsyncSessionLocal() as session:
-        res = await session.execute(select(Channel).where(Channel.id == ch_id))
-        ch = res.scalar_one_or_none()
-        if not ch:
-            await cq.answer("Канал не найден", show_alert=True)
-            return
-        title = channel_display_name(ch)
+@callbacks.route(cb.OpenChannel)
+async def cb_open_channel(cq: types.CallbackQuery, callback_data: cb.OpenChannel):
+    ch_id = callback_data.ch_id
+    ch = await get_channel(ch_id)
+    if not ch:
+        await cq.answer("Канал не найден", show_alert=True)
+        return
+    title = channel_display_name(ch)
     kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="📋 Запланированные посты", callback_data=f"posts_list:{ch_id}")],
-        [InlineKeyboardButton(text="👤 Админы", callback_data=f"manage_admins:{ch_id}")],
-        [InlineKeyboardButton(text="🗑 Удалить канал", callback_data=f"confirm_del_channel:{ch_id}")],
-        [InlineKeyboardButton(text="⬅️ Назад", callback_data="my_channels")],
+        [InlineKeyboardButton(text="📋 Запланированные посты", callback_data=cb.PostsList(ch_id=ch_id).pack())],
+        [InlineKeyboardButton(text="👤 Админы", callback_data=cb.ManageAdmins(ch_id=ch_id).pack())],
+        [InlineKeyboardButton(text=f"🔁 Цикл: {cycle_label(ch.cycle_weeks)}", callback_data=cb.ChannelCycle(ch_id=ch_id).pack())],
+        [InlineKeyboardButton(text="🗑 Удалить канал", callback_data=cb.ConfirmDeleteChannel(ch_id=ch_id).pack())],
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data=cb.MyChannels().pack())],
     ])
     await safe_edit_message_text(cq.message, f"Канал: {title}", kb)
     await cq.answer()
 
 # ---------- список запланированных постов ----------
 
-@dp.callback_query(lambda c: c.data and c.data.startswith("posts_list:"))
-async def cb_posts_list(cq: types.CallbackQuery):
-    ch_id = int(cq.data.split(":", 1)[1])
-    async with AsyncSessionLocal() as session:
-        # показываем pending (next_run != None) и неотправленные (последний статус — ошибка)
-        res = await session.execute(
-            select(Post)
-            .where(Post.channel_id == ch_id)
-            .where(or_(Post.next_run != None, Post.last_status.like("error%")))
-            .order_by(Post.next_run.asc().nulls_last(), Post.id.asc())
-        )
-        posts = res.scalars().all()
+@callbacks.route(cb.PostsList)
+async def cb_posts_list(cq: types.CallbackQuery, callback_data: cb.PostsList):
+    ch_id, cursor = callback_data.ch_id, callback_data.cursor
+    # показываем pending (next_run != None) и неотправленные (последний статус — ошибка)
+    posts, next_cursor = await posts_page(ch_id, cursor)
     if not posts:
-        kb = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="⬅️ Назад", callback_data=f"open_channel:{ch_id}")]])
+        kb = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="⬅️ Назад", callback_data=cb.OpenChannel(ch_id=ch_id).pack())]])
         await safe_edit_message_text(cq.message, "Запланированных постов пока нет.", kb)
         await cq.answer()
         return
@@ -161,17 +239,42 @@ async def cb_posts_list(cq: types.CallbackQuery):
     for p in posts:
         wd = WEEKDAYS[p.weekday] if p.weekday is not None else "?"
         t = p.time_text or "?"
-        prev = (p.text or "").replace("\n", " ")[:25]
-        prefix = "⚠️ " if (p.last_status or "").startswith("error") else ""
+        prev = (p.preview or "").replace("\n", " ")
+        prefix = "⚠️ " if p.failed else ""
         label = f"{prefix}{wd} {t}" + (f" — {prev}" if prev else "")
-        rows.append([InlineKeyboardButton(text=label, callback_data=f"post_view:{p.id}")])
-    rows.append([InlineKeyboardButton(text="⬅️ Назад", callback_data=f"open_channel:{ch_id}")])
+        rows.append([InlineKeyboardButton(text=label, callback_data=cb.PostView(post_id=p.id).pack())])
+    pager = []
+    if cursor:
+        pager.append(InlineKeyboardButton(text="⏮ В начало", callback_data=cb.PostsList(ch_id=ch_id).pack()))
+    if next_cursor:
+        pager.append(InlineKeyboardButton(text="▶️", callback_data=cb.PostsList(ch_id=ch_id, cursor=next_cursor).pack()))
+    if pager:
+        rows.append(pager)
+    rows.append([InlineKeyboardButton(text="⬅️ Назад", callback_data=cb.OpenChannel(ch_id=ch_id).pack())])
     await safe_edit_message_text(cq.message, "Запланированные посты:", InlineKeyboardMarkup(inline_keyboard=rows))
     await cq.answer()
 
-@dp.callback_query(lambda c: c.data and c.data.startswith("post_view:"))
-async def cb_post_view(cq: types.CallbackQuery):
-    post_id = int(cq.data.split(":", 1)[1])
+async def last_error_text(p: Post) -> str:
+    """Текст последней ошибки отправки из журнала deliveries (или из last_status старых постов)."""
+    async with AsyncSessionLocal() as session:
+        res = await session.execute(
+            select(Delivery.error_code, Delivery.error_message)
+            .where(Delivery.post_id == p.id, Delivery.outcome == "error")
+            .order_by(Delivery.started_at.desc())
+            .limit(1)
+        )
+        row = res.first()
+    if row is None:
+        code, err = None, (p.last_status or "").removeprefix("error:")
+    else:
+        code, err = row.error_code, row.error_message or ""
+    if code == 403 or "not a member of the channel" in err.lower():
+        return "Бот не добавлен в канал как админ"
+    return err[:200]
+
+@callbacks.route(cb.PostView)
+async def cb_post_view(cq: types.CallbackQuery, callback_data: cb.PostView):
+    post_id = callback_data.post_id
     async with AsyncSessionLocal() as session:
         res = await session.execute(select(Post).where(Post.id == post_id))
         p = res.scalar_one_or_none()
@@ -239,21 +342,18 @@ async def cb_post_view(cq: types.CallbackQuery):
         await bot.send_message(chat_id=chat_id, text=p.text or "(пусто)", reply_markup=post_kb)
 
     manage = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🗑 Удалить", callback_data=f"post_del:{p.id}")],
-        [InlineKeyboardButton(text="⬅️ К списку", callback_data=f"posts_list:{p.channel_id}")],
+        [InlineKeyboardButton(text="🗑 Удалить", callback_data=cb.PostDelete(post_id=p.id).pack())],
+        [InlineKeyboardButton(text="⬅️ К списку", callback_data=cb.PostsList(ch_id=p.channel_id).pack())],
     ])
-    info = f"📅 {wd} в {p.time_text}\n⏰ Ближайшая отправка: {when}"
-    if (p.last_status or "").startswith("error"):
-        err = p.last_status[len("error:"):] if p.last_status.startswith("error:") else p.last_status
-        if "not a member of the channel" in err.lower() or "forbidden" in err.lower():
-            err = "Бот не добавлен в канал как админ"
-        info += f"\n⚠️ Ошибка отправки: {err[:200]}"
+    info = f"📅 {wd} в {p.time_text}, {recurrence_label(p.recurrence)}\n⏰ Ближайшая отправка: {when}"
+    if p.failed:
+        info += f"\n⚠️ Ошибка отправки: {await last_error_text(p)}"
     await bot.send_message(chat_id=chat_id, text=info, reply_markup=manage)
     await cq.answer()
 
-@dp.callback_query(lambda c: c.data and c.data.startswith("post_del:"))
-async def cb_post_del(cq: types.CallbackQuery):
-    post_id = int(cq.data.split(":", 1)[1])
+@callbacks.route(cb.PostDelete)
+async def cb_post_del(cq: types.CallbackQuery, callback_data: cb.PostDelete):
+    post_id = callback_data.post_id
     async with AsyncSessionLocal() as session:
         res = await session.execute(select(Post).where(Post.id == post_id))
         p = res.scalar_one_or_none()
@@ -263,51 +363,114 @@ async def cb_post_del(cq: types.CallbackQuery):
         ch_id = p.channel_id
         await session.delete(p)
         await session.commit()
+    try:
+        await unschedule_posts(redis, [post_id])
+    except Exception:
+        pass
     await cq.answer("Удалён")
-    cq.data = f"posts_list:{ch_id}"
-    await cb_posts_list(cq)
+    await cb_posts_list(cq, cb.PostsList(ch_id=ch_id))
 
-@dp.callback_query(lambda c: c.data and c.data.startswith("confirm_del_channel:"))
-async def cb_confirm_delete(cq: types.CallbackQuery):
-    ch_id = int(cq.data.split(":", 1)[1])
+@callbacks.route(cb.ConfirmDeleteChannel)
+async def cb_confirm_delete(cq: types.CallbackQuery, callback_data: cb.ConfirmDeleteChannel):
+    ch_id = callback_data.ch_id
     kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="✅ Да, удалить", callback_data=f"delete_channel:{ch_id}")],
-        [InlineKeyboardButton(text="↩️ Отмена", callback_data=f"open_channel:{ch_id}")],
+        [InlineKeyboardButton(text="✅ Да, удалить", callback_data=cb.DeleteChannel(ch_id=ch_id).pack())],
+        [InlineKeyboardButton(text="↩️ Отмена", callback_data=cb.OpenChannel(ch_id=ch_id).pack())],
     ])
     await safe_edit_message_text(cq.message, "Точно удалить канал? Это действие необратимо.", kb)
     await cq.answer()
 
-@dp.callback_query(lambda c: c.data and (c.data.startswith("delete_channel:") or c.data.startswith("del_channel:")))
-async def cb_delete_channel(cq: types.CallbackQuery):
-    ch_id = int(cq.data.split(":", 1)[1])
+@callbacks.route(cb.DeleteChannel, cb.DelChannel)
+async def cb_delete_channel(cq: types.CallbackQuery, callback_data: cb.DeleteChannel):
+    ch_id = callback_data.ch_id
+    ch = await get_channel(ch_id)
+    if not ch:
+        await cq.answer("Канал не найден", show_alert=True)
+        return
+    if ch.owner_id != cq.from_user.id:
+        await cq.answer("Удалять канал может только владелец", show_alert=True)
+        return
     async with AsyncSessionLocal() as session:
-        res = await session.execute(select(Channel).where(Channel.id == ch_id))
-        ch = res.scalar_one_or_none()
-        if not ch:
-            await cq.answer("Канал не найден", show_alert=True)
-            return
-        if ch.owner_id != cq.from_user.id:
-            await cq.answer("Удалять канал может только владелец", show_alert=True)
-            return
-        await session.delete(ch)
+        admins_res = await session.execute(select(ChannelAdmin.telegram_id).where(ChannelAdmin.channel_id == ch_id))
+        admin_ids = admins_res.scalars().all()
+        await session.execute(delete(Channel).where(Channel.id == ch_id, Channel.owner_id == cq.from_user.id))
         await session.commit()
+    await invalidate_channel(ch_id, [ch.owner_id, *admin_ids])
     await safe_edit_message_text(cq.message, "Канал удалён.")
     await cb_my_channels(cq)
 
+# ---------- цикл канала ----------
+
+CYCLE_WEEKS_CHOICES = (1, 2, 3, 4)
+
+@callbacks.route(cb.ChannelCycle)
+async def cb_channel_cycle(cq: types.CallbackQuery, callback_data: cb.ChannelCycle):
+    ch_id = callback_data.ch_id
+    ch = await get_channel(ch_id)
+    if not ch:
+        await cq.answer("Канал не найден", show_alert=True)
+        return
+    if ch.owner_id != cq.from_user.id:
+        await cq.answer("Менять цикл может только владелец", show_alert=True)
+        return
+    rows = [[
+        InlineKeyboardButton(
+            text=("✅ " if w == (ch.cycle_weeks or 1) else "") + ("нет" if w == 1 else f"{w} нед."),
+            callback_data=cb.SetChannelCycle(ch_id=ch_id, weeks=w).pack(),
+        )
+        for w in CYCLE_WEEKS_CHOICES
+    ]]
+    rows.append([InlineKeyboardButton(text="⬅️ Назад", callback_data=cb.OpenChannel(ch_id=ch_id).pack())])
+    await safe_edit_message_text(
+        cq.message,
+        f"Цикл канала: {cycle_label(ch.cycle_weeks)}\n"
+        "С циклом в мастере нового поста появится повтор «раз в N недель».",
+        InlineKeyboardMarkup(inline_keyboard=rows),
+    )
+    await cq.answer()
+
+@callbacks.route(cb.SetChannelCycle)
+async def cb_set_channel_cycle(cq: types.CallbackQuery, callback_data: cb.SetChannelCycle):
+    ch_id, weeks = callback_data.ch_id, callback_data.weeks
+    ch = await get_channel(ch_id)
+    if not ch:
+        await cq.answer("Канал не найден", show_alert=True)
+        return
+    if ch.owner_id != cq.from_user.id:
+        await cq.answer("Менять цикл может только владелец", show_alert=True)
+        return
+    cycle_start = ch.cycle_start or datetime.utcnow().replace(tzinfo=ZoneInfo("UTC"))
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            update(Channel).where(Channel.id == ch_id).values(cycle_weeks=weeks, cycle_start=cycle_start)
+        )
+        # посты «раз в N недель» сохраняют ближайшую отправку, неделя цикла — по ней
+        res = await session.execute(
+            select(Post.id, Post.next_run).where(Post.channel_id == ch_id, Post.recurrence == "cycle", Post.next_run != None)
+        )
+        rows = [{"id": pid, "week_in_cycle": week_in_cycle_for(nr, weeks, cycle_start)} for pid, nr in res.all()]
+        if rows:
+            await session.execute(update(Post), rows)
+        admins_res = await session.execute(select(ChannelAdmin.telegram_id).where(ChannelAdmin.channel_id == ch_id))
+        admin_ids = admins_res.scalars().all()
+        await session.commit()
+    await invalidate_channel(ch_id, [ch.owner_id, *admin_ids])
+    await cq.answer(f"Цикл: {cycle_label(weeks)}")
+    await cb_open_channel(cq, cb.OpenChannel(ch_id=ch_id))
+
 # ---------- админы ----------
 
-@dp.callback_query(lambda c: c.data and c.data.startswith("manage_admins:"))
-async def cb_manage_admins(cq: types.CallbackQuery, state: FSMContext):
-    ch_id = int(cq.data.split(":", 1)[1])
+@callbacks.route(cb.ManageAdmins)
+async def cb_manage_admins(cq: types.CallbackQuery, callback_data: cb.ManageAdmins):
+    ch_id = callback_data.ch_id
+    ch = await get_channel(ch_id)
+    if not ch:
+        await cq.answer("Канал не найден", show_alert=True)
+        return
+    if ch.owner_id != cq.from_user.id:
+        await cq.answer("Управлять администраторами может только владелец", show_alert=True)
+        return
     async with AsyncSessionLocal() as session:
-        res = await session.execute(select(Channel).where(Channel.id == ch_id))
-        ch = res.scalar_one_or_none()
-        if not ch:
-            await cq.answer("Канал не найден", show_alert=True)
-            return
-        if ch.owner_id != cq.from_user.id:
-            await cq.answer("Управлять администраторами может только владелец", show_alert=True)
-            return
         admins_res = await session.execute(select(ChannelAdmin).where(ChannelAdmin.channel_id == ch_id))
         admins = admins_res.scalars().all()
         title = channel_display_name(ch)
@@ -316,20 +479,20 @@ async def cb_manage_admins(cq: types.CallbackQuery, state: FSMContext):
         if admins:
             for a in admins:
                 lines.append(f"• {a.telegram_id}")
-                rows.append([InlineKeyboardButton(text=f"❌ Удалить {a.telegram_id}", callback_data=f"remove_admin:{ch_id}:{a.telegram_id}")])
+                rows.append([InlineKeyboardButton(text=f"❌ Удалить {a.telegram_id}", callback_data=cb.RemoveAdmin(ch_id=ch_id, telegram_id=a.telegram_id).pack())])
         else:
             lines.append("Пока никого нет.")
-        rows.append([InlineKeyboardButton(text="➕ Добавить", callback_data=f"add_admin:{ch_id}")])
-        rows.append([InlineKeyboardButton(text="⬅️ Назад", callback_data=f"open_channel:{ch_id}")])
+        rows.append([InlineKeyboardButton(text="➕ Добавить", callback_data=cb.AddAdmin(ch_id=ch_id).pack())])
+        rows.append([InlineKeyboardButton(text="⬅️ Назад", callback_data=cb.OpenChannel(ch_id=ch_id).pack())])
         await safe_edit_message_text(cq.message, "\n".join(lines), InlineKeyboardMarkup(inline_keyboard=rows))
     await cq.answer()
 
-@dp.callback_query(lambda c: c.data and c.data.startswith("add_admin:"))
-async def cb_add_admin(cq: types.CallbackQuery, state: FSMContext):
-    ch_id = int(cq.data.split(":", 1)[1])
+@callbacks.route(cb.AddAdmin)
+async def cb_add_admin(cq: types.CallbackQuery, callback_data: cb.AddAdmin, state: FSMContext):
+    ch_id = callback_data.ch_id
     await state.set_state(ManageAdmins.wait_input)
     await state.update_data(admin_channel_id=ch_id)
-    kb = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="↩️ Отмена", callback_data=f"manage_admins:{ch_id}")]])
+    kb = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="↩️ Отмена", callback_data=cb.ManageAdmins(ch_id=ch_id).pack())]])
     await safe_edit_message_text(cq.message, "Пришли Telegram ID, @username или перешли сообщение от нужного пользователя.", kb)
     await cq.answer()
 
@@ -361,21 +524,20 @@ async def on_admin_input(message: types.Message, state: FSMContext):
     if not new_admin_id:
         await message.answer("Не удалось определить пользователя. Пришли @username, ID или перешли сообщение.")
         return
+    ch = await get_channel(ch_id)
+    if not ch:
+        await state.clear()
+        await message.answer("Канал не найден.")
+        return
+    if ch.owner_id != message.from_user.id:
+        await state.clear()
+        await message.answer("Добавлять админов может только владелец.")
+        return
+    if new_admin_id == ch.owner_id:
+        await message.answer("Владелец уже имеет полный доступ.")
+        return
+    await ensure_user(new_admin_id)
     async with AsyncSessionLocal() as session:
-        res = await session.execute(select(Channel).where(Channel.id == ch_id))
-        ch = res.scalar_one_or_none()
-        if not ch:
-            await state.clear()
-            await message.answer("Канал не найден.")
-            return
-        if ch.owner_id != message.from_user.id:
-            await state.clear()
-            await message.answer("Добавлять админов может только владелец.")
-            return
-        if new_admin_id == ch.owner_id:
-            await message.answer("Владелец уже имеет полный доступ.")
-            return
-        await ensure_user(new_admin_id)
         exists_res = await session.execute(
             select(ChannelAdmin).where(ChannelAdmin.channel_id == ch_id, ChannelAdmin.telegram_id == new_admin_id)
         )
@@ -384,24 +546,21 @@ async def on_admin_input(message: types.Message, state: FSMContext):
         else:
             session.add(ChannelAdmin(channel_id=ch_id, telegram_id=new_admin_id))
             await session.commit()
+            await invalidate_users(new_admin_id)
             await message.answer("Администратор добавлен.")
     await state.clear()
 
-@dp.callback_query(lambda c: c.data and c.data.startswith("remove_admin:"))
-async def cb_remove_admin(cq: types.CallbackQuery, state: FSMContext):
-    _, rest = cq.data.split(":", 1)
-    ch_id_str, tg_id_str = rest.split(":", 1)
-    ch_id = int(ch_id_str)
-    tg_id = int(tg_id_str)
+@callbacks.route(cb.RemoveAdmin)
+async def cb_remove_admin(cq: types.CallbackQuery, callback_data: cb.RemoveAdmin):
+    ch_id, tg_id = callback_data.ch_id, callback_data.telegram_id
+    ch = await get_channel(ch_id)
+    if not ch:
+        await cq.answer("Канал не найден", show_alert=True)
+        return
+    if ch.owner_id != cq.from_user.id:
+        await cq.answer("Удалять админов может только владелец", show_alert=True)
+        return
     async with AsyncSessionLocal() as session:
-        res = await session.execute(select(Channel).where(Channel.id == ch_id))
-        ch = res.scalar_one_or_none()
-        if not ch:
-            await cq.answer("Канал не найден", show_alert=True)
-            return
-        if ch.owner_id != cq.from_user.id:
-            await cq.answer("Удалять админов может только владелец", show_alert=True)
-            return
         adm_res = await session.execute(select(ChannelAdmin).where(ChannelAdmin.channel_id == ch_id, ChannelAdmin.telegram_id == tg_id))
         adm = adm_res.scalar_one_or_none()
         if not adm:
@@ -409,9 +568,9 @@ async def cb_remove_admin(cq: types.CallbackQuery, state: FSMContext):
             return
         await session.delete(adm)
         await session.commit()
+    await invalidate_users(tg_id)
     await cq.answer("Удалён")
-    cq.data = f"manage_admins:{ch_id}"
-    await cb_manage_admins(cq, state)
+    await cb_manage_admins(cq, cb.ManageAdmins(ch_id=ch_id))
 
 # ---------- захват пересланного канала / @username вне FSM ----------
 
@@ -426,6 +585,7 @@ async def _handle_channel_input(message: types.Message) -> bool:
                 new = Channel(chat_id=ch.id, username=ch.username, title=ch.title or ch.username, owner_id=message.from_user.id)
                 session.add(new)
                 await session.commit()
+                await invalidate_users(message.from_user.id)
                 await message.reply(f"Канал {ch.title} добавлен и ты назначен владельцем.", reply_markup=main_menu_kb())
             else:
                 await message.reply("Канал уже добавлен.")
@@ -442,6 +602,7 @@ async def _handle_channel_input(message: types.Message) -> bool:
                     new = Channel(chat_id=info.id, username=info.username, title=info.title or info.username, owner_id=message.from_user.id)
                     session.add(new)
                     await session.commit()
+                    await invalidate_users(message.from_user.id)
                     await message.reply(f"Канал {info.title} добавлен.", reply_markup=main_menu_kb())
                 else:
                     await message.reply("Канал уже добавлен.")
@@ -452,59 +613,50 @@ async def _handle_channel_input(message: types.Message) -> bool:
 
 # ---------- создание поста: канал ----------
 
-@dp.callback_query(lambda c: c.data == "new_post")
-async def cb_new_post(cq: types.CallbackQuery, state: FSMContext):
+@callbacks.route(cb.NewPost)
+async def cb_new_post(cq: types.CallbackQuery, callback_data: cb.NewPost, state: FSMContext):
     await state.clear()
     await ensure_user(cq.from_user.id, cq.from_user.full_name)
-    async with AsyncSessionLocal() as session:
-        owner_res = await session.execute(select(Channel).where(Channel.owner_id == cq.from_user.id))
-        owner_channels = owner_res.scalars().all()
-        admin_res = await session.execute(
-            select(Channel).join(ChannelAdmin, ChannelAdmin.channel_id == Channel.id)
-            .where(ChannelAdmin.telegram_id == cq.from_user.id)
-        )
-        admin_channels = admin_res.scalars().all()
-        seen, channels = set(), []
-        for ch in owner_channels + admin_channels:
-            if ch.id not in seen:
-                seen.add(ch.id)
-                channels.append(ch)
+    channels, prev, next_ = await user_channels_page(cq.from_user.id, after=callback_data.after, before=callback_data.before)
     if not channels:
         await cq.answer("Нет доступных каналов", show_alert=True)
         return
-    rows = [[InlineKeyboardButton(text=channel_display_name(ch), callback_data=f"np_ch:{ch.id}")] for ch in channels]
-    rows.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="back_start")])
+    rows = [[InlineKeyboardButton(text=channel_display_name(ch), callback_data=cb.NpChannel(ch_id=ch.id).pack())] for ch in channels]
+    if prev is not None or next_ is not None:
+        rows.append(pager_row(cb.NewPost, prev, next_))
+    rows.append([InlineKeyboardButton(text="⬅️ Назад", callback_data=cb.BackStart().pack())])
     await state.set_state(NewPost.choose_channel)
     await safe_edit_message_text(cq.message, "1️⃣ Выбери канал:", InlineKeyboardMarkup(inline_keyboard=rows))
     await cq.answer()
 
 # ---------- создание поста: день недели ----------
 
-@dp.callback_query(lambda c: c.data and c.data.startswith("np_ch:"), StateFilter(NewPost.choose_channel))
-async def np_choose_channel(cq: types.CallbackQuery, state: FSMContext):
-    ch_id = int(cq.data.split(":", 1)[1])
-    await state.update_data(ch_id=ch_id)
+@callbacks.route(cb.NpChannel, states=(NewPost.choose_channel,))
+async def np_choose_channel(cq: types.CallbackQuery, callback_data: cb.NpChannel, state: FSMContext):
+    await state.update_data(ch_id=callback_data.ch_id)
     await _show_weekday_menu(cq.message, state)
     await cq.answer()
 
 async def _show_weekday_menu(message: types.Message, state: FSMContext):
-    rows = [[InlineKeyboardButton(text=WEEKDAYS_FULL[i], callback_data=f"np_wd:{i}")] for i in range(7)]
-    rows.append([InlineKeyboardButton(text="⬅️ Каналы", callback_data="new_post")])
+    rows = [[InlineKeyboardButton(text=WEEKDAYS_FULL[i], callback_data=cb.NpWeekday(weekday=i).pack())] for i in range(7)]
+    rows.append([InlineKeyboardButton(text="⬅️ Каналы", callback_data=cb.NewPost().pack())])
     await state.set_state(NewPost.choose_weekday)
     await safe_edit_message_text(message, "2️⃣ Выбери день недели:", InlineKeyboardMarkup(inline_keyboard=rows))
 
 # ---------- создание поста: время ----------
 
-@dp.callback_query(lambda c: c.data and c.data.startswith("np_wd:"), StateFilter(NewPost.choose_weekday))
-async def np_choose_weekday(cq: types.CallbackQuery, state: FSMContext):
-    wd = int(cq.data.split(":", 1)[1])
+@callbacks.route(cb.NpWeekday, states=(NewPost.choose_weekday,))
+async def np_choose_weekday(cq: types.CallbackQuery, callback_data: cb.NpWeekday, state: FSMContext):
+    wd = callback_data.weekday
     await state.update_data(weekday=wd)
-    kb = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="⬅️ Назад", callback_data="np_back_to_wd")]])
+    kb = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="⬅️ Назад", callback_data=cb.NpBackToWeekday().pack())]])
     await state.set_state(NewPost.choose_time)
     await safe_edit_message_text(cq.message, f"3️⃣ {WEEKDAYS_FULL[wd]}\nВведи время в формате HH:MM (МСК):", kb)
     await cq.answer()
 
-@dp.callback_query(lambda c: c.data == "np_back_to_wd", StateFilter(NewPost.choose_time, NewPost.input_content, NewPost.ask_button, NewPost.input_button, NewPost.preview))
+@callbacks.route(cb.NpBackToWeekday, states=(
+    NewPost.choose_time, NewPost.choose_repeat, NewPost.input_content, NewPost.ask_button, NewPost.input_button, NewPost.preview,
+))
 async def np_back_to_wd(cq: types.CallbackQuery, state: FSMContext):
     await _show_weekday_menu(cq.message, state)
     await cq.answer()
@@ -519,39 +671,59 @@ async def np_input_time(message: types.Message, state: FSMContext):
         await message.answer("Неверный формат. Введи HH:MM")
         return
     await state.update_data(time_text=f"{hh:02d}:{mm:02d}")
+    data = await state.get_data()
+    ch = await get_channel(data.get("ch_id"))
+    cycle_weeks = ch.cycle_weeks if ch else 1
+    rows = [
+        [InlineKeyboardButton(text="Однократно", callback_data=cb.NpRepeat(rep="once").pack())],
+        [InlineKeyboardButton(text="Каждую неделю", callback_data=cb.NpRepeat(rep="weekly").pack())],
+    ]
+    if cycle_weeks > 1:
+        rows.append([InlineKeyboardButton(text=f"Раз в {cycle_weeks} нед.", callback_data=cb.NpRepeat(rep="cycle").pack())])
+    rows.append([InlineKeyboardButton(text="Раз в месяц", callback_data=cb.NpRepeat(rep="monthly").pack())])
+    rows.append([InlineKeyboardButton(text="⬅️ Назад", callback_data=cb.NpBackToWeekday().pack())])
+    await state.set_state(NewPost.choose_repeat)
+    await message.answer("🔁 Как часто публиковать?", reply_markup=InlineKeyboardMarkup(inline_keyboard=rows))
+
+@callbacks.route(cb.NpRepeat, states=(NewPost.choose_repeat,))
+async def np_choose_repeat(cq: types.CallbackQuery, callback_data: cb.NpRepeat, state: FSMContext):
+    rep = callback_data.rep
+    await state.update_data(recurrence=None if rep == "once" else rep)
     await state.set_state(NewPost.input_content)
-    await message.answer(
+    await safe_edit_message_text(
+        cq.message,
         "4️⃣ Пришли пост одним сообщением: текст и/или фото/видео/документ.\n"
         "Поддерживаются альбомы и premium-эмодзи (всё форматирование сохранится).",
     )
+    await cq.answer()
 
 # ---------- создание поста: контент (одно сообщение или альбом) ----------
 
-# Буфер для сборки альбомов: media_group_id -> {"chat_id":int, "ids":[message_id], "user_id":int, "task":Task}
-_album_buffer: dict[str, dict] = {}
-_album_lock = asyncio.Lock()
+async def _on_album(chat_id: int, user_id: int, ids: list[int]):
+    # альбом может собрать другая реплика, поэтому FSMContext восстанавливаем по ключу
+    state = FSMContext(storage=dp.storage, key=StorageKey(bot_id=bot.id, chat_id=chat_id, user_id=user_id))
+    await state.update_data(
+        src_chat_id=chat_id,
+        src_message_id=None,
+        src_message_ids=ids,
+        text=None,
+        text_entities=None,
+        media_type=None,
+        media_file_id=None,
+        media_group=None,
+    )
+    fake = await bot.send_message(chat_id=chat_id, text=f"📸 Альбом из {len(ids)} элемент(ов) принят.")
+    await _show_buttons_menu(fake, state)
+
+# Сборщик альбомов: redis — части с разных реплик собираются вместе; memory — в процессе
+ALBUM_BACKEND = os.getenv("ALBUM_BACKEND", FSM_STORAGE)
+albums = RedisAlbumCollector(redis, _on_album) if ALBUM_BACKEND == "redis" else MemoryAlbumCollector(_on_album)
 
 @dp.message(StateFilter(NewPost.input_content))
 async def np_input_content(message: types.Message, state: FSMContext):
     # Альбом — собираем все message_id с одинаковым media_group_id
     if message.media_group_id:
-        mgid = message.media_group_id
-        async with _album_lock:
-            entry = _album_buffer.get(mgid)
-            if not entry:
-                entry = {
-                    "chat_id": message.chat.id,
-                    "ids": [],
-                    "user_id": message.from_user.id,
-                    "state": state,
-                    "task": None,
-                }
-                _album_buffer[mgid] = entry
-            entry["ids"].append(message.message_id)
-            # перезапускаем таймер ожидания (1.5с после последнего сообщения)
-            if entry["task"]:
-                entry["task"].cancel()
-            entry["task"] = asyncio.create_task(_finalize_album(mgid))
+        await albums.add(message.media_group_id, message.chat.id, message.from_user.id, message.message_id)
         return
 
     # Одиночное сообщение: текст или медиа+caption
@@ -570,56 +742,32 @@ async def np_input_content(message: types.Message, state: FSMContext):
     )
     await _show_buttons_menu(message, state)
 
-async def _finalize_album(mgid: str):
-    try:
-        await asyncio.sleep(1.5)
-    except asyncio.CancelledError:
-        return
-    async with _album_lock:
-        entry = _album_buffer.pop(mgid, None)
-    if not entry:
-        return
-    state: FSMContext = entry["state"]
-    ids = sorted(entry["ids"])
-    await state.update_data(
-        src_chat_id=entry["chat_id"],
-        src_message_id=None,
-        src_message_ids=ids,
-        text=None,
-        text_entities=None,
-        media_type=None,
-        media_file_id=None,
-        media_group=None,
-    )
-    fake = await bot.send_message(chat_id=entry["chat_id"], text=f"📸 Альбом из {len(ids)} элемент(ов) принят.")
-    await _show_buttons_menu(fake, state)
-
 # ---------- создание поста: кнопки ----------
 
 async def _show_buttons_menu(message: types.Message, state: FSMContext):
     await state.set_state(NewPost.ask_button)
     data = await state.get_data()
     buttons = data.get("buttons") or []
-    rows = [[InlineKeyboardButton(text="➕ Добавить кнопку", callback_data="np_btn_add")]]
+    rows = [[InlineKeyboardButton(text="➕ Добавить кнопку", callback_data=cb.NpButtonAdd().pack())]]
     if buttons:
         for i, b in enumerate(buttons):
-            rows.append([InlineKeyboardButton(text=f"❌ {b.get('text','')[:30]}", callback_data=f"np_btn_del:{i}")])
-        rows.append([InlineKeyboardButton(text="✅ Готово", callback_data="np_btn_done")])
+            rows.append([InlineKeyboardButton(text=f"❌ {b.get('text','')[:30]}", callback_data=cb.NpButtonDelete(idx=i).pack())])
+        rows.append([InlineKeyboardButton(text="✅ Готово", callback_data=cb.NpButtonsDone().pack())])
     else:
-        rows.append([InlineKeyboardButton(text="Пропустить", callback_data="np_btn_done")])
-    rows.append([InlineKeyboardButton(text="⬅️ Назад", callback_data="np_back_to_wd")])
+        rows.append([InlineKeyboardButton(text="Пропустить", callback_data=cb.NpButtonsDone().pack())])
+    rows.append([InlineKeyboardButton(text="⬅️ Назад", callback_data=cb.NpBackToWeekday().pack())])
     text = "5️⃣ Кнопки поста:\n" + ("\n".join([f"• {b.get('text','')} → {b.get('url','')}" for b in buttons]) if buttons else "пока нет")
     await message.answer(text, reply_markup=InlineKeyboardMarkup(inline_keyboard=rows))
 
-@dp.callback_query(lambda c: c.data == "np_btn_add", StateFilter(NewPost.ask_button))
+@callbacks.route(cb.NpButtonAdd, states=(NewPost.ask_button,))
 async def np_btn_add(cq: types.CallbackQuery, state: FSMContext):
     await state.set_state(NewPost.input_button)
     await safe_edit_message_text(cq.message, "Пришли текст кнопки и ссылку через перенос строки:\nТекст\nhttps://example.com")
     await cq.answer()
 
-@dp.callback_query(lambda c: c.data and c.data.startswith("np_btn_del:"), StateFilter(NewPost.ask_button))
-async def np_btn_del(cq: types.CallbackQuery, state: FSMContext):
-    idx = int(cq.data.split(":", 1)[1])
+@callbacks.route(cb.NpButtonDelete, states=(NewPost.ask_button,))
+async def np_btn_del(cq: types.CallbackQuery, callback_data: cb.NpButtonDelete, state: FSMContext):
+    idx = callback_data.idx
     data = await state.get_data()
     buttons = data.get("buttons") or []
     if 0 <= idx < len(buttons):
@@ -632,7 +780,7 @@ async def np_btn_del(cq: types.CallbackQuery, state: FSMContext):
     await _show_buttons_menu(cq.message, state)
     await cq.answer("Кнопка удалена")
 
-@dp.callback_query(lambda c: c.data == "np_btn_done", StateFilter(NewPost.ask_button))
+@callbacks.route(cb.NpButtonsDone, states=(NewPost.ask_button,))
 async def np_btn_done(cq: types.CallbackQuery, state: FSMContext):
     await cq.answer()
     await state.set_state(NewPost.preview)
@@ -684,19 +832,19 @@ async def send_post_preview(message: types.Message, state: FSMContext):
     # сводка времени
     weekday = data.get("weekday")
     time_text = data.get("time_text")
-    summary = f"📅 {WEEKDAYS_FULL[weekday]} в {time_text} (МСК)"
+    summary = f"📅 {WEEKDAYS_FULL[weekday]} в {time_text} (МСК), {recurrence_label(data.get('recurrence'))}"
     confirm_kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="✅ Сохранить", callback_data="np_preview_save")],
-        [InlineKeyboardButton(text="↩️ Назад", callback_data="np_preview_back")],
+        [InlineKeyboardButton(text="✅ Сохранить", callback_data=cb.NpPreviewSave().pack())],
+        [InlineKeyboardButton(text="↩️ Назад", callback_data=cb.NpPreviewBack().pack())],
     ])
     await bot.send_message(chat_id=message.chat.id, text=f"6️⃣ Предпросмотр\n{summary}\n\nСохранить пост?", reply_markup=confirm_kb)
 
-@dp.callback_query(lambda c: c.data == "np_preview_save", StateFilter(NewPost.preview))
+@callbacks.route(cb.NpPreviewSave, states=(NewPost.preview,))
 async def np_preview_save(cq: types.CallbackQuery, state: FSMContext):
     await finalize_post(cq.message, state)
     await cq.answer()
 
-@dp.callback_query(lambda c: c.data == "np_preview_back", StateFilter(NewPost.preview))
+@callbacks.route(cb.NpPreviewBack, states=(NewPost.preview,))
 async def np_preview_back(cq: types.CallbackQuery, state: FSMContext):
     await _show_buttons_menu(cq.message, state)
     await cq.answer()
@@ -711,17 +859,24 @@ async def finalize_post(message: types.Message, state: FSMContext):
     src_message_id = data.get("src_message_id")
     src_message_ids = data.get("src_message_ids")
     buttons = data.get("buttons") or None
+    recurrence = data.get("recurrence")
 
+    ch = await get_channel(ch_id)
+    if not ch:
+        await state.clear()
+        await message.answer("Канал не найден")
+        return
     async with AsyncSessionLocal() as session:
-        res = await session.execute(select(Channel).where(Channel.id == ch_id))
-        ch = res.scalar_one_or_none()
-        if not ch:
-            await state.clear()
-            await message.answer("Канал не найден")
-            return
         hh, mm = map(int, time_text.split(":"))
         now_utc = datetime.utcnow().replace(tzinfo=ZoneInfo("UTC"))
         next_run = compute_next_weekday_time_tz(now_utc, weekday, dtime(hh, mm), "Europe/Moscow")
+        # цикл «раз в N недель»: первая отправка задаёт неделю цикла
+        week_in_cycle = None
+        if recurrence == "cycle":
+            if (ch.cycle_weeks or 1) > 1 and ch.cycle_start:
+                week_in_cycle = week_in_cycle_for(next_run, ch.cycle_weeks, ch.cycle_start)
+            else:
+                recurrence = "weekly"
 
         editing_post_id = data.get("editing_post_id")
         if editing_post_id:
@@ -738,13 +893,17 @@ async def finalize_post(message: types.Message, state: FSMContext):
             existing.buttons = buttons
             existing.time_text = time_text
             existing.weekday = weekday
-            existing.week_in_cycle = None
+            existing.week_in_cycle = week_in_cycle
+            existing.recurrence = recurrence
             existing.next_run = next_run
             # сбрасываем legacy-поля
             existing.media_type = None
             existing.media_file_id = None
             existing.media_group = None
             existing.text_entities = None
+            existing.failed = False
+            existing.attempts = 0
+            post = existing
         else:
             post = Post(
                 channel_id=ch_id,
@@ -756,17 +915,39 @@ async def finalize_post(message: types.Message, state: FSMContext):
                 next_run=next_run,
                 weekday=weekday,
                 time_text=time_text,
+                week_in_cycle=week_in_cycle,
+                recurrence=recurrence,
                 created_by=message.from_user.id,
             )
             session.add(post)
+        # план отправки собираем и проверяем сейчас, а не в момент публикации;
+        # контекст трассировки уходит в план, чтобы span отправки сослался на этот
+        with metrics.span("finalize_post", {"channel.id": ch_id}):
+            post.send_plan = build_send_plan(post)
+            trace = metrics.trace_carrier()
+            if trace:
+                post.send_plan["trace"] = trace
+        plan_error = validate_send_plan(post.send_plan)
+        if plan_error:
+            await session.rollback()
+            await message.answer(f"⚠️ Пост не сохранён: Telegram его не примет.\n{plan_error[:300]}")
+            return
         await session.commit()
+    # будим планировщик; если Redis недоступен, пост подхватит страховочный опрос beat
+    try:
+        await schedule_posts(redis, [(post.id, next_run)])
+    except Exception:
+        pass
     await state.clear()
     end_kb = InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="➕ Новый пост", callback_data="new_post")],
-        [InlineKeyboardButton(text="📚 Мои каналы", callback_data="my_channels")],
-        [InlineKeyboardButton(text="⬅️ В меню", callback_data="back_start")],
+        [InlineKeyboardButton(text="➕ Новый пост", callback_data=cb.NewPost().pack())],
+        [InlineKeyboardButton(text="📚 Мои каналы", callback_data=cb.MyChannels().pack())],
+        [InlineKeyboardButton(text="⬅️ В меню", callback_data=cb.BackStart().pack())],
     ])
-    await message.answer(f"✅ Пост сохранён.\n📅 {WEEKDAYS_FULL[weekday]} в {time_text} (МСК)", reply_markup=end_kb)
+    await message.answer(
+        f"✅ Пост сохранён.\n📅 {WEEKDAYS_FULL[weekday]} в {time_text} (МСК), {recurrence_label(recurrence, ch.cycle_weeks)}",
+        reply_markup=end_kb,
+    )
 
 # ---------- ловушка вне FSM: пересланный канал / @username ----------
 
@@ -779,10 +960,29 @@ async def catch_outside_fsm(message: types.Message, state: FSMContext):
 
 # ---------- entry point ----------
 
+def webhook_path() -> str:
+    return f"/tg/webhook/{WEBHOOK_SECRET}"
+
+async def setup_webhook():
+    await bot.set_webhook(
+        url=WEBHOOK_BASE_URL.rstrip("/") + webhook_path(),
+        secret_token=WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+
 async def main():
+    if BOT_MODE == "webhook":
+        # апдейты принимает app.api (uvicorn); здесь один раз регистрируем webhook и выходим
+        print("Bot in webhook mode, updates are served by app.api")
+        await setup_webhook()
+        await bot.session.close()
+        return
     print("Starting bot...")
-    await init_db()
-    await dp.start_polling(bot)
+    metrics.serve()
+    await check_schema()
+    await bot.delete_webhook()
+    # с очередью апдейтов поллер ждёт постановки в неё: так работает backpressure
+    await dp.start_polling(bot, handle_as_tasks=update_queue is None)
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,171 @@
+# app/metrics.py
+# Метрики Prometheus для бота, API, планировщика и воркеров и (опционально) трассировка
+# OpenTelemetry от finalize_post до отправки.
+#
+# Сбор:
+#   app.api           — GET /metrics;
+#   бот (polling), планировщик — свой HTTP-порт METRICS_PORT, если задан;
+#   Celery-воркеры    — PROMETHEUS_MULTIPROC_DIR (общий каталог, читает /metrics на том же
+#                       хосте) или PROMETHEUS_PUSHGATEWAY (push после каждой задачи).
+# Трассировка включается OTEL_ENABLED=1 при установленном opentelemetry-sdk; контекст
+# finalize_post сохраняется в плане отправки и связывается ссылкой со span отправки.
+import os
+import time
+import socket
+import logging
+from contextlib import contextmanager
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, push_to_gateway,
+    start_http_server, REGISTRY,
+)
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+PROMETHEUS_PUSHGATEWAY = os.getenv("PROMETHEUS_PUSHGATEWAY")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+OTEL_ENABLED = os.getenv("OTEL_ENABLED", "0") == "1"
+
+_LAG_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 900)
+_FAST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# ---------- отправка ----------
+SEND_LAG = Histogram("autopost_send_lag_seconds", "now - next_run at the start of a send", buckets=_LAG_BUCKETS)
+DELIVERIES = Counter("autopost_deliveries_total", "Send outcomes", ["outcome", "reason"])
+API_LATENCY = Histogram("autopost_telegram_api_seconds", "Bot API call latency", ["method"], buckets=_FAST_BUCKETS)
+API_ERRORS = Counter("autopost_telegram_api_errors_total", "Bot API errors", ["method", "error"])
+CLAIM_SECONDS = Histogram("autopost_claim_seconds", "Duration of the due-posts claim UPDATE", buckets=_FAST_BUCKETS)
+CLAIMED = Counter("autopost_claimed_posts_total", "Posts claimed for sending")
+CLAIM_FULL = Counter("autopost_claim_full_batches_total", "Claims that hit the batch limit (backlog)")
+RATE_LIMITED = Counter("autopost_rate_limited_total", "Sends deferred by the local rate limiter")
+
+# ---------- БД, бот, API, планировщик ----------
+DB_QUERY = Histogram("autopost_db_query_seconds", "SQL statement duration", ["statement"], buckets=_FAST_BUCKETS)
+HANDLER = Histogram("autopost_bot_handler_seconds", "aiogram handler duration", ["handler"], buckets=_FAST_BUCKETS)
+UPDATES_PENDING = Gauge("autopost_bot_updates_pending", "Bot updates queued or in progress", multiprocess_mode="livesum")
+UPDATE_WAIT = Histogram("autopost_bot_update_wait_seconds", "Time a bot update waited in the queue", buckets=_FAST_BUCKETS)
+ALBUM_AGGREGATION = Histogram(
+    "autopost_album_aggregation_seconds", "Time from the first album part to its finalization",
+    buckets=(0.25, 0.5, 1, 1.5, 2, 3, 5, 10, 30),
+)
+HTTP = Histogram("autopost_http_request_seconds", "FastAPI request duration", ["method", "route", "status"], buckets=_FAST_BUCKETS)
+SCHEDULER_DISPATCHED = Counter("autopost_scheduler_dispatched_total", "Due posts handed to enqueue_due_posts")
+
+@contextmanager
+def api_call(method: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        API_ERRORS.labels(method, type(e).__name__).inc()
+        raise
+    finally:
+        API_LATENCY.labels(method).observe(time.perf_counter() - t0)
+
+def observe_outcome(o: dict):
+    """Итог deliver(): ok / deferred (rate_limited, retry_after) / stale (захват потерян) / error (класс исключения)."""
+    if o["ok"]:
+        kind, reason = "ok", ""
+    elif o["last_status"] in ("deferred", "stale"):
+        kind, reason = o["last_status"], o.get("reason") or ""
+    else:
+        kind, reason = "error", (o.get("delivery") or {}).get("error_class") or ""
+    DELIVERIES.labels(kind, reason).inc()
+
+class HandlerTimingMiddleware:
+    """Inner-middleware aiogram: время обработчика по имени функции."""
+    async def __call__(self, handler, event, data):
+        # колбэки идут через один обработчик app.callbacks — имя маршрута он кладёт в data
+        name = data.get("handler_name") or getattr(getattr(data.get("handler"), "callback", None), "__name__", "unknown")
+        t0 = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            HANDLER.labels(name).observe(time.perf_counter() - t0)
+
+# ---------- SQLAlchemy ----------
+
+def instrument_engine(engine):
+    """Время каждого SQL-запроса по типу (SELECT/UPDATE/...)."""
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("_query_t0", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        stack = conn.info.get("_query_t0")
+        if stack:
+            verb = statement.lstrip().split(None, 1)[0].upper() if statement else "?"
+            DB_QUERY.labels(verb).observe(time.perf_counter() - stack.pop())
+
+# ---------- экспорт ----------
+
+def _registry():
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+def render() -> tuple[bytes, str]:
+    return generate_latest(_registry()), CONTENT_TYPE_LATEST
+
+def serve(port: int = METRICS_PORT) -> bool:
+    """HTTP-эндпоинт метрик для процессов без FastAPI (бот в polling, планировщик)."""
+    if not port:
+        return False
+    start_http_server(port, registry=_registry())
+    logger.info(f"metrics: serving on :{port}")
+    return True
+
+def process_exit(pid: int | None = None):
+    """Multiprocess-режим: убрать живые gauge завершившегося процесса."""
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(pid or os.getpid())
+
+def push(job: str):
+    """Отправить метрики процесса в Pushgateway (воркеры Celery)."""
+    if not PROMETHEUS_PUSHGATEWAY or PROMETHEUS_MULTIPROC_DIR:
+        return
+    try:
+        push_to_gateway(PROMETHEUS_PUSHGATEWAY, job=job, registry=REGISTRY,
+                        grouping_key={"instance": f"{socket.gethostname()}:{os.getpid()}"})
+    except Exception as e:
+        logger.warning(f"metrics: push to {PROMETHEUS_PUSHGATEWAY} failed: {e}")
+
+# ---------- трассировка (опционально) ----------
+
+_tracer = None
+if OTEL_ENABLED:
+    try:
+        from opentelemetry import trace, propagate
+        _tracer = trace.get_tracer("autopost")
+    except ImportError:
+        logger.warning("metrics: OTEL_ENABLED=1, but opentelemetry is not installed")
+
+@contextmanager
+def span(name: str, attributes: dict | None = None, link: dict | None = None):
+    """Span OpenTelemetry (или ничего без OTel). link — carrier из trace_carrier()."""
+    if _tracer is None:
+        yield None
+        return
+    links = []
+    if link:
+        ctx = trace.get_current_span(propagate.extract(link)).get_span_context()
+        if ctx.is_valid:
+            links.append(trace.Link(ctx))
+    with _tracer.start_as_current_span(name, attributes=attributes or {}, links=links) as s:
+        yield s
+
+def trace_carrier() -> dict | None:
+    """W3C traceparent текущего span — сохраняется в плане отправки поста."""
+    if _tracer is None:
+        return None
+    carrier = {}
+    propagate.inject(carrier)
+    return carrier or None
@@ -1,5 +1,5 @@
 # app/models.py
-from sqlalchemy import Column, Integer, String, Text, Boolean, ForeignKey, DateTime, BigInteger
+from sqlalchemy import Column, Integer, SmallInteger, String, Text, Boolean, ForeignKey, DateTime, BigInteger, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from sqlalchemy.ext.declarative import declarative_base
@@ -41,12 +41,13 @@ class Post(Base):
     button_url = Column(String(1000))
     buttons = Column(JSONB, nullable=True)  # [{"text":"...","url":"..."}, ...]
     media_group = Column(JSONB, nullable=True)  # [{"type":"photo|video|document","file_id":"..."}, ...]
-    next_run = Column(DateTime(timezone=True), index=True)
+    next_run = Column(DateTime(timezone=True))  # NULL — отправлен/не запланирован; индекс см. ниже
     repeat_type = Column(String(50))  # legacy, не используем
     repeat_val = Column(Integer, nullable=True)  # legacy
     weekday = Column(Integer, nullable=True) # 0=Mon
     time_text = Column(String(5), nullable=True) # HH:MM
     week_in_cycle = Column(Integer, nullable=True) # 0..cycle_weeks-1
+    recurrence = Column(String(20), nullable=True)  # None — однократно; 'weekly' | 'cycle' | 'monthly'
     parse_mode = Column(String(20), nullable=True)  # 'HTML', 'MarkdownV2', or None
     text_entities = Column(JSONB, nullable=True)  # Telegram entities for text/caption
     src_chat_id = Column(BigInteger, nullable=True)  # для copy_message: chat_id исходного сообщения
@@ -55,3 +56,43 @@ class Post(Base):
     created_by = Column(BigInteger, nullable=False) # telegram_id of creator
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     last_status = Column(String(100), nullable=True)
+    failed = Column(Boolean, nullable=False, server_default="false")  # последняя отправка завершилась ошибкой
+    attempts = Column(SmallInteger, nullable=False, server_default="0")  # попыток текущего запуска (растёт при переносах)
+    claim_token = Column(BigInteger, nullable=True)  # метка последнего захвата воркером, см. app/tasks.py
+    send_plan = Column(JSONB, nullable=True)  # готовые вызовы Bot API, см. app/sendplan.py; NULL — собрать при отправке
+
+# Частичный индекс: отправленные посты (next_run IS NULL) в него не попадают,
+# поэтому due-скан зависит от числа ожидающих постов, а не от всей истории.
+Index("ix_posts_next_run_pending", Post.next_run, postgresql_where=Post.next_run.isnot(None))
+# Список постов канала: keyset-страницы по (next_run, id) внутри канала.
+Index("ix_posts_channel_id_next_run_id", Post.channel_id, Post.next_run, Post.id)
+
+# Постраничный список каналов пользователя: свои и те, где он админ, по возрастанию id.
+Index("ix_channels_owner_id_id", Channel.owner_id, Channel.id)
+Index("ix_channel_admins_telegram_id_channel_id", ChannelAdmin.telegram_id, ChannelAdmin.channel_id)
+# Неотправленные посты с ошибкой — хвост списка постов канала, без LIKE по last_status.
+Index("ix_posts_failed_channel_id_id", Post.channel_id, Post.id, postgresql_where=Post.failed)
+
+class Delivery(Base):
+    """Журнал попыток отправки: только INSERT, секционирован по месяцам started_at.
+
+    Старые секции удаляет задача maintain_delivery_partitions (DELIVERY_RETENTION_DAYS).
+    Внешнего ключа на posts нет: история переживает удаление поста."""
+    __tablename__ = "deliveries"
+    __table_args__ = {"postgresql_partition_by": "RANGE (started_at)"}
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    started_at = Column(DateTime(timezone=True), primary_key=True)
+    finished_at = Column(DateTime(timezone=True), nullable=False)
+    post_id = Column(Integer, nullable=False)
+    channel_id = Column(Integer, nullable=False)
+    attempt = Column(SmallInteger, nullable=False)  # 1 — первая попытка запуска, дальше — после переносов
+    due_at = Column(DateTime(timezone=True), nullable=True)  # на когда пост был запланирован
+    latency_ms = Column(Integer, nullable=False)  # длительность вызовов Bot API
+    outcome = Column(String(20), nullable=False)  # 'ok' | 'deferred' | 'error'
+    message_ids = Column(JSONB, nullable=True)  # message_id опубликованных сообщений
+    error_code = Column(SmallInteger, nullable=True)  # HTTP-код ответа Bot API
+    error_class = Column(String(100), nullable=True)  # класс исключения aiogram
+    error_message = Column(Text, nullable=True)
+
+Index("ix_deliveries_post_id_started_at", Delivery.post_id, Delivery.started_at)
+Index("ix_deliveries_channel_id_started_at", Delivery.channel_id, Delivery.started_at)
@@ -0,0 +1,73 @@
+# app/posts.py
+# Постраничный список постов канала для бота. Читаются только колонки для подписи кнопки
+# (без JSONB и полного текста), страницы листаются keyset-курсором:
+# сначала ожидающие посты по (next_run, id), затем неотправленные с ошибкой по id.
+from collections import namedtuple
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from sqlalchemy import func, tuple_
+from sqlalchemy.future import select
+from app.db import AsyncSessionLocal
+from app.models import Post
+
+POSTS_PAGE_SIZE = 20
+_EPOCH = datetime(1970, 1, 1, tzinfo=ZoneInfo("UTC"))
+_US = timedelta(microseconds=1)
+
+PostRow = namedtuple("PostRow", "id weekday time_text preview failed next_run")
+
+def encode_cursor(row: PostRow) -> str:
+    """'p<мкс>_<id>' — ожидающий пост, 'e<id>' — пост с ошибкой."""
+    if row.next_run is not None:
+        return f"p{(row.next_run - _EPOCH) // _US}_{row.id}"
+    return f"e{row.id}"
+
+def decode_cursor(cursor: str | None):
+    """(next_run, id) для ожидающих, (None, id) для ошибок; None — первая страница/мусор."""
+    if not cursor:
+        return None
+    try:
+        if cursor[0] == "p":
+            us, pid = cursor[1:].split("_", 1)
+            return _EPOCH + timedelta(microseconds=int(us)), int(pid)
+        if cursor[0] == "e":
+            return None, int(cursor[1:])
+    except ValueError:
+        pass
+    return None
+
+_COLUMNS = (Post.id, Post.weekday, Post.time_text, func.left(Post.text, 25), Post.failed, Post.next_run)
+
+async def posts_page(ch_id: int, cursor: str | None = None, limit: int = POSTS_PAGE_SIZE) -> tuple[list[PostRow], str | None]:
+    """Страница постов канала после курсора и курсор следующей страницы (или None)."""
+    pos = decode_cursor(cursor)
+    rows = []
+    async with AsyncSessionLocal() as session:
+        if pos is None or pos[0] is not None:
+            q = (
+                select(*_COLUMNS)
+                .where(Post.channel_id == ch_id)
+                .where(Post.next_run != None)
+                .order_by(Post.next_run.asc(), Post.id.asc())
+                .limit(limit + 1)
+            )
+            if pos is not None:
+                q = q.where(tuple_(Post.next_run, Post.id) > tuple_(*pos))
+            res = await session.execute(q)
+            rows = [PostRow(*r) for r in res.all()]
+        if len(rows) <= limit:
+            q = (
+                select(*_COLUMNS)
+                .where(Post.channel_id == ch_id)
+                .where(Post.next_run == None)
+                .where(Post.failed)
+                .order_by(Post.id.asc())
+                .limit(limit + 1 - len(rows))
+            )
+            if pos is not None and pos[0] is None:
+                q = q.where(Post.id > pos[1])
+            res = await session.execute(q)
+            rows += [PostRow(*r) for r in res.all()]
+    if len(rows) > limit:
+        return rows[:limit], encode_cursor(rows[limit - 1])
+    return rows, None
@@ -0,0 +1,218 @@
+# app/profiling.py
+# Профилирование горячих путей по запросу. Включается PROFILING=1 или командой бота
+# /profile on (флаг в Redis, видят все процессы; сам снимается через PROFILE_FLAG_TTL).
+#
+# Задачи отправки и обработчики бота размечаются фазами (claim, plan, limiter, api, db,
+# record); время вне фаз — Python и ожидание event loop. Для самых медленных PROFILE_TOP_N
+# выполнений каждого вида в PROFILE_DIR остаются JSON со временем фаз и снимок
+# cProfile (.prof, смотреть snakeviz/pstats) или pyinstrument (.html, PROFILER=pyinstrument).
+import os
+import json
+import time
+import heapq
+import logging
+import cProfile
+import itertools
+import contextvars
+from collections import Counter
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+PROFILING = os.getenv("PROFILING", "0") == "1"
+PROFILER = os.getenv("PROFILER", "cprofile")  # cprofile | pyinstrument
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_TOP_N = int(os.getenv("PROFILE_TOP_N", "10"))
+# telegram_id через запятую: кому доступна команда /profile
+PROFILE_ADMINS = {int(x) for x in os.getenv("PROFILE_ADMINS", "").split(",") if x.strip()}
+PROFILE_FLAG_KEY = "profiling:enabled"
+PROFILE_FLAG_TTL = int(os.getenv("PROFILE_FLAG_TTL", "3600"))
+_REFRESH_SECONDS = 5
+
+_enabled = PROFILING
+_checked_at = 0.0
+_current = contextvars.ContextVar("profile_run", default=None)
+# профилировщик на поток один: конкурентные выполнения получают только фазы
+_sampling = False
+_slowest: dict[str, list] = {}  # вид -> min-куча (total, seq, имя, файлы)
+_seq = itertools.count()
+
+def enabled() -> bool:
+    return _enabled
+
+async def refresh(redis) -> bool:
+    """Перечитать флаг из Redis не чаще раза в _REFRESH_SECONDS."""
+    global _enabled, _checked_at
+    if PROFILING or redis is None:
+        return _enabled
+    now = time.monotonic()
+    if now - _checked_at < _REFRESH_SECONDS:
+        return _enabled
+    _checked_at = now
+    try:
+        _enabled = bool(await redis.exists(PROFILE_FLAG_KEY))
+    except Exception as e:
+        logger.warning(f"profiling: cannot read {PROFILE_FLAG_KEY}: {e}")
+    return _enabled
+
+async def set_enabled(redis, on: bool):
+    global _enabled, _checked_at
+    if on:
+        await redis.set(PROFILE_FLAG_KEY, "1", ex=PROFILE_FLAG_TTL)
+    else:
+        await redis.delete(PROFILE_FLAG_KEY)
+    _enabled, _checked_at = on or PROFILING, time.monotonic()
+
+class Run:
+    def __init__(self, kind: str, name: str):
+        self.kind, self.name = kind, name
+        self.phases: dict[str, float] = {}
+        self.calls = Counter()
+
+    def add(self, phase: str, seconds: float):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+        self.calls[phase] += 1
+
+@contextmanager
+def phase(name: str):
+    run = _current.get()
+    if run is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        run.add(name, time.perf_counter() - t0)
+
+# ---------- снимки ----------
+
+def _start_profiler():
+    if PROFILER == "pyinstrument":
+        from pyinstrument import Profiler
+        profiler = Profiler(async_mode="enabled")
+        profiler.start()
+        return profiler
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+def _stop_profiler(profiler):
+    if isinstance(profiler, cProfile.Profile):
+        profiler.disable()
+    else:
+        profiler.stop()
+
+def _dump_profiler(profiler, base: str) -> str:
+    if isinstance(profiler, cProfile.Profile):
+        profiler.dump_stats(base + ".prof")
+        return base + ".prof"
+    with open(base + ".html", "w", encoding="utf-8") as f:
+        f.write(profiler.output_html())
+    return base + ".html"
+
+def _keep(run: Run, total: float, profiler, attrs: dict):
+    """Сохранить выполнение, если оно среди PROFILE_TOP_N самых медленных своего вида."""
+    heap = _slowest.setdefault(run.kind, [])
+    if len(heap) >= PROFILE_TOP_N and total <= heap[0][0]:
+        return
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base = os.path.join(PROFILE_DIR, f"{run.kind}-{run.name}-{int(total * 1000)}ms-{os.getpid()}-{next(_seq)}")
+    summary = {
+        "kind": run.kind,
+        "name": run.name,
+        "at": datetime.utcnow().replace(tzinfo=ZoneInfo("UTC")).isoformat(),
+        "pid": os.getpid(),
+        "total_ms": round(total * 1000, 2),
+        "phases_ms": {k: round(v * 1000, 2) for k, v in run.phases.items()},
+        "calls": dict(run.calls),
+        # при конкурентных фазах (gather) сумма фаз может превысить total
+        "other_ms": round(max(0.0, total - sum(run.phases.values())) * 1000, 2),
+        **attrs,
+    }
+    files = [base + ".json"]
+    with open(base + ".json", "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    if profiler is not None:
+        files.append(_dump_profiler(profiler, base))
+    heapq.heappush(heap, (total, next(_seq), run.name, files))
+    if len(heap) > PROFILE_TOP_N:
+        *_, old = heapq.heappop(heap)
+        for path in old:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+@asynccontextmanager
+async def profiled(kind: str, name: str, redis=None, **attrs):
+    """Разметить выполнение (задачу, обработчик); без включённого профилирования — ничего."""
+    global _sampling
+    await refresh(redis)
+    if not _enabled or _current.get() is not None:
+        yield None
+        return
+    run = Run(kind, name)
+    token = _current.set(run)
+    profiler = None
+    if not _sampling:
+        try:
+            profiler = _start_profiler()
+            _sampling = True
+        except Exception as e:
+            logger.warning(f"profiling: cannot start {PROFILER}: {e}")
+    t0 = time.perf_counter()
+    try:
+        yield run
+    finally:
+        total = time.perf_counter() - t0
+        _current.reset(token)
+        if profiler is not None:
+            _stop_profiler(profiler)
+            _sampling = False
+        try:
+            _keep(run, total, profiler, attrs)
+        except Exception as e:
+            logger.warning(f"profiling: cannot save {run.kind}/{run.name}: {e}")
+
+def slowest() -> list[tuple[str, float]]:
+    """('вид/имя', мс) сохранённых выполнений этого процесса, от самых медленных."""
+    items = [(f"{kind}/{name}", total * 1000) for kind, heap in _slowest.items() for total, _, name, _ in heap]
+    return sorted(items, key=lambda x: -x[1])
+
+# ---------- точки подключения ----------
+
+def instrument_engine(engine):
+    """Фаза db: время SQL-запросов внутри размеченного выполнения."""
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _current.get() is not None:
+            conn.info.setdefault("_profile_t0", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        run, stack = _current.get(), conn.info.get("_profile_t0")
+        if run is not None and stack:
+            run.add("db", time.perf_counter() - stack.pop())
+
+class RequestPhaseMiddleware:
+    """Middleware сессии aiogram: фаза api — вызовы Bot API."""
+    async def __call__(self, make_request, bot, method):
+        with phase("api"):
+            return await make_request(bot, method)
+
+class HandlerProfilingMiddleware:
+    """Inner-middleware aiogram: каждый обработчик — отдельное выполнение вида handler."""
+    def __init__(self, redis=None):
+        self.redis = redis
+
+    async def __call__(self, handler, event, data):
+        # колбэки идут через один обработчик app.callbacks — имя маршрута он кладёт в data
+        name = data.get("handler_name") or getattr(getattr(data.get("handler"), "callback", None), "__name__", "unknown")
+        async with profiled("handler", name, redis=self.redis):
+            return await handler(event, data)
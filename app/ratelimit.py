@@ -0,0 +1,107 @@
+# app/ratelimit.py
+# Общий для всех воркеров лимитер отправки в Telegram (token bucket в Redis).
+# Каждое ведро хранит TAT (theoretical arrival time, мс) по алгоритму GCRA:
+# глобальное — на токен бота (~30 msg/s), отдельное — на chat_id (~20 msg/min).
+import os
+import time
+import hashlib
+from celery.utils.log import get_task_logger
+
+logger = get_task_logger(__name__)
+
+RATE_GLOBAL_PER_SEC = float(os.getenv("RATE_GLOBAL_PER_SEC", "30"))
+RATE_CHAT_PER_MIN = float(os.getenv("RATE_CHAT_PER_MIN", "20"))
+# самый дорогой пост: альбом из 10 элементов + сообщение с кнопками (app.sendplan)
+POST_MAX_COST = 11
+# всплеск в канале не меньше самого дорогого поста: cost списывается целиком,
+# и пост дороже всплеска не прошёл бы даже через пустое ведро
+RATE_CHAT_BURST = max(int(os.getenv("RATE_CHAT_BURST", str(POST_MAX_COST))), POST_MAX_COST)
+# если до слота дольше — не держим воркер, а откладываем пост (секунды)
+RATE_MAX_WAIT = float(os.getenv("RATE_MAX_WAIT", "5"))
+
+# KEYS — вёдра; ARGV: now_ms, cost, max_wait_ms, затем по паре (interval_ms, burst_ms) на ведро.
+# Пост списывает cost * interval целиком: каждый элемент альбома — отдельное сообщение.
+# Возвращает {reserved, wait_ms}. Слот резервируется сразу во всех вёдрах,
+# поэтому параллельные воркеры получают разные, не пересекающиеся слоты.
+_RESERVE_LUA = """
+local now = tonumber(ARGV[1])
+local cost = tonumber(ARGV[2])
+local max_wait = tonumber(ARGV[3])
+local start = now
+local tats = {}
+for i = 1, #KEYS do
+    local interval = tonumber(ARGV[2 + 2 * i])
+    local burst = tonumber(ARGV[3 + 2 * i])
+    local tat = tonumber(redis.call('GET', KEYS[i]) or now)
+    if tat < now then tat = now end
+    tats[i] = tat
+    local s = tat + cost * interval - burst
+    if s > start then start = s end
+end
+local wait = start - now
+if wait > max_wait then
+    return {0, wait}
+end
+for i = 1, #KEYS do
+    local interval = tonumber(ARGV[2 + 2 * i])
+    local burst = tonumber(ARGV[3 + 2 * i])
+    local base = tats[i]
+    if start > base then base = start end
+    local new_tat = base + cost * interval
+    redis.call('SET', KEYS[i], new_tat, 'PX', math.ceil(new_tat - now + burst))
+end
+return {1, wait}
+"""
+
+# Сдвинуть TAT ведра не раньше чем на now + penalty (ответ 429 с retry_after)
+_PENALIZE_LUA = """
+local now = tonumber(ARGV[1])
+local until_ms = now + tonumber(ARGV[2]) + tonumber(ARGV[3])
+local tat = tonumber(redis.call('GET', KEYS[1]) or 0)
+if tat < until_ms then
+    redis.call('SET', KEYS[1], until_ms, 'PX', math.ceil(until_ms - now))
+end
+return until_ms
+"""
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+class RateLimiter:
+    def __init__(self, redis, bot_token: str):
+        self.redis = redis
+        token_hash = hashlib.sha1((bot_token or "").encode()).hexdigest()[:12]
+        self.global_key = f"rl:bot:{token_hash}"
+        global_interval = 1000.0 / RATE_GLOBAL_PER_SEC
+        # всплеск не больше секундного лимита, но самый дорогой пост проходит
+        self._global = (global_interval, max(1000.0, global_interval * POST_MAX_COST))
+        chat_interval = 60000.0 / RATE_CHAT_PER_MIN
+        self._chat = (chat_interval, chat_interval * RATE_CHAT_BURST)
+        self._reserve = redis.register_script(_RESERVE_LUA)
+        self._penalize = redis.register_script(_PENALIZE_LUA)
+
+    def chat_key(self, chat_id: int) -> str:
+        return f"rl:chat:{chat_id}"
+
+    async def reserve(self, chat_id: int, cost: int = 1, max_wait: float = RATE_MAX_WAIT) -> tuple[bool, float]:
+        """Зарезервировать слот на cost сообщений. Возвращает (ok, секунды ожидания).
+
+        ok=False — слот дальше max_wait и ничего не зарезервировано."""
+        keys = [self.global_key, self.chat_key(chat_id)]
+        args = [_now_ms(), max(1, cost), int(max_wait * 1000)]
+        for interval, burst in (self._global, self._chat):
+            args += [interval, burst]
+        try:
+            reserved, wait_ms = await self._reserve(keys=keys, args=args)
+        except Exception as e:
+            # Redis недоступен — не блокируем отправку, Telegram сам ответит 429
+            logger.warning(f"ratelimit: reserve failed for chat {chat_id}: {e}")
+            return True, 0.0
+        return bool(reserved), max(0.0, float(wait_ms) / 1000.0)
+
+    async def penalize(self, chat_id: int, retry_after: float):
+        interval, burst = self._chat
+        try:
+            await self._penalize(keys=[self.chat_key(chat_id)], args=[_now_ms(), int(retry_after * 1000), burst])
+        except Exception as e:
+            logger.warning(f"ratelimit: penalize failed for chat {chat_id}: {e}")
@@ -0,0 +1,111 @@
+# app/scheduler.py
+# Точный планировщик отправки вместо опроса БД каждые 10 секунд.
+# Ближайшие next_run лежат в Redis sorted set (member=post_id, score=unix-время);
+# процесс спит до самого раннего из них и будится публикацией в канал WAKEUP_CHANNEL,
+# когда бот/воркер добавляет или переносит пост. Источник истины — БД:
+# планировщик лишь ставит задачу enqueue_due_posts, которая захватывает due-посты.
+import os
+import asyncio
+import logging
+import time
+import redis.asyncio as aioredis
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from dotenv import load_dotenv
+from sqlalchemy.future import select
+from app.celery_app import celery
+from app import metrics
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+DUE_KEY = "sched:due"
+WAKEUP_CHANNEL = "sched:wakeup"
+# как часто сверять zset с БД и на какой горизонт вперёд подтягивать посты (секунды)
+SCHEDULER_RECONCILE_SECONDS = float(os.getenv("SCHEDULER_RECONCILE_SECONDS", "60"))
+SCHEDULER_HORIZON_SECONDS = float(os.getenv("SCHEDULER_HORIZON_SECONDS", "600"))
+
+def _ts(dt: datetime) -> float:
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=ZoneInfo("UTC"))
+    return dt.timestamp()
+
+async def schedule_posts(redis, items) -> None:
+    """Добавить/перенести посты: items — пары (post_id, next_run). Будит планировщик."""
+    mapping = {str(pid): _ts(nr) for pid, nr in items if nr is not None}
+    if not mapping:
+        return
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.zadd(DUE_KEY, mapping)
+        pipe.publish(WAKEUP_CHANNEL, min(mapping.values()))
+        await pipe.execute()
+
+async def unschedule_posts(redis, post_ids) -> None:
+    ids = [str(pid) for pid in post_ids]
+    if ids:
+        await redis.zrem(DUE_KEY, *ids)
+
+class Scheduler:
+    def __init__(self, redis=None):
+        self.redis = redis or aioredis.from_url(REDIS_URL)
+        self._next_reconcile = 0.0
+
+    async def reconcile(self) -> int:
+        # импорт здесь: app.db создаёт engine при импорте, а schedule_posts нужен и воркеру
+        from app.db import AsyncSessionLocal
+        from app.models import Post
+        horizon = datetime.utcnow().replace(tzinfo=ZoneInfo("UTC")) + timedelta(seconds=SCHEDULER_HORIZON_SECONDS)
+        async with AsyncSessionLocal() as session:
+            res = await session.execute(
+                select(Post.id, Post.next_run).where(Post.next_run != None).where(Post.next_run <= horizon)
+            )
+            items = res.all()
+        if items:
+            await self.redis.zadd(DUE_KEY, {str(pid): _ts(nr) for pid, nr in items})
+        self._next_reconcile = time.time() + SCHEDULER_RECONCILE_SECONDS
+        return len(items)
+
+    async def dispatch(self, now: float) -> int:
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zrangebyscore(DUE_KEY, "-inf", now)
+            pipe.zremrangebyscore(DUE_KEY, "-inf", now)
+            due, _ = await pipe.execute()
+        if due:
+            celery.send_task("enqueue_due_posts")
+            metrics.SCHEDULER_DISPATCHED.inc(len(due))
+            logger.info(f"scheduler: {len(due)} post(s) due, enqueue_due_posts sent")
+        return len(due)
+
+    async def run(self):
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(WAKEUP_CHANNEL)
+        try:
+            while True:
+                now = time.time()
+                if now >= self._next_reconcile:
+                    try:
+                        n = await self.reconcile()
+                        logger.info(f"scheduler: reconcile loaded {n} upcoming post(s)")
+                    except Exception:
+                        logger.exception("scheduler: reconcile failed")
+                        self._next_reconcile = now + SCHEDULER_RECONCILE_SECONDS
+                earliest = await self.redis.zrange(DUE_KEY, 0, 0, withscores=True)
+                if earliest and earliest[0][1] <= now:
+                    await self.dispatch(now)
+                    continue
+                timeout = self._next_reconcile - now
+                if earliest:
+                    timeout = min(timeout, earliest[0][1] - now)
+                # спим до ближайшего поста, reconcile или сигнала о новом посте
+                await pubsub.get_message(ignore_subscribe_messages=True, timeout=max(timeout, 0.01))
+        finally:
+            await pubsub.aclose()
+
+async def main():
+    logging.basicConfig(level=logging.INFO)
+    metrics.serve()
+    await Scheduler().run()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,138 @@
+# app/sendplan.py
+# «План отправки» поста: список вызовов Bot API (имя метода aiogram + аргументы без chat_id)
+# и стоимость в сообщениях для rate limiter. Строится один раз при сохранении поста и лежит
+# в posts.send_plan; воркер только подставляет chat_id канала и выполняет вызовы.
+#
+#   {"v": 1, "cost": 3, "calls": [{"method": "CopyMessages", "args": {...}}, ...]}
+#
+# Необязательный ключ "trace" — W3C-контекст span finalize_post (см. app.metrics).
+from aiogram import methods
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, MessageEntity
+from app.metrics import api_call
+
+SEND_PLAN_VERSION = 1
+
+_MEDIA_METHODS = {
+    "photo": "SendPhoto",
+    "video": "SendVideo",
+    "document": "SendDocument",
+    "voice": "SendVoice",
+}
+
+def detect_parse_mode(text: str | None) -> str | None:
+    if not text:
+        return None
+    if any(tag in text for tag in ("<b>", "<i>", "<u>", "<a ", "</")):
+        return "HTML"
+    if any(ch in text for ch in ("*", "_", "~", "`", "[", "]", "(", ")", ">", "#")):
+        return "MarkdownV2"
+    return None
+
+def _keyboard(p) -> dict | None:
+    rows = []
+    if p.buttons:
+        try:
+            for b in p.buttons:
+                t = (b.get("text") or "").strip()
+                u = (b.get("url") or "").strip()
+                if t and u:
+                    rows.append([InlineKeyboardButton(text=t, url=u)])
+        except Exception:
+            rows = []
+    # legacy: одиночная кнопка
+    if p.button_text and p.button_url:
+        rows.append([InlineKeyboardButton(text=p.button_text, url=p.button_url)])
+    return InlineKeyboardMarkup(inline_keyboard=rows).model_dump(exclude_none=True) if rows else None
+
+def _entities(p) -> list[dict] | None:
+    if not p.text_entities:
+        return None
+    try:
+        return [MessageEntity(**e).model_dump(exclude_none=True) for e in p.text_entities]
+    except Exception:
+        return None
+
+def _call(method: str, **args) -> dict:
+    # None не храним: в методе останется значение по умолчанию, как и при вызове без аргумента
+    return {"method": method, "args": {k: v for k, v in args.items() if v is not None}}
+
+def build_send_plan(p) -> dict:
+    """План отправки для объекта с полями поста (Post, SendJob, namedtuple из API)."""
+    kb = _keyboard(p)
+    entities = _entities(p)
+    pm = None if entities else detect_parse_mode(p.text)
+    text_args = {"entities": entities, "parse_mode": pm, "reply_markup": kb}
+    calls = []
+    cost = 1
+    # 1) copy_messages — альбом, скопированный из исходного чата (сохраняет premium emoji)
+    if p.src_chat_id and p.src_message_ids:
+        ids = list(p.src_message_ids)
+        calls.append(_call("CopyMessages", from_chat_id=p.src_chat_id, message_ids=ids))
+        cost = len(ids)
+        if kb:
+            # отдельным сообщением кнопки + текст (если есть)
+            calls.append(_call("SendMessage", text=p.text or "⬇️", **text_args))
+            cost += 1
+    # 2) copy_message — одиночное сообщение из исходного чата
+    elif p.src_chat_id and p.src_message_id:
+        calls.append(_call("CopyMessage", from_chat_id=p.src_chat_id, message_id=p.src_message_id, reply_markup=kb))
+    # 3) legacy fallback — отправка по сохранённому file_id
+    elif p.media_group:
+        media = []
+        add_caption_to_first = not kb and (p.text or entities)
+        for idx, it in enumerate(p.media_group):
+            t = it.get("type")
+            if t not in ("photo", "video", "document"):
+                continue
+            item = {"type": t, "media": it.get("file_id")}
+            if idx == 0 and add_caption_to_first:
+                item["caption"] = p.text
+                if entities:
+                    item["caption_entities"] = entities
+                elif pm:
+                    item["parse_mode"] = pm
+            media.append(item)
+        cost = len(p.media_group)
+        if media:
+            calls.append(_call("SendMediaGroup", media=media))
+            if kb and p.text:
+                calls.append(_call("SendMessage", text=p.text, **text_args))
+                cost += 1
+    elif p.media_type in _MEDIA_METHODS:
+        calls.append(_call(
+            _MEDIA_METHODS[p.media_type], **{p.media_type: p.media_file_id},
+            caption=p.text, caption_entities=entities, parse_mode=pm, reply_markup=kb,
+        ))
+    elif p.media_type == "video_note":
+        calls.append(_call("SendVideoNote", video_note=p.media_file_id))
+    else:
+        calls.append(_call("SendMessage", text=p.text, **text_args))
+    return {"v": SEND_PLAN_VERSION, "cost": cost, "calls": calls}
+
+def plan_methods(plan: dict, chat_id: int) -> list[methods.TelegramMethod]:
+    """Объекты методов aiogram для chat_id. Бросает ValidationError на битом плане."""
+    return [getattr(methods, c["method"])(chat_id=chat_id, **c["args"]) for c in plan["calls"]]
+
+_URL_SCHEMES = ("http://", "https://", "tg://")
+
+def validate_send_plan(plan: dict) -> str | None:
+    """Проверить план при сохранении поста: текст ошибки или None."""
+    try:
+        calls = plan_methods(plan, chat_id=0)
+    except Exception as e:
+        return str(e)
+    for call in calls:
+        markup = getattr(call, "reply_markup", None)
+        for row in getattr(markup, "inline_keyboard", None) or []:
+            for btn in row:
+                if btn.url and not btn.url.startswith(_URL_SCHEMES):
+                    return f"Некорректная ссылка в кнопке «{btn.text}»: {btn.url}"
+    return None
+
+async def execute_send_plan(bot, plan: dict, chat_id: int) -> list:
+    """Выполнить вызовы по порядку; ответы Bot API — для журнала отправок."""
+    results = []
+    for method in plan_methods(plan, chat_id):
+        with api_call(type(method).__name__):
+            results.append(await bot(method))
+    return results
@@ -1,223 +1,411 @@
 # app/tasks.py
 from .celery_app import celery
 from .models import Post, Channel
-from aiogram import Bot
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from aiogram.types import MessageEntity
-from aiogram.types import InputMediaPhoto, InputMediaVideo, InputMediaDocument
 import os
+import time
 import asyncio
+import secrets
+from collections import namedtuple
 from sqlalchemy.future import select
-from datetime import datetime
-from sqlalchemy import update, and_
+from datetime import datetime, timedelta, time as dtime
+from sqlalchemy import update, tuple_, bindparam, func, Boolean
 from zoneinfo import ZoneInfo
+from aiogram.exceptions import TelegramRetryAfter
 from celery.utils.log import get_task_logger
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import NullPool
+from .worker import open_session, get_bot, get_limiter, get_redis, run
+from .scheduler import schedule_posts
+from .utils import compute_next_runs_batch
+from .sendplan import build_send_plan, execute_send_plan
+from .deliveries import delivery_row, write_deliveries, ensure_partitions, drop_expired_partitions
+from . import metrics, profiling
 
 logger = get_task_logger(__name__)
 
-BOT_TOKEN = os.getenv("BOT_TOKEN")
-DATABASE_URL = os.getenv("DATABASE_URL")
+# fanout — пачка захваченных постов уходит задачами send_batch по FANOUT_CHUNK_SIZE;
+# batch — пачка отправляется конкурентно прямо на loop воркера
+DELIVERY_MODE = os.getenv("DELIVERY_MODE", "fanout")
+DELIVERY_BATCH_SIZE = int(os.getenv("DELIVERY_BATCH_SIZE", "200"))
+DELIVERY_CONCURRENCY = int(os.getenv("DELIVERY_CONCURRENCY", "10"))
+FANOUT_CHUNK_SIZE = int(os.getenv("FANOUT_CHUNK_SIZE", "20"))
+# Захваченный пост получает next_run = now + lease и новый claim_token: если воркер
+# упадёт посреди отправки, пост снова станет due после истечения аренды. Задача,
+# пролежавшая в очереди дольше аренды, увидит чужой claim_token и пост не отправит.
+CLAIM_LEASE_SECONDS = int(os.getenv("CLAIM_LEASE_SECONDS", "300"))
 
-async def open_session():
-    engine = create_async_engine(
-        DATABASE_URL,
-        future=True,
-        echo=False,
-        poolclass=NullPool,
+# Ровно те колонки, что нужны для отправки (+ chat_id канала)
+_SEND_COLUMNS = (
+    Post.id, Post.text, Post.media_type, Post.media_file_id, Post.button_text, Post.button_url,
+    Post.buttons, Post.media_group, Post.text_entities,
+    Post.src_chat_id, Post.src_message_id, Post.src_message_ids, Post.send_plan,
+    Post.channel_id, Post.attempts, Post.claim_token, Post.recurrence,
+)
+# due_at — next_run, на который пост был запланирован; следующий запуск повторяющегося
+# поста считает record_outcomes — в одной транзакции с записью итога
+SendJob = namedtuple("SendJob", [c.key for c in _SEND_COLUMNS] + ["chat_id", "due_at"])
+
+def _utcnow() -> datetime:
+    return datetime.utcnow().replace(tzinfo=ZoneInfo("UTC"))
+
+def _parse_time_text(time_text: str | None):
+    if not time_text:
+        return None
+    hh, mm = map(int, time_text.split(":"))
+    return dtime(hh, mm)
+
+async def claim_due_posts(session, limit: int, post_id: int | None = None) -> list[SendJob]:
+    """Атомарно захватить до limit due-постов одним UPDATE ... FROM channels RETURNING.
+
+    FOR UPDATE SKIP LOCKED позволяет нескольким планировщикам/воркерам
+    работать параллельно: строки, которые уже захватывает другой, пропускаются."""
+    now_utc = _utcnow()
+    due = (
+        select(Post.id, Post.next_run.label("due_at"))
+        .where(Post.next_run != None)
+        .where(Post.next_run <= now_utc)
+        .order_by(Post.next_run.asc(), Post.id.asc())
+        .limit(limit)
+        .with_for_update(of=Post, skip_locked=True)
     )
-    SessionLocal = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
-    session = SessionLocal()
-    return engine, session
+    if post_id is not None:
+        due = due.where(Post.id == post_id)
+    due = due.subquery("due")
+    # одна метка на весь захват: пара (id, claim_token) всё равно уникальна
+    token = secrets.randbits(63)
+    t0 = time.perf_counter()
+    result = await session.execute(
+        update(Post)
+        .where(Post.id == due.c.id)
+        .where(Channel.id == Post.channel_id)
+        .values(
+            last_status="sending",
+            next_run=now_utc + timedelta(seconds=CLAIM_LEASE_SECONDS),
+            attempts=Post.attempts + 1,
+            claim_token=token,
+        )
+        .returning(*_SEND_COLUMNS, Channel.chat_id, due.c.due_at)
+    )
+    rows = result.all()
+    await session.commit()
+    # время захвата растёт при конкуренции за строки; полная пачка — признак отставания
+    metrics.CLAIM_SECONDS.observe(time.perf_counter() - t0)
+    metrics.CLAIMED.inc(len(rows))
+    if rows and len(rows) >= limit:
+        metrics.CLAIM_FULL.inc()
+    return [SendJob(*row) for row in rows]
 
-@celery.task(bind=True, name="send_post")
-def send_post(self, post_id: int):
-    return asyncio.run(_send_post_async(post_id))
+def _job_to_dict(job: SendJob) -> dict:
+    d = job._asdict()
+    if d["due_at"] is not None:
+        d["due_at"] = d["due_at"].isoformat()
+    return d
 
-async def _send_post_async(post_id: int):
-    engine, session = await open_session()
-    bot = Bot(token=BOT_TOKEN)
-    try:
-        # Атомарно "захватим" пост, чтобы исключить повторную отправку
-        now_utc = datetime.utcnow().replace(tzinfo=ZoneInfo("UTC"))
-        result = await session.execute(
-            update(Post)
-            .where(and_(Post.id == post_id, Post.next_run != None, Post.next_run <= now_utc))
-            .values(last_status="sending")
-            .returning(Post.id)
+def _job_from_dict(d: dict) -> SendJob:
+    d = dict(d)
+    # задачи, поставленные до появления claim_token, отправку не подтвердят (см. renew_claims)
+    d.setdefault("claim_token", None)
+    d.setdefault("recurrence", None)
+    d.pop("repeat_next", None)
+    if d.get("due_at"):
+        d["due_at"] = datetime.fromisoformat(d["due_at"])
+    return SendJob(**d)
+
+async def renew_claims(session, jobs: list[SendJob]) -> set[int]:
+    """Продлить аренду захваченных постов одним UPDATE; вернуть id, чей захват ещё наш.
+
+    Пост, захваченный заново после истечения аренды, получил другой claim_token —
+    такую задачу отправлять нельзя, иначе пост уйдёт дважды."""
+    pairs = [(j.id, j.claim_token) for j in jobs if j.claim_token is not None]
+    if not pairs:
+        return set()
+    res = await session.execute(
+        update(Post)
+        .where(tuple_(Post.id, Post.claim_token).in_(pairs))
+        .values(next_run=_utcnow() + timedelta(seconds=CLAIM_LEASE_SECONDS))
+        .returning(Post.id)
+        .execution_options(synchronize_session=False)
+    )
+    ids = set(res.scalars())
+    await session.commit()
+    return ids
+
+# executemany по (id, claim_token): итог устаревшей задачи не перезапишет новый захват;
+# у перенесённых failed не трогаем (NULL) — это флаг последней завершённой отправки
+_RECORD_OUTCOME = (
+    update(Post.__table__)
+    .where(Post.__table__.c.id == bindparam("b_id"))
+    .where(Post.__table__.c.claim_token == bindparam("b_claim_token"))
+    .values(
+        last_status=bindparam("b_last_status"),
+        next_run=bindparam("b_next_run"),
+        attempts=bindparam("b_attempts"),
+        failed=func.coalesce(bindparam("b_failed", type_=Boolean), Post.__table__.c.failed),
+    )
+)
+
+async def _next_runs(session, outcomes: list[dict]) -> dict[int, datetime]:
+    """Следующие запуски повторяющихся постов с завершённой отправкой — по текущему
+    расписанию поста и канала, строки блокируются до записи итога."""
+    recurring = {o["id"]: o for o in outcomes if o["recurring"]}
+    if not recurring:
+        return {}
+    res = await session.execute(
+        select(
+            Post.id, Post.recurrence, Post.weekday, Post.time_text, Post.week_in_cycle,
+            Channel.cycle_weeks, Channel.cycle_start,
         )
-        claimed_id = result.scalar_one_or_none()
-        if not claimed_id:
-            logger.info(f"send_post: skip {post_id}, not due or already claimed")
-            await session.commit()
-            return {"ok": False, "reason": "not_due_or_claimed"}
-        # Загрузим актуальные данные поста/канала
-        q = await session.execute(select(Post).where(Post.id == post_id))
-        p = q.scalar_one_or_none()
-        if not p:
-            await session.commit()
-            logger.warning(f"send_post: post {post_id} not found after claim")
-            return {"ok": False, "reason": "post not found"}
-        channel_q = await session.execute(select(Channel).where(Channel.id == p.channel_id))
-        ch = channel_q.scalar_one_or_none()
-        if not ch:
-            await session.commit()
-            logger.warning(f"send_post: channel for post {post_id} not found")
-            return {"ok": False, "reason": "channel not found"}
+        .join(Channel, Channel.id == Post.channel_id)
+        .where(tuple_(Post.id, Post.claim_token).in_([(o["id"], o["claim_token"]) for o in recurring.values()]))
+        .with_for_update(of=Post)
+    )
+    rows = res.all()
+    next_runs = compute_next_runs_batch(
+        _utcnow(),
+        [r.weekday for r in rows],
+        [_parse_time_text(r.time_text) for r in rows],
+        recurrences=[r.recurrence for r in rows],
+        cycle_weeks=[r.cycle_weeks for r in rows],
+        cycle_starts=[r.cycle_start for r in rows],
+        weeks_in_cycle=[r.week_in_cycle for r in rows],
+        prev_runs=[recurring[r.id]["due_at"] for r in rows],
+    )
+    return {r.id: nxt for r, nxt in zip(rows, next_runs)}
 
+async def record_outcomes(session, outcomes: list[dict]):
+    # пропущенные (захват потерян) не пишем вовсе: пост уже принадлежит другой задаче
+    outcomes = [o for o in outcomes if o["last_status"] != "stale"]
+    # завершённая отправка (ok/ошибка): одноразовый пост снимается с расписания,
+    # повторяющийся получает следующий запуск — в той же транзакции, что и итог
+    next_runs = await _next_runs(session, [o for o in outcomes if o["failed"] is not None])
+    for o in outcomes:
+        if o["failed"] is not None:
+            o["next_run"] = next_runs.get(o["id"])
+    rows = [
+        {
+            "b_id": o["id"], "b_claim_token": o["claim_token"], "b_last_status": o["last_status"],
+            "b_next_run": o["next_run"], "b_attempts": o["attempts"], "b_failed": o["failed"],
+        }
+        for o in outcomes
+    ]
+    if rows:
+        await session.execute(_RECORD_OUTCOME, rows)
+        await session.commit()
+    # журнал попыток — отдельной транзакцией: его сбой не должен откатить посты
+    try:
+        await write_deliveries(session, [o["delivery"] for o in outcomes if o["delivery"]])
+    except Exception as e:
+        logger.warning(f"record_outcomes: failed to write deliveries: {e}")
+    # отложенные посты — обратно в расписание планировщика
+    rescheduled = [(o["id"], o["next_run"]) for o in outcomes if o["next_run"] is not None]
+    if rescheduled:
         try:
-            kb = None
-            rows = []
-            if p.buttons:
-                try:
-                    for b in p.buttons:
-                        t = (b.get("text") or "").strip()
-                        u = (b.get("url") or "").strip()
-                        if t and u:
-                            rows.append([InlineKeyboardButton(text=t, url=u)])
-                except Exception:
-                    rows = []
-            # legacy: одиночная кнопка
-            if p.button_text and p.button_url:
-                rows.append([InlineKeyboardButton(text=p.button_text, url=p.button_url)])
-            if rows:
-                kb = InlineKeyboardMarkup(inline_keyboard=rows)
-            entities = None
-            if p.text_entities:
-                try:
-                    entities = [MessageEntity(**e) for e in p.text_entities]
-                except Exception:
-                    entities = None
-            def detect_parse_mode(text: str | None) -> str | None:
-                if not text:
-                    return None
-                if any(tag in text for tag in ("<b>", "<i>", "<u>", "<a ", "</")):
-                    return "HTML"
-                if any(ch in text for ch in ("*", "_", "~", "`", "[", "]", "(", ")", ">", "#")):
-                    return "MarkdownV2"
-                return None
-            pm = None if entities else detect_parse_mode(p.text)
-
-            # 1) copy_messages — альбом, скопированный из исходного чата (сохраняет premium emoji)
-            if p.src_chat_id and p.src_message_ids:
-                ids = list(p.src_message_ids)
-                await bot.copy_messages(chat_id=ch.chat_id, from_chat_id=p.src_chat_id, message_ids=ids)
-                if kb:
-                    # отдельным сообщением кнопки + текст (если есть)
-                    btn_text = p.text or "⬇️"
-                    await bot.send_message(chat_id=ch.chat_id, text=btn_text, entities=entities, parse_mode=pm, reply_markup=kb)
-            # 2) copy_message — одиночное сообщение из исходного чата
-            elif p.src_chat_id and p.src_message_id:
-                await bot.copy_message(
-                    chat_id=ch.chat_id,
-                    from_chat_id=p.src_chat_id,
-                    message_id=p.src_message_id,
-                    reply_markup=kb,
-                )
-            # 3) legacy fallback — отправка по сохранённому file_id
-            elif p.media_group:
-                media = []
-                add_caption_to_first = not kb and (p.text or entities)
-                for idx, it in enumerate(p.media_group):
-                    t = it.get("type")
-                    fid = it.get("file_id")
-                    if idx == 0 and add_caption_to_first:
-                        if entities:
-                            if t == "photo":
-                                media.append(InputMediaPhoto(media=fid, caption=p.text, caption_entities=entities))
-                            elif t == "video":
-                                media.append(InputMediaVideo(media=fid, caption=p.text, caption_entities=entities))
-                            elif t == "document":
-                                media.append(InputMediaDocument(media=fid, caption=p.text, caption_entities=entities))
-                        else:
-                            if t == "photo":
-                                media.append(InputMediaPhoto(media=fid, caption=p.text, parse_mode=pm))
-                            elif t == "video":
-                                media.append(InputMediaVideo(media=fid, caption=p.text, parse_mode=pm))
-                            elif t == "document":
-                                media.append(InputMediaDocument(media=fid, caption=p.text, parse_mode=pm))
-                    else:
-                        if t == "photo":
-                            media.append(InputMediaPhoto(media=fid))
-                        elif t == "video":
-                            media.append(InputMediaVideo(media=fid))
-                        elif t == "document":
-                            media.append(InputMediaDocument(media=fid))
-                if media:
-                    await bot.send_media_group(chat_id=ch.chat_id, media=media)
-                    if kb and p.text:
-                        await bot.send_message(chat_id=ch.chat_id, text=p.text, entities=entities, parse_mode=pm, reply_markup=kb)
-            elif p.media_type == "photo":
-                await bot.send_photo(chat_id=ch.chat_id, photo=p.media_file_id, caption=p.text, caption_entities=entities, parse_mode=pm, reply_markup=kb)
-            elif p.media_type == "video":
-                await bot.send_video(chat_id=ch.chat_id, video=p.media_file_id, caption=p.text, caption_entities=entities, parse_mode=pm, reply_markup=kb)
-            elif p.media_type == "document":
-                await bot.send_document(chat_id=ch.chat_id, document=p.media_file_id, caption=p.text, caption_entities=entities, parse_mode=pm, reply_markup=kb)
-            elif p.media_type == "voice":
-                await bot.send_voice(chat_id=ch.chat_id, voice=p.media_file_id, caption=p.text, caption_entities=entities, parse_mode=pm, reply_markup=kb)
-            elif p.media_type == "video_note":
-                await bot.send_video_note(chat_id=ch.chat_id, video_note=p.media_file_id)
-            else:
-                await bot.send_message(chat_id=ch.chat_id, text=p.text, entities=entities, parse_mode=pm, reply_markup=kb)
-
-            # success: пост одноразовый — next_run сбрасываем
-            await session.execute(
-                update(Post).where(Post.id == p.id).values(last_status="ok", next_run=None)
-            )
-            await session.commit()
-            logger.info(f"send_post: sent post {p.id} to chat {ch.chat_id} (one-shot)")
-            return {"ok": True, "post_id": p.id}
+            await schedule_posts(get_redis(), rescheduled)
         except Exception as e:
-            # next_run обнуляем, чтобы не ретраить бесконечно (пост одноразовый)
-            await session.execute(
-                update(Post).where(Post.id == p.id).values(last_status=f"error:{str(e)}", next_run=None)
-            )
-            await session.commit()
-            logger.exception(f"send_post: error sending post {p.id}: {e}")
-            return {"ok": False, "reason": str(e)}
+            logger.warning(f"record_outcomes: failed to notify scheduler: {e}")
+
+def _outcome(p: SendJob, ok: bool, last_status: str, next_run: datetime | None = None, reason: str | None = None,
+             delivery: dict | None = None) -> dict:
+    """next_run — только для переноса; после завершённой отправки его считает record_outcomes."""
+    deferred = last_status == "deferred"
+    return {
+        "id": p.id,
+        "claim_token": p.claim_token,
+        "due_at": p.due_at,
+        "recurring": p.recurrence is not None,
+        "ok": ok,
+        "last_status": last_status[:100],
+        "next_run": next_run,
+        "reason": reason,
+        # перенос продолжает текущий запуск, итог (ok/ошибка) — сбрасывает счётчик попыток
+        "attempts": p.attempts if deferred else 0,
+        "failed": None if deferred else not ok,
+        "delivery": delivery,
+    }
+
+def _timing(started_at: datetime, t0: float) -> dict:
+    return {"started_at": started_at, "finished_at": _utcnow(), "latency_ms": int((time.perf_counter() - t0) * 1000)}
+
+async def deliver(bot, p: SendJob) -> dict:
+    """Отправить один захваченный пост. В БД не пишет — возвращает итог для record_outcomes."""
+    if p.due_at is not None:
+        metrics.SEND_LAG.observe((_utcnow() - p.due_at).total_seconds())
+    # span отправки ссылается на span finalize_post, сохранённый в плане
+    with metrics.span("deliver_post", {"post.id": p.id, "chat.id": p.chat_id}, link=(p.send_plan or {}).get("trace")):
+        o = await _deliver(bot, p)
+    metrics.observe_outcome(o)
+    return o
+
+async def _deliver(bot, p: SendJob) -> dict:
+    started_at, t0 = None, time.perf_counter()
+    try:
+        # посты без плана (созданные до его появления) собираем на лету
+        with profiling.phase("plan"):
+            plan = p.send_plan or build_send_plan(p)
+        # Лимиты Telegram: каждый элемент альбома считается отдельным сообщением
+        with profiling.phase("limiter"):
+            reserved, wait = await get_limiter().reserve(p.chat_id, plan["cost"])
+        if not reserved:
+            logger.info(f"send_post: post {p.id} deferred by {wait:.1f}s (rate limit chat {p.chat_id})")
+            metrics.RATE_LIMITED.inc()
+            return _outcome(p, False, "deferred", _utcnow() + timedelta(seconds=wait), reason="rate_limited")
+        if wait > 0:
+            with profiling.phase("limiter"):
+                await asyncio.sleep(wait)
+        started_at, t0 = _utcnow(), time.perf_counter()
+        results = await execute_send_plan(bot, plan, p.chat_id)
+
+        # success: одноразовый пост снимется с расписания, повторяющийся — на следующий запуск
+        logger.info(f"send_post: sent post {p.id} to chat {p.chat_id}")
+        delivery = delivery_row(p, outcome="ok", results=results, **_timing(started_at, t0))
+        return _outcome(p, True, "ok", delivery=delivery)
+    except TelegramRetryAfter as e:
+        # 429: не теряем пост, а переносим его на retry_after
+        await get_limiter().penalize(p.chat_id, e.retry_after)
+        logger.warning(f"send_post: flood control for post {p.id} in chat {p.chat_id}, retry in {e.retry_after}s")
+        delivery = delivery_row(p, outcome="deferred", error=e, **_timing(started_at, t0)) if started_at else None
+        return _outcome(p, False, "deferred", _utcnow() + timedelta(seconds=e.retry_after), reason="retry_after", delivery=delivery)
+    except Exception as e:
+        # не ретраим бесконечно: одноразовый пост снимается, повторяющийся ждёт следующего запуска
+        logger.exception(f"send_post: error sending post {p.id}: {e}")
+        delivery = delivery_row(p, outcome="error", error=e, **_timing(started_at or _utcnow(), t0))
+        return _outcome(p, False, f"error:{str(e)}", reason=str(e), delivery=delivery)
+
+def _stale(p: SendJob) -> dict:
+    logger.info(f"send_post: skip post {p.id}, claim lease expired and the post was claimed again")
+    o = _outcome(p, False, "stale", reason="claim_lost")
+    metrics.observe_outcome(o)
+    return o
+
+async def _renew(jobs: list[SendJob]) -> set[int]:
+    session = open_session()
+    try:
+        with profiling.phase("claim"):
+            return await renew_claims(session, jobs)
     finally:
         try:
-            await bot.session.close()
+            await session.close()
         except Exception:
             pass
+
+async def deliver_jobs(jobs: list[SendJob], concurrency: int = DELIVERY_CONCURRENCY, claimed: bool = False) -> list[dict]:
+    """claimed=True — аренда только что взята claim_due_posts, сразу продлевать не нужно."""
+    bot = get_bot()
+    sem = asyncio.Semaphore(concurrency)
+    renewed_at = time.monotonic()
+    owned = {j.id for j in jobs} if claimed else await _renew(jobs)
+
+    async def _one(job: SendJob):
+        if job.id not in owned:
+            return _stale(job)
+        async with sem:
+            # пачка шла дольше половины аренды — перед отправкой сверяем захват ещё раз
+            if time.monotonic() - renewed_at > CLAIM_LEASE_SECONDS / 2 and not await _renew([job]):
+                return _stale(job)
+            return await deliver(bot, job)
+
+    outcomes = await asyncio.gather(*(_one(job) for job in jobs))
+    session = open_session()
+    try:
+        with profiling.phase("record"):
+            await record_outcomes(session, outcomes)
+    finally:
         try:
             await session.close()
         except Exception:
             pass
+    return outcomes
+
+@celery.task(bind=True, name="send_post")
+def send_post(self, post_id: int):
+    return run(_send_post_async(post_id))
+
+async def _send_post_async(post_id: int):
+    async with profiling.profiled("task", "send_post", redis=get_redis(), post_id=post_id):
+        session = open_session()
         try:
-            await engine.dispose()
-        except Exception:
-            pass
+            # claim заодно загружает всё для отправки (UPDATE ... RETURNING)
+            with profiling.phase("claim"):
+                jobs = await claim_due_posts(session, 1, post_id=post_id)
+        finally:
+            try:
+                await session.close()
+            except Exception:
+                pass
+        if not jobs:
+            logger.info(f"send_post: skip {post_id}, not due or already claimed")
+            return {"ok": False, "reason": "not_due_or_claimed"}
+        o = (await deliver_jobs(jobs, claimed=True))[0]
+        return {"ok": o["ok"], "post_id": post_id, "reason": o["reason"]}
 
-@celery.on_after_configure.connect
-def setup_periodic_tasks(sender, **kwargs):
-    # check due posts every 10 seconds
-    sender.add_periodic_task(10.0, enqueue_due_posts.s(), name="enqueue due posts every 10s")
+@celery.task(name="send_batch")
+def send_batch(jobs: list[dict]):
+    return run(_send_batch_async(jobs))
+
+async def _send_batch_async(jobs: list[dict]):
+    async with profiling.profiled("task", "send_batch", redis=get_redis(), jobs=len(jobs)):
+        outcomes = await deliver_jobs([_job_from_dict(j) for j in jobs])
+    return {"sent": [o["id"] for o in outcomes if o["ok"]], "not_sent": [o["id"] for o in outcomes if not o["ok"]]}
 
 @celery.task(name="enqueue_due_posts")
 def enqueue_due_posts():
-    return asyncio.run(_enqueue_due_async())
+    if DELIVERY_MODE == "batch":
+        return run(_deliver_due_async())
+    return run(_enqueue_due_async())
 
-async def _enqueue_due_async():
-    engine, session = await open_session()
+async def _enqueue_due_async(batch_size: int = DELIVERY_BATCH_SIZE):
+    session = open_session()
     try:
-        now = datetime.utcnow().replace(tzinfo=ZoneInfo("UTC"))
-        q = await session.execute(select(Post).where(Post.next_run != None).where(Post.next_run <= now))
-        rows = q.scalars().all()
-        ids = [p.id for p in rows]
-        if ids:
-            logger.info(f"enqueue_due_posts: found due posts (<= {now}): {ids}")
-        for pid in ids:
-            send_post.delay(pid)
-        return {"enqueued": ids}
+        jobs = await claim_due_posts(session, batch_size)
     finally:
         try:
             await session.close()
         except Exception:
             pass
+    ids = [j.id for j in jobs]
+    if ids:
+        logger.info(f"enqueue_due_posts: claimed due posts: {ids}")
+    for i in range(0, len(jobs), FANOUT_CHUNK_SIZE):
+        send_batch.delay([_job_to_dict(j) for j in jobs[i:i + FANOUT_CHUNK_SIZE]])
+    if len(jobs) >= batch_size:
+        enqueue_due_posts.delay()
+    return {"enqueued": ids}
+
+@celery.task(name="deliver_due_posts")
+def deliver_due_posts():
+    return run(_deliver_due_async())
+
+async def _deliver_due_async(batch_size: int = DELIVERY_BATCH_SIZE, concurrency: int = DELIVERY_CONCURRENCY):
+    async with profiling.profiled("task", "deliver_due_posts", redis=get_redis()):
+        session = open_session()
         try:
-            await engine.dispose()
-        except Exception:
-            pass
+            with profiling.phase("claim"):
+                jobs = await claim_due_posts(session, batch_size)
+        finally:
+            try:
+                await session.close()
+            except Exception:
+                pass
+        if not jobs:
+            return {"sent": [], "skipped": []}
+        outcomes = await deliver_jobs(jobs, concurrency, claimed=True)
+    sent = [o["id"] for o in outcomes if o["ok"]]
+    skipped = [o["id"] for o in outcomes if not o["ok"]]
+    logger.info(f"deliver_due_posts: batch of {len(jobs)}, sent {len(sent)}, not sent {len(skipped)}")
+    # пачка заполнена целиком — скорее всего due-постов больше, продолжаем без ожидания beat
+    if len(jobs) >= batch_size:
+        deliver_due_posts.delay()
+    return {"sent": sent, "skipped": skipped}
+
+@celery.task(name="maintain_delivery_partitions")
+def maintain_delivery_partitions():
+    return run(_maintain_delivery_partitions_async())
+
+async def _maintain_delivery_partitions_async():
+    session = open_session()
+    try:
+        created = await ensure_partitions(session)
+        dropped = await drop_expired_partitions(session)
+    finally:
+        await session.close()
+    if dropped:
+        logger.info(f"maintain_delivery_partitions: dropped {dropped}")
+    return {"ensured": created, "dropped": dropped}
@@ -0,0 +1,147 @@
+# app/updates.py
+# Конкурентная обработка апдейтов бота. Апдейты разных пользователей обрабатываются
+# параллельно пулом из BOT_UPDATE_WORKERS задач. Апдейты одного чата и пользователя
+# идут строго по очереди, поэтому переходы FSM не перемешиваются. Если в работе и в
+# очереди уже BOT_UPDATE_QUEUE апдейтов, приём ждёт: в polling не запрашиваются
+# новые getUpdates, в webhook запрос ждёт ответа.
+#
+# Подключается outer-middleware на dp.update после UserContext middleware aiogram, но до
+# FSMContextMiddleware: ключ берётся из event_chat/event_user, а остаток цепочки (FSM,
+# фильтры, обработчик) выполняет воркер — состояние читается в момент обработки, после
+# предыдущего апдейта того же пользователя. Ошибки обработчиков уходят в dp.errors.
+# BOT_UPDATE_WORKERS=0 — прежнее поведение aiogram (задача на апдейт).
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Hashable
+from aiogram.dispatcher.event.bases import UNHANDLED, CancelHandler, SkipHandler
+from aiogram.types.error_event import ErrorEvent
+from app import metrics
+
+logger = logging.getLogger(__name__)
+
+BOT_UPDATE_WORKERS = int(os.getenv("BOT_UPDATE_WORKERS", "32"))
+BOT_UPDATE_QUEUE = int(os.getenv("BOT_UPDATE_QUEUE", "1000"))
+BOT_UPDATE_DRAIN_SECONDS = float(os.getenv("BOT_UPDATE_DRAIN_SECONDS", "10"))
+
+class KeyedQueue:
+    """Пул воркеров с порядком внутри ключа и справедливой очередью между ключами.
+
+    Ключ находится в _pending, пока у него есть апдейт в очереди или в работе;
+    в _ready он стоит не более одного раза, поэтому два апдейта одного ключа
+    одновременно не выполняются. После каждого апдейта ключ уходит в конец
+    _ready, и активный пользователь не занимает воркер целиком."""
+
+    def __init__(self, workers: int = BOT_UPDATE_WORKERS, max_pending: int = BOT_UPDATE_QUEUE):
+        self.workers, self.max_pending = workers, max_pending
+        self._pending: dict[Hashable, deque] = {}
+        self._ready: asyncio.Queue | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._size = 0
+
+    def _start(self):
+        self._ready = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self._tasks = [asyncio.create_task(self._worker(), name=f"updates-{i}") for i in range(self.workers)]
+        logger.info(f"updates: {self.workers} workers, queue limit {self.max_pending}")
+
+    async def put(self, key: Hashable, job: Callable[[], Awaitable[Any]]):
+        if not self._tasks:
+            self._start()
+        # backpressure: ждём, пока освободится место
+        await self._slots.acquire()
+        self._size += 1
+        metrics.UPDATES_PENDING.set(self._size)
+        item = (job, time.perf_counter())
+        chain = self._pending.get(key)
+        if chain is None:
+            self._pending[key] = deque([item])
+            self._ready.put_nowait(key)
+        else:
+            chain.append(item)
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            chain = self._pending[key]
+            job, queued_at = chain[0]
+            metrics.UPDATE_WAIT.observe(time.perf_counter() - queued_at)
+            try:
+                await job()
+            except Exception:
+                logger.exception(f"updates: unhandled error for {key}")
+            finally:
+                chain.popleft()
+                self._size -= 1
+                metrics.UPDATES_PENDING.set(self._size)
+                self._slots.release()
+                if chain:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._pending[key]
+
+    async def stop(self, timeout: float = BOT_UPDATE_DRAIN_SECONDS):
+        """Дождаться принятых апдейтов (не дольше timeout) и остановить воркеры."""
+        if not self._tasks:
+            return
+        deadline = time.monotonic() + timeout
+        while self._pending and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._pending:
+            logger.warning(f"updates: dropping {self._size} update(s) on shutdown")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks, self._pending, self._size = [], {}, 0
+
+def update_key(data: dict) -> Hashable | None:
+    """(chat_id, user_id) апдейта; None — апдейт без чата и пользователя, порядок не нужен."""
+    chat, user = data.get("event_chat"), data.get("event_from_user")
+    if chat is None and user is None:
+        return None
+    return (chat.id if chat else None, user.id if user else None)
+
+class ConcurrentUpdatesMiddleware:
+    """Outer-middleware dp.update: ставит остаток обработки апдейта в KeyedQueue."""
+
+    def __init__(self, queue: KeyedQueue, dispatcher):
+        self.queue, self.dispatcher = queue, dispatcher
+
+    async def __call__(self, handler, event, data):
+        key = update_key(data)
+        if key is None:
+            key = ("update", event.update_id)
+        await self.queue.put(key, lambda: self._process(handler, event, data))
+        # итог обработки уже не нужен: в polling и webhook бот отвечает через Bot API
+        return None
+
+    async def _process(self, handler, event, data):
+        try:
+            await handler(event, data)
+        except (SkipHandler, CancelHandler):
+            pass
+        except Exception as e:
+            # ErrorsMiddleware aiogram стоит до очереди и этой ошибки не увидит
+            response = await self.dispatcher.propagate_event(
+                update_type="error", event=ErrorEvent(update=event, exception=e), **data,
+            )
+            if response is UNHANDLED:
+                raise
+
+def setup(dp, workers: int = BOT_UPDATE_WORKERS, max_pending: int = BOT_UPDATE_QUEUE) -> KeyedQueue | None:
+    if workers <= 0:
+        return None
+    queue = KeyedQueue(workers, max_pending)
+    middlewares = dp.update.outer_middleware
+    # очередь — перед FSMContextMiddleware: состояние и events isolation берутся в воркере
+    fsm = dp.fsm if dp.fsm in middlewares else None
+    if fsm is not None:
+        middlewares.unregister(fsm)
+    middlewares.register(ConcurrentUpdatesMiddleware(queue, dp))
+    if fsm is not None:
+        middlewares.register(fsm)
+    dp.shutdown.register(queue.stop)
+    return queue
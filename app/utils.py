@@ -1,5 +1,7 @@
 # app/utils.py
-from datetime import datetime, time, timedelta
+import calendar
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
 from dateutil.relativedelta import relativedelta
 from zoneinfo import ZoneInfo
 
@@ -57,3 +59,122 @@ def compute_next_run_cycle_tz(now_utc: datetime, cycle_weeks: int, cycle_start_u
     # сделать aware в локальной зоне и перевести в UTC
     local_next_aware = local_next.replace(tzinfo=tz)
     return local_next_aware.astimezone(ZoneInfo("UTC"))
+
+def compute_next_run_monthly_tz(prev_run_utc: datetime, weekday: int, t_local: time, tz_name: str = "Europe/Moscow") -> datetime:
+    """Через месяц после prev_run: первый указанный день недели, время локальное, результат в UTC."""
+    tz = ZoneInfo(tz_name)
+    prev_local = prev_run_utc.astimezone(tz) if prev_run_utc.tzinfo else prev_run_utc.replace(tzinfo=ZoneInfo("UTC")).astimezone(tz)
+    local_next = add_month_preserve_weekday(prev_local.replace(tzinfo=None), weekday, t_local)
+    return local_next.replace(tzinfo=tz).astimezone(ZoneInfo("UTC"))
+
+RECURRENCES = ("weekly", "cycle", "monthly")
+
+def compute_post_next_run(now_utc: datetime, recurrence: str | None, weekday: int, t_local: time,
+                          prev_run_utc: datetime | None = None, cycle_weeks: int = 1,
+                          cycle_start_utc: datetime | None = None, week_in_cycle: int | None = None,
+                          tz_name: str = "Europe/Moscow") -> datetime | None:
+    """Следующий запуск повторяющегося поста после now_utc (UTC) или None для одноразового."""
+    if recurrence == "weekly":
+        return compute_next_weekday_time_tz(now_utc, weekday, t_local, tz_name)
+    if recurrence == "cycle" and cycle_start_utc is not None and week_in_cycle is not None:
+        return compute_next_run_cycle_tz(now_utc, cycle_weeks or 1, cycle_start_utc, week_in_cycle, weekday, t_local, tz_name)
+    if recurrence == "monthly":
+        nxt = compute_next_run_monthly_tz(prev_run_utc or now_utc, weekday, t_local, tz_name)
+        while nxt <= now_utc:
+            nxt = compute_next_run_monthly_tz(nxt, weekday, t_local, tz_name)
+        return nxt
+    return None
+
+def week_in_cycle_for(run_utc: datetime, cycle_weeks: int, cycle_start_utc: datetime, tz_name: str = "Europe/Moscow") -> int:
+    """Номер недели цикла (0..cycle_weeks-1), на которую приходится run_utc."""
+    tz = ZoneInfo(tz_name)
+    run_local = run_utc.astimezone(tz) if run_utc.tzinfo else run_utc.replace(tzinfo=ZoneInfo("UTC")).astimezone(tz)
+    start_local = cycle_start_utc.astimezone(tz) if cycle_start_utc.tzinfo else cycle_start_utc.replace(tzinfo=ZoneInfo("UTC")).astimezone(tz)
+    return ((run_local.date() - start_local.date()).days // 7) % max(cycle_weeks or 1, 1)
+
+# ---------- пакетный расчёт next_run ----------
+
+UTC = ZoneInfo("UTC")
+
+@lru_cache(maxsize=None)
+def _tz(tz_name: str) -> ZoneInfo:
+    return ZoneInfo(tz_name)
+
+def _to_local_naive(dt: datetime, tz: ZoneInfo) -> datetime:
+    return (dt if dt.tzinfo else dt.replace(tzinfo=UTC)).astimezone(tz).replace(tzinfo=None)
+
+def _next_weekday_local(now_local: datetime, weekday: int, t: time) -> datetime:
+    days_ahead = (weekday - now_local.weekday()) % 7
+    candidate = datetime.combine(now_local.date() + timedelta(days=days_ahead), t)
+    if candidate <= now_local:
+        candidate += timedelta(days=7)
+    return candidate
+
+def _next_cycle_local(now: datetime, cycle_weeks: int, start: datetime, week_in_cycle: int, weekday: int, t: time) -> datetime:
+    # То же, что compute_next_run_cycle, но без перебора недель: подходящая неделя цикла
+    # находится сразу, а кандидатов всего два — она и та же неделя следующего цикла.
+    if cycle_weeks <= 0:
+        cycle_weeks = 1
+    weeks_from_start = (now.date() - start.date()).days // 7
+    if 0 <= week_in_cycle < cycle_weeks:
+        first = weeks_from_start + (week_in_cycle - weeks_from_start) % cycle_weeks
+        for week_index in (first, first + cycle_weeks):
+            base = start + timedelta(weeks=week_index)
+            candidate = datetime.combine(base.date() + timedelta(days=(weekday - base.weekday()) % 7), t)
+            if candidate > now:
+                return candidate
+    base = start + timedelta(weeks=((weeks_from_start + cycle_weeks) // cycle_weeks) * cycle_weeks)
+    return datetime.combine(base.date() + timedelta(days=(weekday - base.weekday()) % 7), t)
+
+def _add_month_local(dt: datetime, weekday: int, t: time) -> datetime:
+    # add_month_preserve_weekday без relativedelta: тот же день следующего месяца
+    # (с обрезкой до его последнего дня), затем первый нужный день недели
+    carry, month0 = divmod(dt.month, 12)
+    year, month = dt.year + carry, month0 + 1
+    d = date(year, month, min(dt.day, calendar.monthrange(year, month)[1]))
+    return datetime.combine(d + timedelta(days=(weekday - d.weekday()) % 7), t)
+
+def compute_next_runs_batch(now_utc: datetime, weekdays, times, recurrences=None, cycle_weeks=None,
+                            cycle_starts=None, weeks_in_cycle=None, prev_runs=None, tz_names=None) -> list:
+    """Пакетный compute_post_next_run: параллельные массивы параметров -> список next_run в UTC.
+
+    recurrences по умолчанию — все 'weekly', tz_names — 'Europe/Moscow'. Для одноразовых
+    (recurrence None) и неполных параметров возвращается None. Объекты ZoneInfo и
+    локальное «сейчас» считаются один раз на часовой пояс, цикл — без перебора недель."""
+    n = len(weekdays)
+    if now_utc.tzinfo is None:
+        now_utc = now_utc.replace(tzinfo=UTC)
+    recurrences = recurrences if recurrences is not None else ["weekly"] * n
+    tz_names = tz_names if tz_names is not None else ["Europe/Moscow"] * n
+    now_local_by_tz: dict[str, datetime] = {}
+    out = [None] * n
+    for i in range(n):
+        rec = recurrences[i]
+        wd = weekdays[i]
+        t = times[i]
+        if not rec or wd is None or t is None:
+            continue
+        tz_name = tz_names[i] or "Europe/Moscow"
+        tz = _tz(tz_name)
+        now_local = now_local_by_tz.get(tz_name)
+        if now_local is None:
+            now_local = now_local_by_tz[tz_name] = _to_local_naive(now_utc, tz)
+        if rec == "weekly":
+            local_next = _next_weekday_local(now_local, wd, t)
+        elif rec == "cycle":
+            start = cycle_starts[i] if cycle_starts is not None else None
+            wic = weeks_in_cycle[i] if weeks_in_cycle is not None else None
+            if start is None or wic is None:
+                continue
+            cw = (cycle_weeks[i] if cycle_weeks is not None else None) or 1
+            local_next = _next_cycle_local(now_local, cw, _to_local_naive(start, tz), wic, wd, t)
+        elif rec == "monthly":
+            prev = prev_runs[i] if prev_runs is not None and prev_runs[i] is not None else now_utc
+            local_next = _add_month_local(_to_local_naive(prev, tz), wd, t)
+            while local_next <= now_local:
+                local_next = _add_month_local(local_next, wd, t)
+        else:
+            continue
+        out[i] = local_next.replace(tzinfo=tz).astimezone(UTC)
+    return out
+
@@ -0,0 +1,27 @@
+# app/webhook.py
+# Приём апдейтов Telegram через webhook (BOT_MODE=webhook): FastAPI-роут на секретном
+# пути передаёт апдейт в тот же Dispatcher, что и long-polling в app.main_bot.
+# Так бота можно масштабировать несколькими воркерами uvicorn за балансировщиком.
+import hmac
+from fastapi import APIRouter, HTTPException, Request
+from aiogram.types import Update
+from app.main_bot import bot, dp, update_queue, WEBHOOK_SECRET
+
+router = APIRouter()
+
+def _secret_ok(value: str | None) -> bool:
+    return bool(WEBHOOK_SECRET) and hmac.compare_digest((value or "").encode(), WEBHOOK_SECRET.encode())
+
+@router.post("/tg/webhook/{secret}")
+async def telegram_webhook(secret: str, request: Request):
+    if not _secret_ok(secret) or not _secret_ok(request.headers.get("X-Telegram-Bot-Api-Secret-Token")):
+        raise HTTPException(status_code=404)
+    update = Update.model_validate(await request.json(), context={"bot": bot})
+    await dp.feed_update(bot, update)
+    return {"ok": True}
+
+async def shutdown():
+    if update_queue is not None:
+        await update_queue.stop()
+    await dp.storage.close()
+    await bot.session.close()
@@ -0,0 +1,132 @@
+# app/worker.py
+# Ресурсы, живущие всё время жизни процесса Celery-воркера:
+# event loop, engine с пулом соединений к БД, Bot с keep-alive сессией к Bot API
+# и Redis-клиент для общего лимитера отправки.
+import os
+import asyncio
+import redis.asyncio as aioredis
+from aiogram import Bot
+from celery.signals import worker_process_init, worker_process_shutdown, worker_shutdown, task_postrun
+from celery.utils.log import get_task_logger
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+from dotenv import load_dotenv
+from app.ratelimit import RateLimiter
+from app.botapi import make_session
+from app import metrics, profiling
+
+load_dotenv()
+logger = get_task_logger(__name__)
+
+BOT_TOKEN = os.getenv("BOT_TOKEN")
+DATABASE_URL = os.getenv("DATABASE_URL")
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
+WORKER_DB_POOL_SIZE = int(os.getenv("WORKER_DB_POOL_SIZE", "5"))
+WORKER_DB_MAX_OVERFLOW = int(os.getenv("WORKER_DB_MAX_OVERFLOW", "5"))
+WORKER_DB_POOL_RECYCLE = int(os.getenv("WORKER_DB_POOL_RECYCLE", "1800"))  # секунды
+
+# asyncpg-соединения привязаны к loop, в котором открыты, поэтому пул
+# живёт вместе с собственным loop процесса, а не с asyncio.run на задачу.
+_loop: asyncio.AbstractEventLoop | None = None
+_engine = None
+_SessionLocal = None
+_bot: Bot | None = None
+_redis = None
+_limiter: RateLimiter | None = None
+
+def init_worker() -> None:
+    global _loop, _engine, _SessionLocal
+    if _engine is not None:
+        return
+    _loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(_loop)
+    _engine = create_async_engine(
+        DATABASE_URL,
+        future=True,
+        echo=False,
+        pool_size=WORKER_DB_POOL_SIZE,
+        max_overflow=WORKER_DB_MAX_OVERFLOW,
+        pool_recycle=WORKER_DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+    _SessionLocal = sessionmaker(_engine, expire_on_commit=False, class_=AsyncSession)
+    metrics.instrument_engine(_engine)
+    profiling.instrument_engine(_engine)
+    logger.info(
+        f"worker: db pool ready (size={WORKER_DB_POOL_SIZE}, overflow={WORKER_DB_MAX_OVERFLOW}, recycle={WORKER_DB_POOL_RECYCLE}s)"
+    )
+
+def shutdown_worker() -> None:
+    global _loop, _engine, _SessionLocal, _bot, _redis, _limiter
+    if _loop is None:
+        return
+    try:
+        if _redis is not None:
+            _loop.run_until_complete(_redis.aclose())
+    except Exception:
+        logger.exception("worker: error closing redis client")
+    try:
+        if _bot is not None:
+            _loop.run_until_complete(_bot.session.close())
+    except Exception:
+        logger.exception("worker: error closing bot session")
+    try:
+        if _engine is not None:
+            _loop.run_until_complete(_engine.dispose())
+    except Exception:
+        logger.exception("worker: error disposing db engine")
+    finally:
+        _loop.close()
+        _loop, _engine, _SessionLocal, _bot = None, None, None, None
+        _redis, _limiter = None, None
+
+def open_session() -> AsyncSession:
+    init_worker()
+    return _SessionLocal()
+
+def get_bot() -> Bot:
+    # Один Bot на процесс: aiohttp ClientSession создаётся лениво на loop воркера
+    # и держит keep-alive соединения к api.telegram.org между задачами.
+    global _bot
+    init_worker()
+    if _bot is None:
+        _bot = Bot(token=BOT_TOKEN, session=make_session())
+        _bot.session.middleware(profiling.RequestPhaseMiddleware())
+    return _bot
+
+def get_redis():
+    global _redis
+    init_worker()
+    if _redis is None:
+        _redis = aioredis.from_url(REDIS_URL)
+    return _redis
+
+def get_limiter() -> RateLimiter:
+    global _limiter
+    if _limiter is None:
+        _limiter = RateLimiter(get_redis(), BOT_TOKEN)
+    return _limiter
+
+def run(coro):
+    """Выполнить корутину задачи на loop процесса воркера."""
+    init_worker()
+    return _loop.run_until_complete(coro)
+
+@worker_process_init.connect
+def _on_worker_process_init(**kwargs):
+    init_worker()
+
+# prefork: дочерний процесс; solo/threads: сам воркер
+@worker_process_shutdown.connect
+def _on_worker_process_shutdown(**kwargs):
+    shutdown_worker()
+    metrics.process_exit()
+
+# без общего каталога multiprocess метрики процесса уходят в Pushgateway после каждой задачи
+@task_postrun.connect
+def _on_task_postrun(**kwargs):
+    metrics.push("celery")
+
+@worker_shutdown.connect
+def _on_worker_shutdown(**kwargs):
+    shutdown_worker()
@@ -0,0 +1,106 @@
+# bench/due_index.py
+# Бенчмарк due-скана: полный индекс по next_run против частичного (WHERE next_run IS NOT NULL)
+# на таблице с миллионами уже отправленных постов (next_run = NULL).
+#
+#   python bench/due_index.py --sent 5000000 --pending 2000 --out bench_due_index.json
+#
+# Работает в отдельной схеме bench_due базы DATABASE_URL и удаляет её по завершении.
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from dotenv import load_dotenv
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+load_dotenv()
+
+SCHEMA = "bench_due"
+DUE_QUERY = (
+    f"SELECT id FROM {SCHEMA}.posts WHERE next_run IS NOT NULL AND next_run <= now() "
+    "ORDER BY next_run, id LIMIT 200"
+)
+
+async def _explain(conn, runs: int) -> dict:
+    timings = []
+    plan = None
+    for _ in range(runs):
+        res = await conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {DUE_QUERY}"))
+        plan = res.scalar_one()[0]
+        timings.append(plan["Execution Time"])
+    timings.sort()
+    return {
+        "exec_ms_p50": timings[len(timings) // 2],
+        "exec_ms_min": timings[0],
+        "node": plan["Plan"].get("Node Type"),
+        "index": plan["Plan"].get("Index Name") or plan["Plan"].get("Plans", [{}])[0].get("Index Name"),
+        "shared_hit_blocks": plan["Plan"].get("Shared Hit Blocks"),
+    }
+
+async def _index_size(conn, name: str) -> int:
+    res = await conn.execute(text(f"SELECT pg_relation_size('{SCHEMA}.{name}')"))
+    return res.scalar_one()
+
+async def main(args) -> dict:
+    engine = create_async_engine(os.getenv("DATABASE_URL"), future=True)
+    result = {"sent_rows": args.sent, "pending_rows": args.pending}
+    try:
+        async with engine.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+            await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+            await conn.execute(text(
+                f"CREATE TABLE {SCHEMA}.posts (id bigserial PRIMARY KEY, channel_id int NOT NULL, "
+                "next_run timestamptz, last_status varchar(100), text text)"
+            ))
+            t0 = time.perf_counter()
+            await conn.execute(text(
+                f"INSERT INTO {SCHEMA}.posts (channel_id, next_run, last_status, text) "
+                "SELECT g % 500, NULL, 'ok', repeat('x', 200) FROM generate_series(1, :n) g"
+            ), {"n": args.sent})
+            # ожидающие: половина уже due, половина — в будущем
+            await conn.execute(text(
+                f"INSERT INTO {SCHEMA}.posts (channel_id, next_run, text) "
+                "SELECT g % 500, now() + ((g - :n / 2) * interval '1 second'), 'pending' "
+                "FROM generate_series(1, :n) g"
+            ), {"n": args.pending})
+            result["fill_s"] = round(time.perf_counter() - t0, 2)
+            await conn.execute(text(f"ANALYZE {SCHEMA}.posts"))
+
+        for name, ddl in (
+            ("full", f"CREATE INDEX ix_full ON {SCHEMA}.posts (next_run)"),
+            ("partial", f"CREATE INDEX ix_partial ON {SCHEMA}.posts (next_run) WHERE next_run IS NOT NULL"),
+        ):
+            async with engine.begin() as conn:
+                await conn.execute(text(f"DROP INDEX IF EXISTS {SCHEMA}.ix_full"))
+                await conn.execute(text(f"DROP INDEX IF EXISTS {SCHEMA}.ix_partial"))
+                t0 = time.perf_counter()
+                await conn.execute(text(ddl))
+                build_s = time.perf_counter() - t0
+                await conn.execute(text(f"ANALYZE {SCHEMA}.posts"))
+                stats = await _explain(conn, args.runs)
+                stats["build_s"] = round(build_s, 2)
+                stats["index_bytes"] = await _index_size(conn, f"ix_{name}")
+                result[name] = stats
+    finally:
+        if not args.keep:
+            async with engine.begin() as conn:
+                await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await engine.dispose()
+    return result
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="due-scan: full vs partial next_run index")
+    parser.add_argument("--sent", type=int, default=5_000_000, help="отправленных строк (next_run IS NULL)")
+    parser.add_argument("--pending", type=int, default=2_000, help="ожидающих строк")
+    parser.add_argument("--runs", type=int, default=20, help="повторов EXPLAIN ANALYZE на вариант")
+    parser.add_argument("--out", default=None, help="куда записать JSON с результатами")
+    parser.add_argument("--keep", action="store_true", help="не удалять схему bench_due")
+    args = parser.parse_args()
+    res = asyncio.run(main(args))
+    out = json.dumps(res, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(out)
+    sys.stdout.write(out + "\n")
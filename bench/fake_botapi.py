@@ -0,0 +1,180 @@
+# bench/fake_botapi.py
+# Фейковый Bot API для нагрузочных прогонов: отвечает на любой метод как Telegram,
+# с настраиваемой задержкой, случайными 429 и лимитом сообщений на чат (скользящее окно).
+# Бот и воркеры направляются на него через TELEGRAM_API_URL (см. app.botapi).
+#
+#   python bench/fake_botapi.py --port 8081 --latency-ms 80 --jitter-ms 30 --error-429 0.01
+#   TELEGRAM_API_URL=http://127.0.0.1:8081 celery -A app.celery_app.celery worker ...
+import json
+import time
+import random
+import asyncio
+import argparse
+import threading
+from collections import Counter, defaultdict, deque
+from aiohttp import web
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+
+class FakeBotAPI:
+    def __init__(self, host: str = "127.0.0.1", port: int = 8081, latency_ms: float = 50, jitter_ms: float = 20,
+                 error_429: float = 0.0, retry_after: int = 1, chat_per_min: int = 20, seed: int | None = None):
+        self.host, self.port = host, port
+        self.latency_ms, self.jitter_ms = latency_ms, jitter_ms
+        self.error_429, self.retry_after = error_429, retry_after
+        self.chat_per_min = chat_per_min
+        self.rnd = random.Random(seed)
+        self.calls = Counter()
+        self.stats = Counter()
+        self._chat_window = defaultdict(deque)
+        self._message_id = 0
+        self._loop = None
+        self._runner = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    # ---------- ответы ----------
+
+    def _next_id(self) -> int:
+        self._message_id += 1
+        return self._message_id
+
+    def _message(self, chat_id: int, text: str | None = None) -> dict:
+        chat = {"id": chat_id, "type": "private" if chat_id > 0 else "channel"}
+        msg = {"message_id": self._next_id(), "date": int(time.time()), "chat": chat}
+        if text:
+            msg["text"] = text
+        return msg
+
+    @staticmethod
+    def _cost(method: str, form) -> int:
+        """Сколько сообщений появится в чате — в этих единицах Telegram считает лимиты."""
+        if method in ("copymessages", "forwardmessages"):
+            return len(json.loads(form.get("message_ids") or "[]"))
+        if method == "sendmediagroup":
+            return len(json.loads(form.get("media") or "[]"))
+        return 1
+
+    def _limited(self, chat_id: int, cost: int) -> int | None:
+        """retry_after, если чат превысил chat_per_min сообщений за последние 60 с."""
+        if not self.chat_per_min or chat_id > 0:
+            return None
+        now = time.monotonic()
+        window = self._chat_window[chat_id]
+        while window and now - window[0] >= 60:
+            window.popleft()
+        if len(window) + cost > self.chat_per_min:
+            return max(1, int(60 - (now - window[0])) + 1) if window else self.retry_after
+        window.extend([now] * cost)
+        return None
+
+    def _result(self, method: str, form, chat_id: int):
+        if method == "getme":
+            return BOT_USER
+        if method == "copymessage":
+            return {"message_id": self._next_id()}
+        if method in ("copymessages", "forwardmessages"):
+            return [{"message_id": self._next_id()} for _ in json.loads(form.get("message_ids") or "[]")]
+        if method == "sendmediagroup":
+            return [self._message(chat_id) for _ in json.loads(form.get("media") or "[]")]
+        if method.startswith(("send", "edit", "forward")):
+            return self._message(chat_id, form.get("text"))
+        return True  # answerCallbackQuery, deleteMessage, setWebhook, ...
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        form = await request.post()
+        self.calls[method] += 1
+        delay = max(0.0, self.rnd.gauss(self.latency_ms, self.jitter_ms)) / 1000
+        if delay:
+            await asyncio.sleep(delay)
+        chat_id = int(form.get("chat_id") or 0)
+        cost = self._cost(method, form)
+        # 429 — только для методов, которые публикуют сообщения
+        sends = chat_id and method.startswith(("send", "copy", "forward"))
+        retry_after = None
+        if sends and self.error_429 and self.rnd.random() < self.error_429:
+            retry_after = self.retry_after
+            self.stats["injected_429"] += 1
+        elif sends:
+            retry_after = self._limited(chat_id, cost)
+            if retry_after:
+                self.stats["chat_limit_429"] += 1
+        if retry_after:
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {retry_after}",
+                "parameters": {"retry_after": retry_after},
+            })
+        if sends and chat_id < 0:
+            self.stats["channel_messages"] += cost
+        return web.json_response({"ok": True, "result": self._result(method, form, chat_id)})
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.snapshot())
+
+    def snapshot(self) -> dict:
+        return {"calls": dict(self.calls), **dict(self.stats)}
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        app.router.add_get("/stats", self.handle_stats)
+        return app
+
+    # ---------- запуск в отдельном потоке (для bench/delivery.py) ----------
+
+    async def _start(self):
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    def start(self) -> "FakeBotAPI":
+        """Поднять сервер на своём loop в фоновом потоке: задержки не тормозят вызывающего."""
+        self._loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def _run():
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self._start())
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=_run, name="fake-botapi", daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def stop(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop = None
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--api-host", default="127.0.0.1")
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--latency-ms", type=float, default=50, help="средняя задержка ответа")
+    parser.add_argument("--jitter-ms", type=float, default=20, help="стандартное отклонение задержки")
+    parser.add_argument("--error-429", type=float, default=0.0, help="доля отправок со случайным 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after случайных 429, секунды")
+    parser.add_argument("--chat-per-min", type=int, default=20, help="лимит сообщений в канал за минуту (0 — без лимита)")
+
+def from_args(args) -> FakeBotAPI:
+    return FakeBotAPI(
+        host=args.api_host, port=args.api_port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        error_429=args.error_429, retry_after=args.retry_after, chat_per_min=args.chat_per_min,
+        seed=getattr(args, "seed", None),
+    )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="fake Telegram Bot API server for load tests")
+    add_arguments(parser)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    web.run_app(from_args(args).app(), host=args.api_host, port=args.api_port)
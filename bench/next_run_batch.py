@@ -0,0 +1,95 @@
+# bench/next_run_batch.py
+# Пакетный compute_next_runs_batch против поштучных функций app.utils:
+# сверяет результаты на случайных расписаниях (property-проверка) и меряет время.
+#
+#   python bench/next_run_batch.py --n 100000 --seed 1 --out bench_next_run.json
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from datetime import datetime, time as dtime, timedelta
+from zoneinfo import ZoneInfo
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.utils import (  # noqa: E402
+    compute_next_runs_batch, compute_next_weekday_time_tz, compute_next_run_cycle_tz, compute_post_next_run,
+)
+
+TZS = ["Europe/Moscow", "UTC", "Asia/Yekaterinburg", "Europe/Berlin", "America/New_York"]
+
+def random_schedules(rnd: random.Random, n: int, now: datetime):
+    rows = []
+    for _ in range(n):
+        rec = rnd.choice(["weekly", "cycle", "monthly", None])
+        cw = rnd.randint(1, 6)
+        rows.append({
+            "recurrence": rec,
+            "weekday": rnd.randrange(7),
+            "time": dtime(rnd.randrange(24), rnd.randrange(60)),
+            "cycle_weeks": cw,
+            "cycle_start": now - timedelta(minutes=rnd.randrange(0, 60 * 24 * 400)),
+            "week_in_cycle": rnd.randrange(cw),
+            "prev_run": now - timedelta(minutes=rnd.randrange(0, 60 * 24 * 90)),
+            "tz": rnd.choice(TZS),
+        })
+    return rows
+
+def scalar(now: datetime, r: dict):
+    if r["recurrence"] == "weekly":
+        return compute_next_weekday_time_tz(now, r["weekday"], r["time"], r["tz"])
+    if r["recurrence"] == "cycle":
+        return compute_next_run_cycle_tz(now, r["cycle_weeks"], r["cycle_start"], r["week_in_cycle"], r["weekday"], r["time"], r["tz"])
+    return compute_post_next_run(now, r["recurrence"], r["weekday"], r["time"], prev_run_utc=r["prev_run"], tz_name=r["tz"])
+
+def main(args) -> dict:
+    rnd = random.Random(args.seed)
+    now = datetime(2026, 1, 1, tzinfo=ZoneInfo("UTC")) + timedelta(minutes=rnd.randrange(0, 60 * 24 * 365))
+    rows = random_schedules(rnd, args.n, now)
+
+    t0 = time.perf_counter()
+    expected = [scalar(now, r) for r in rows]
+    scalar_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    got = compute_next_runs_batch(
+        now,
+        [r["weekday"] for r in rows],
+        [r["time"] for r in rows],
+        recurrences=[r["recurrence"] for r in rows],
+        cycle_weeks=[r["cycle_weeks"] for r in rows],
+        cycle_starts=[r["cycle_start"] for r in rows],
+        weeks_in_cycle=[r["week_in_cycle"] for r in rows],
+        prev_runs=[r["prev_run"] for r in rows],
+        tz_names=[r["tz"] for r in rows],
+    )
+    batch_s = time.perf_counter() - t0
+
+    mismatches = [
+        {"row": {k: str(v) for k, v in rows[i].items()}, "scalar": str(expected[i]), "batch": str(got[i])}
+        for i in range(len(rows)) if expected[i] != got[i]
+    ]
+    return {
+        "n": args.n,
+        "seed": args.seed,
+        "now": now.isoformat(),
+        "scalar_ms": round(scalar_s * 1000, 1),
+        "batch_ms": round(batch_s * 1000, 1),
+        "mismatches": len(mismatches),
+        "examples": mismatches[:5],
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="compute_next_runs_batch vs scalar app.utils functions")
+    parser.add_argument("--n", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default=None)
+    args = parser.parse_args()
+    res = main(args)
+    out = json.dumps(res, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(out)
+    sys.stdout.write(out + "\n")
+    sys.exit(1 if res["mismatches"] else 0)
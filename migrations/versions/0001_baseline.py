@@ -0,0 +1,85 @@
+"""baseline: схема, которую раньше создавал init_db
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+
+Идемпотентна: на существующей БД (созданной create_all) таблицы не трогает,
+а лишь добавляет колонки, которые init_db раньше дописывал через ALTER TABLE.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import JSONB
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    insp = sa.inspect(op.get_bind())
+    if not insp.has_table("users"):
+        op.create_table(
+            "users",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("telegram_id", sa.BigInteger(), nullable=False),
+            sa.Column("name", sa.String(200)),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+        op.create_index("ix_users_telegram_id", "users", ["telegram_id"], unique=True)
+    if not insp.has_table("channels"):
+        op.create_table(
+            "channels",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("chat_id", sa.BigInteger(), nullable=False),
+            sa.Column("username", sa.String(255)),
+            sa.Column("title", sa.String(255)),
+            sa.Column("owner_id", sa.BigInteger(), sa.ForeignKey("users.telegram_id"), nullable=False),
+            sa.Column("cycle_weeks", sa.Integer(), nullable=False, server_default="1"),
+            sa.Column("cycle_start", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        )
+        op.create_index("ix_channels_chat_id", "channels", ["chat_id"], unique=True)
+    if not insp.has_table("channel_admins"):
+        op.create_table(
+            "channel_admins",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("channel_id", sa.Integer(), sa.ForeignKey("channels.id", ondelete="CASCADE"), nullable=False),
+            sa.Column("telegram_id", sa.BigInteger(), nullable=False),
+        )
+        op.create_index("ix_channel_admins_telegram_id", "channel_admins", ["telegram_id"])
+    if not insp.has_table("posts"):
+        op.create_table(
+            "posts",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("channel_id", sa.Integer(), sa.ForeignKey("channels.id", ondelete="CASCADE"), nullable=False),
+            sa.Column("text", sa.Text()),
+            sa.Column("media_type", sa.String(50)),
+            sa.Column("media_file_id", sa.String(400)),
+            sa.Column("button_text", sa.String(255)),
+            sa.Column("button_url", sa.String(1000)),
+            sa.Column("buttons", JSONB(), nullable=True),
+            sa.Column("media_group", JSONB(), nullable=True),
+            sa.Column("next_run", sa.DateTime(timezone=True)),
+            sa.Column("repeat_type", sa.String(50)),
+            sa.Column("repeat_val", sa.Integer(), nullable=True),
+            sa.Column("weekday", sa.Integer(), nullable=True),
+            sa.Column("time_text", sa.String(5), nullable=True),
+            sa.Column("week_in_cycle", sa.Integer(), nullable=True),
+            sa.Column("parse_mode", sa.String(20), nullable=True),
+            sa.Column("text_entities", JSONB(), nullable=True),
+            sa.Column("created_by", sa.BigInteger(), nullable=False),
+            sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+            sa.Column("last_status", sa.String(100), nullable=True),
+        )
+        op.create_index("ix_posts_next_run", "posts", ["next_run"])
+    op.execute("ALTER TABLE posts ADD COLUMN IF NOT EXISTS src_chat_id BIGINT")
+    op.execute("ALTER TABLE posts ADD COLUMN IF NOT EXISTS src_message_id BIGINT")
+    op.execute("ALTER TABLE posts ADD COLUMN IF NOT EXISTS src_message_ids JSONB")
+
+
+def downgrade() -> None:
+    op.drop_table("posts")
+    op.drop_table("channel_admins")
+    op.drop_table("channels")
+    op.drop_table("users")
@@ -0,0 +1,30 @@
+"""posts: частичный индекс по next_run только для ожидающих постов
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+
+Индекс строится CONCURRENTLY вне транзакции, чтобы не блокировать
+захват постов воркерами во время выкладки.
+"""
+from alembic import op
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_posts_next_run_pending "
+            "ON posts (next_run) WHERE next_run IS NOT NULL"
+        )
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_posts_next_run")
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_posts_next_run ON posts (next_run)")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_posts_next_run_pending")
@@ -0,0 +1,22 @@
+"""posts.recurrence: повторяющиеся посты
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # nullable без default — в PostgreSQL это только изменение каталога, без перезаписи таблицы
+    op.add_column("posts", sa.Column("recurrence", sa.String(20), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("posts", "recurrence")
@@ -0,0 +1,30 @@
+"""channels/channel_admins: индексы для постраничного списка каналов пользователя
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+
+Список «мои каналы» — UNION каналов владельца и каналов, где пользователь админ,
+с keyset-пагинацией по id канала; оба плеча читаются по индексу в порядке id.
+"""
+from alembic import op
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_channels_owner_id_id ON channels (owner_id, id)")
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_channel_admins_telegram_id_channel_id "
+            "ON channel_admins (telegram_id, channel_id)"
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_channel_admins_telegram_id_channel_id")
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_channels_owner_id_id")
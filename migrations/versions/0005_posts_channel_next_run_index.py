@@ -0,0 +1,28 @@
+"""posts: составной индекс (channel_id, next_run, id) для списка постов канала
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+
+Список запланированных постов канала листается keyset-курсором по (next_run, id);
+индекс отдаёт страницу без сортировки и без чтения всех постов канала.
+"""
+from alembic import op
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_posts_channel_id_next_run_id "
+            "ON posts (channel_id, next_run, id)"
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_posts_channel_id_next_run_id")
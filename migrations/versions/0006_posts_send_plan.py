@@ -0,0 +1,24 @@
+"""posts.send_plan: заранее собранный план отправки
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17
+
+Существующие посты остаются с NULL: воркер собирает для них план при отправке.
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import JSONB
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("posts", sa.Column("send_plan", JSONB, nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("posts", "send_plan")
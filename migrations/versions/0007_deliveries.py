@@ -0,0 +1,98 @@
+"""deliveries: журнал попыток отправки; posts.failed и posts.attempts
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17
+
+deliveries секционирована по месяцам started_at; секции наперёд создаёт и по
+retention удаляет задача maintain_delivery_partitions, здесь — только ближайшие.
+posts.failed заменяет разбор last_status через LIKE 'error%'. Заполняется после
+фиксации ADD COLUMN, диапазонами id по BACKFILL_BATCH строк, каждый — своей транзакцией:
+блокировки строк короткие, ACCESS EXCLUSIVE на posts не держится на время скана.
+"""
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from alembic import context, op
+import sqlalchemy as sa
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+PARTITIONS_AHEAD = 2
+BACKFILL_BATCH = 10_000
+
+
+def _months(n: int):
+    now = datetime.now(ZoneInfo("UTC"))
+    y, m = now.year, now.month
+    for _ in range(n + 1):
+        start = datetime(y, m, 1, tzinfo=ZoneInfo("UTC"))
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+        yield start, datetime(y, m, 1, tzinfo=ZoneInfo("UTC"))
+
+
+def _backfill_failed() -> None:
+    backfill = (
+        "UPDATE posts SET failed = true "
+        "WHERE id > :lo AND id <= :hi AND last_status LIKE 'error%' AND NOT failed"
+    )
+    if context.is_offline_mode():
+        op.execute(sa.text(backfill).bindparams(lo=0, hi=2**31 - 1))
+        return
+    bind = op.get_bind()
+    lo, hi = bind.execute(sa.text("SELECT min(id), max(id) FROM posts")).one()
+    if lo is None:
+        return
+    for start in range(lo - 1, hi, BACKFILL_BATCH):
+        bind.execute(sa.text(backfill), {"lo": start, "hi": start + BACKFILL_BATCH})
+
+
+def upgrade() -> None:
+    # NOT NULL с константным default — в PostgreSQL 11+ без перезаписи таблицы
+    op.add_column("posts", sa.Column("failed", sa.Boolean(), nullable=False, server_default=sa.false()))
+    op.add_column("posts", sa.Column("attempts", sa.SmallInteger(), nullable=False, server_default="0"))
+
+    op.execute(
+        "CREATE TABLE IF NOT EXISTS deliveries ("
+        "id bigserial NOT NULL, "
+        "started_at timestamptz NOT NULL, "
+        "finished_at timestamptz NOT NULL, "
+        "post_id integer NOT NULL, "
+        "channel_id integer NOT NULL, "
+        "attempt smallint NOT NULL, "
+        "due_at timestamptz, "
+        "latency_ms integer NOT NULL, "
+        "outcome varchar(20) NOT NULL, "
+        "message_ids jsonb, "
+        "error_code smallint, "
+        "error_class varchar(100), "
+        "error_message text, "
+        "PRIMARY KEY (id, started_at)"
+        ") PARTITION BY RANGE (started_at)"
+    )
+    op.execute("CREATE INDEX IF NOT EXISTS ix_deliveries_post_id_started_at ON deliveries (post_id, started_at)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_deliveries_channel_id_started_at ON deliveries (channel_id, started_at)")
+    for start, end in _months(PARTITIONS_AHEAD):
+        op.execute(
+            f"CREATE TABLE IF NOT EXISTS deliveries_y{start.year:04d}m{start.month:02d} PARTITION OF deliveries "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        )
+
+    # autocommit_block сначала фиксирует ADD COLUMN и таблицу deliveries; дальше каждая
+    # пачка backfill и CREATE INDEX CONCURRENTLY — отдельными транзакциями
+    with op.get_context().autocommit_block():
+        _backfill_failed()
+        op.execute(
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_posts_failed_channel_id_id "
+            "ON posts (channel_id, id) WHERE failed"
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.execute("DROP INDEX CONCURRENTLY IF EXISTS ix_posts_failed_channel_id_id")
+    op.execute("DROP TABLE IF EXISTS deliveries")  # вместе со всеми секциями
+    op.drop_column("posts", "attempts")
+    op.drop_column("posts", "failed")
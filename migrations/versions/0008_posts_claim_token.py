@@ -0,0 +1,25 @@
+"""posts.claim_token: метка захвата поста воркером
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-17
+
+Каждый захват записывает новый claim_token; задача отправки сверяет его перед
+отправкой и при записи итога, поэтому после истечения аренды пост не уйдёт дважды.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # nullable без default — только запись в каталоге, таблица не перезаписывается
+    op.add_column("posts", sa.Column("claim_token", sa.BigInteger(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("posts", "claim_token")